@@ -0,0 +1,524 @@
+"""End-to-end benchmarks of the ingestion pipeline on synthetic
+`event_stream.csv` files, covering initial loads, idempotent reloads and
+daily deltas against a dedicated Postgres database.
+
+Each ingestion run executes in a fresh process, recording its wall time,
+rows per second, per-stage timings and peak RSS to a results file.
+
+Usage:
+    BENCHMARK_CONN_STRING=postgresql+psycopg2://... \
+        python -m benchmarks.ingest --users 100000 --months 3 --deltas 3
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, inspect, text
+
+from benchmarks.metrics import get_commit
+from benchmarks.synthetic import RAW_COLUMNS, generate_events, write_event_stream
+from src.config.columns import EVENT_TIME
+from src.config.filepaths import BENCHMARKS_DIR, INGEST_BENCHMARK_FP
+
+load_dotenv()
+
+LOAD_METHODS = ('insert', 'copy')
+DEDUP_METHODS = ('client', 'server')
+
+# tables created by the ingestion pipeline, dropped between benchmark configurations
+PIPELINE_TABLES = (
+    'fct_events',
+    'dim_users',
+    'stg_fct_events',
+    'stg_dim_users',
+    'data_version',
+    'ingest_state',
+    'agg_daily_user_activity',
+    'agg_lifecycle_counts',
+    'agg_retention_counts'
+)
+
+def reset_database(
+        conn_string
+):
+    """Drops all ingestion pipeline tables (including `fct_events`
+    partitions) from the benchmark database.
+
+    Parameters
+    ----------
+    conn_string : str
+        sqlalchemy connection string of the benchmark database.
+
+    Returns
+    -------
+    None
+    """
+
+    engine = create_engine(conn_string)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {', '.join(PIPELINE_TABLES)} CASCADE;"))
+    engine.dispose()
+
+def count_events(
+        conn_string
+):
+    """Counts rows in `fct_events`, or 0 if it does not exist."""
+
+    engine = create_engine(conn_string)
+    with engine.connect() as conn:
+        n_events = conn.execute(text('SELECT COUNT(*) FROM fct_events')).scalar() \
+            if inspect(conn).has_table('fct_events') else 0
+    engine.dispose()
+
+    return n_events
+
+def get_peak_rss():
+    """Gets the peak resident set size of the current process in MiB."""
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # reported in bytes on macOS and kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak_rss / 2**20
+
+    return peak_rss / 2**10
+
+def run_ingest(
+        conn_string,
+        csv_filepath,
+        ingest_kwargs
+):
+    """Runs the ingestion pipeline against the benchmark database. Meant
+    to be run in a fresh process, so that peak RSS covers a single run.
+
+    Parameters
+    ----------
+    conn_string : str
+        sqlalchemy connection string of the benchmark database.
+    csv_filepath : str
+        Path to the raw .csv file to ingest.
+    ingest_kwargs : dict
+        Keyword arguments for `src.data.ingest.main`.
+
+    Returns
+    -------
+    run : dict
+        Wall time, per-stage timings, peak RSS and `fct_events` row
+        counts before and after the run.
+    """
+
+    os.environ['CONN_STRING'] = conn_string
+
+    # imported after setting the connection string
+    from src.data.ingest import main
+    from src.data.timing import STAGE_TIMINGS
+
+    events_before = count_events(conn_string)
+    start_time = time.perf_counter()
+    main(
+        csv_filepath = csv_filepath,
+        warmup = False,
+        **ingest_kwargs
+    )
+    wall_time = time.perf_counter() - start_time
+
+    run = {
+        'wall_time_s': round(wall_time, 6),
+        'stages_s': {name: round(seconds, 6) for name, seconds in STAGE_TIMINGS.as_dict().items()},
+        'peak_rss_mib': round(get_peak_rss(), 3),
+        'events_before': events_before,
+        'events_after': count_events(conn_string)
+    }
+
+    return run
+
+def run_in_process(
+        conn_string,
+        csv_filepath,
+        ingest_kwargs
+):
+    """Runs `run_ingest` in a new spawned process and returns its result."""
+
+    with ProcessPoolExecutor(
+        max_workers = 1,
+        mp_context = multiprocessing.get_context('spawn')
+    ) as executor:
+        return executor.submit(run_ingest, conn_string, csv_filepath, ingest_kwargs).result()
+
+def generate_event_stream(
+        directory,
+        n_users,
+        start_date,
+        n_months,
+        n_deltas,
+        seed = 0
+):
+    """Generates a synthetic `event_stream.csv` spanning a number of
+    months, and the daily deltas which follow it.
+
+    Parameters
+    ----------
+    directory : str
+        Output directory.
+    n_users : int
+        Number of users.
+    start_date : str
+        First day of events, formatted as YYYY-MM-DD.
+    n_months : int
+        Number of months spanned by the initial file.
+    n_deltas : int
+        Number of daily deltas after the initial file.
+    seed : int
+        Random seed. Default is 0.
+
+    Returns
+    -------
+    csv_filepath : str
+        Path to the initial event stream file.
+    n_events : int
+        Number of events in the initial file.
+    deltas : list
+        DataFrames of events of each daily delta.
+    """
+
+    start_date = pd.Timestamp(start_date)
+    n_days = (start_date + pd.DateOffset(months = n_months) - start_date).days
+
+    events = generate_events(
+        n_users = n_users,
+        n_days = n_days + n_deltas,
+        start_date = start_date.strftime('%Y-%m-%d'),
+        seed = seed
+    )
+    event_days = ((events[EVENT_TIME] - start_date) // pd.Timedelta(days = 1)).to_numpy()
+
+    csv_filepath = os.path.join(directory, 'event_stream.csv')
+    write_event_stream(
+        events = events[event_days < n_days],
+        filepath = csv_filepath
+    )
+    deltas = [
+        events[event_days == day][RAW_COLUMNS]
+        for day in range(n_days, n_days + n_deltas)
+    ]
+
+    return csv_filepath, int(np.sum(event_days < n_days)), deltas
+
+def run_benchmarks(
+        conn_string,
+        n_users,
+        start_date,
+        n_months,
+        n_deltas,
+        n_reloads,
+        load_methods = LOAD_METHODS,
+        dedup_methods = DEDUP_METHODS,
+        chunksize = None,
+        workers = 1,
+        seed = 0
+):
+    """Runs ingestion benchmarks for each load and dedup method: an
+    initial load into an empty database, idempotent reloads of the same
+    file and incremental loads of daily deltas appended to it.
+
+    Parameters
+    ----------
+    conn_string : str
+        sqlalchemy connection string of the benchmark database, whose
+        pipeline tables are dropped before each configuration.
+    n_users : int
+        Number of users.
+    start_date : str
+        First day of events, formatted as YYYY-MM-DD.
+    n_months : int
+        Number of months spanned by the initial file.
+    n_deltas : int
+        Number of daily deltas.
+    n_reloads : int
+        Number of idempotent reloads.
+    load_methods : list
+        Load methods to benchmark. Default is all.
+    dedup_methods : list
+        Dedup methods to benchmark. Default is all.
+    chunksize : int
+        If specified, files are streamed in chunks of this many rows,
+        which is only supported by the 'server' dedup method.
+        Default is None.
+    workers : int
+        Number of monthly partitions to load concurrently, which is only
+        supported by the 'client' dedup method without chunking (other
+        configurations load with one worker). Default is 1.
+    seed : int
+        Random seed of the event generator. Default is 0.
+
+    Yields
+    ------
+    result : dict
+        Benchmark result of a single ingestion run.
+    """
+
+    for load_method in load_methods:
+        for dedup_method in dedup_methods:
+
+            if chunksize is not None and dedup_method != 'server':
+                continue
+
+            # partitions are only loaded concurrently with client dedup
+            ingest_kwargs = {
+                'load_method': load_method,
+                'dedup_method': dedup_method,
+                'chunksize': chunksize,
+                'workers': workers if dedup_method == 'client' and chunksize is None else 1
+            }
+            config = {
+                **ingest_kwargs,
+                'n_users': n_users,
+                'n_months': n_months,
+                'seed': seed
+            }
+
+            reset_database(conn_string)
+
+            os.makedirs(BENCHMARKS_DIR, exist_ok = True)
+            with tempfile.TemporaryDirectory(dir = BENCHMARKS_DIR) as directory:
+
+                csv_filepath, n_events, deltas = generate_event_stream(
+                    directory = directory,
+                    n_users = n_users,
+                    start_date = start_date,
+                    n_months = n_months,
+                    n_deltas = n_deltas,
+                    seed = seed
+                )
+
+                # an incremental run without a watermark loads the whole file
+                scenarios = [('initial', True, None)] \
+                    + [('reload', False, None)] * n_reloads \
+                    + [('delta', True, delta) for delta in deltas]
+
+                for scenario, incremental, delta in scenarios:
+
+                    if delta is None:
+                        n_rows = n_events
+                    else:
+                        delta.to_csv(
+                            csv_filepath,
+                            mode = 'a',
+                            header = False,
+                            index = False,
+                            date_format = '%Y-%m-%d %H:%M:%S.%f'
+                        )
+                        n_rows = delta.shape[0]
+
+                    run = run_in_process(
+                        conn_string = conn_string,
+                        csv_filepath = csv_filepath,
+                        ingest_kwargs = {**ingest_kwargs, 'incremental': incremental}
+                    )
+
+                    yield {
+                        'scenario': scenario,
+                        **config,
+                        'rows': n_rows,
+                        'new_events': run['events_after'] - run['events_before'],
+                        'rows_per_s': round(n_rows / run['wall_time_s'], 1),
+                        **run
+                    }
+
+def parse_args():
+    """Parses ingestion benchmark command line arguments."""
+
+    parser = argparse.ArgumentParser(description = 'Benchmark the ingestion pipeline on synthetic events.')
+    parser.add_argument(
+        '--conn-string',
+        default = os.getenv('BENCHMARK_CONN_STRING'),
+        help = 'Connection string of a dedicated benchmark database, whose pipeline tables are dropped. '
+               'Default is the `BENCHMARK_CONN_STRING` environment variable.'
+    )
+    parser.add_argument(
+        '--users',
+        type = int,
+        default = 100_000,
+        help = 'Number of users. Default is 100000.'
+    )
+    parser.add_argument(
+        '--start-date',
+        default = '2025-01-01',
+        help = 'First day of events, formatted as YYYY-MM-DD. Default is 2025-01-01.'
+    )
+    parser.add_argument(
+        '--months',
+        type = int,
+        default = 3,
+        help = 'Number of months spanned by the initial file. Default is 3.'
+    )
+    parser.add_argument(
+        '--deltas',
+        type = int,
+        default = 3,
+        help = 'Number of daily deltas appended and loaded incrementally. Default is 3.'
+    )
+    parser.add_argument(
+        '--reloads',
+        type = int,
+        default = 1,
+        help = 'Number of idempotent reloads of the initial file. Default is 1.'
+    )
+    parser.add_argument(
+        '--load-methods',
+        nargs = '+',
+        choices = LOAD_METHODS,
+        default = list(LOAD_METHODS),
+        help = 'Load methods to benchmark. Default is all.'
+    )
+    parser.add_argument(
+        '--dedup-methods',
+        nargs = '+',
+        choices = DEDUP_METHODS,
+        default = list(DEDUP_METHODS),
+        help = 'Dedup methods to benchmark. Default is all.'
+    )
+    parser.add_argument(
+        '--chunksize',
+        type = int,
+        default = None,
+        help = 'Stream files in chunks of this many rows (server dedup method only).'
+    )
+    parser.add_argument(
+        '--workers',
+        type = int,
+        default = 1,
+        help = 'Number of monthly partitions to load concurrently (client dedup method only). Default is 1.'
+    )
+    parser.add_argument(
+        '--seed',
+        type = int,
+        default = 0,
+        help = 'Random seed of the synthetic event generator. Default is 0.'
+    )
+    parser.add_argument(
+        '--output',
+        default = INGEST_BENCHMARK_FP,
+        help = 'Results file to append to, as JSON lines. Default is data/benchmarks/ingest.jsonl.'
+    )
+
+    return parser.parse_args()
+
+def main(
+        conn_string,
+        n_users,
+        start_date,
+        n_months,
+        n_deltas,
+        n_reloads,
+        load_methods,
+        dedup_methods,
+        chunksize,
+        workers,
+        seed,
+        output
+):
+    """Runs ingestion benchmarks and appends their results, tagged with
+    the current commit and run time, to a JSON lines file.
+
+    Parameters
+    ----------
+    conn_string : str
+        sqlalchemy connection string of the benchmark database.
+    n_users : int
+        Number of users.
+    start_date : str
+        First day of events, formatted as YYYY-MM-DD.
+    n_months : int
+        Number of months spanned by the initial file.
+    n_deltas : int
+        Number of daily deltas.
+    n_reloads : int
+        Number of idempotent reloads.
+    load_methods : list
+        Load methods to benchmark.
+    dedup_methods : list
+        Dedup methods to benchmark.
+    chunksize : int
+        Chunk size for streamed loads, or None.
+    workers : int
+        Number of monthly partitions to load concurrently.
+    seed : int
+        Random seed of the event generator.
+    output : str
+        Results filepath.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        Results of this run.
+    """
+
+    if not conn_string:
+        raise ValueError('A benchmark database connection string is required - set `BENCHMARK_CONN_STRING`.')
+
+    run = {
+        'commit': get_commit(),
+        'run_time': datetime.datetime.now().isoformat(timespec = 'seconds')
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok = True)
+    results = []
+    with open(output, 'a') as f:
+        for result in run_benchmarks(
+            conn_string = conn_string,
+            n_users = n_users,
+            start_date = start_date,
+            n_months = n_months,
+            n_deltas = n_deltas,
+            n_reloads = n_reloads,
+            load_methods = load_methods,
+            dedup_methods = dedup_methods,
+            chunksize = chunksize,
+            workers = workers,
+            seed = seed
+        ):
+            result = {**run, **result}
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            results.append(result)
+            stages = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in result['stages_s'].items())
+            print(
+                f"{result['scenario']:<8} {result['load_method']:<6} {result['dedup_method']:<6} "
+                f"rows={result['rows']:<10} new={result['new_events']:<10} {result['wall_time_s']:>8.2f}s "
+                f"{result['rows_per_s']:>12.1f} rows/s {result['peak_rss_mib']:>8.1f}MiB RSS ({stages})"
+            )
+
+    return pd.DataFrame(results)
+
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    main(
+        conn_string = args.conn_string,
+        n_users = args.users,
+        start_date = args.start_date,
+        n_months = args.months,
+        n_deltas = args.deltas,
+        n_reloads = args.reloads,
+        load_methods = args.load_methods,
+        dedup_methods = args.dedup_methods,
+        chunksize = args.chunksize,
+        workers = args.workers,
+        seed = args.seed,
+        output = args.output
+    )
@@ -0,0 +1,375 @@
+"""Benchmarks of the metric functions on synthetic events, recording wall
+time and peak memory to a results file which can be compared across
+commits.
+
+Usage:
+    python -m benchmarks.metrics --users 10000 100000 1000000 --days 90 365
+    python -m benchmarks.metrics --compare
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.synthetic import add_signup_times, generate_events
+from src.config.filepaths import METRICS_BENCHMARK_FP, REPO_DIR
+from src.metrics.engagement import calculate_quick_ratio, calculate_user_lifecycle_metrics
+from src.metrics.frame import EventFrame
+from src.metrics.retention import calculate_retention
+
+FREQUENCIES = ('D', 'W', 'M')
+RETENTION_TYPES = ('all_activity', 'new_activity', 'signup')
+LIFECYCLE_METHODS = ('sort', 'bitmap')
+
+# overlap implementations of all activity retention
+RETENTION_METHODS = ('matmul', 'bitmap')
+
+def get_commit():
+    """Gets the short hash of the checked out commit, suffixed with
+    `-dirty` if there are uncommitted changes, or None outside a git
+    repository."""
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd = REPO_DIR, capture_output = True, text = True, check = True
+        ).stdout.strip()
+        status = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd = REPO_DIR, capture_output = True, text = True, check = True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return f'{commit}-dirty' if status else commit
+
+def measure(
+        func,
+        repeat = 3
+):
+    """Measures the wall time and peak memory of a function call.
+
+    Calls are timed with tracing off, as `tracemalloc` slows down every
+    allocation. Peak memory is traced with `tracemalloc` in one further
+    call, which covers numpy and pandas buffers as well as Python objects.
+
+    Parameters
+    ----------
+    func : callable
+        Function to call without arguments.
+    repeat : int
+        Number of timed calls. Default is 3.
+
+    Returns
+    -------
+    wall_time : float
+        Fastest wall time in seconds.
+    peak_memory : float
+        Peak traced memory in MiB, above memory in use before the call.
+    result : object
+        Return value of the last timed call.
+    """
+
+    wall_times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        wall_times.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    peak_memory = (peak - baseline) / 2**20
+
+    return min(wall_times), peak_memory, result
+
+def run_benchmarks(
+        users_grid,
+        days_grid,
+        freqs = FREQUENCIES,
+        retention_types = RETENTION_TYPES,
+        repeat = 3,
+        seed = 0
+):
+    """Runs metric benchmarks over a grid of synthetic datasets.
+
+    Parameters
+    ----------
+    users_grid : list
+        Numbers of users to generate events for.
+    days_grid : list
+        Numbers of days to generate events over.
+    freqs : list
+        Metric frequencies. Default is all frequencies.
+    retention_types : list
+        Retention types. Default is all retention types.
+    repeat : int
+        Number of calls per benchmark. Default is 3.
+    seed : int
+        Random seed of the event generator. Default is 0.
+
+    Yields
+    ------
+    result : dict
+        Benchmark result, with the benchmarked function and its
+        parameters, dataset size, wall time and peak memory.
+    """
+
+    for n_users in users_grid:
+        for n_days in days_grid:
+
+            # metrics are computed from an EventFrame, as in the dashboard
+            events = add_signup_times(
+                generate_events(
+                    n_users = n_users,
+                    n_days = n_days,
+                    seed = seed
+                )
+            )
+            frame = EventFrame.from_dataframe(events)
+            del events
+
+            dataset = {
+                'n_users': n_users,
+                'n_days': n_days,
+                'n_events': len(frame),
+                'seed': seed
+            }
+
+            for freq in freqs:
+
+                cases = [
+                    (
+                        'calculate_user_lifecycle_metrics',
+                        {'method': method},
+                        lambda method = method: calculate_user_lifecycle_metrics(frame, freq, method = method)
+                    )
+                    for method in LIFECYCLE_METHODS
+                ]
+                for retention_type in retention_types:
+                    methods = RETENTION_METHODS if retention_type == 'all_activity' else RETENTION_METHODS[:1]
+                    cases += [
+                        (
+                            'calculate_retention',
+                            {'retention_type': retention_type, 'method': method},
+                            lambda retention_type = retention_type, method = method: calculate_retention(
+                                frame, freq, retention_type, method = method
+                            )
+                        )
+                        for method in methods
+                    ]
+
+                for function, params, func in cases:
+                    wall_time, peak_memory, result = measure(func, repeat = repeat)
+                    yield {
+                        'function': function,
+                        'freq': freq,
+                        **params,
+                        **dataset,
+                        'wall_time_s': round(wall_time, 6),
+                        'peak_memory_mib': round(peak_memory, 3)
+                    }
+
+                    # quick ratio is computed from lifecycle metrics
+                    if function == 'calculate_user_lifecycle_metrics' and params['method'] == LIFECYCLE_METHODS[0]:
+                        wall_time, peak_memory, _ = measure(
+                            lambda: calculate_quick_ratio(df = result.copy()),
+                            repeat = repeat
+                        )
+                        yield {
+                            'function': 'calculate_quick_ratio',
+                            'freq': freq,
+                            **dataset,
+                            'wall_time_s': round(wall_time, 6),
+                            'peak_memory_mib': round(peak_memory, 3)
+                        }
+
+def compare_results(
+        filepath = METRICS_BENCHMARK_FP,
+        value = 'wall_time_s'
+):
+    """Tabulates recorded benchmark results by commit, using the latest
+    run of each commit.
+
+    Parameters
+    ----------
+    filepath : str
+        Results filepath. Default is `METRICS_BENCHMARK_FP`.
+    value : str
+        Result to compare. Valid options are 'wall_time_s' and
+        'peak_memory_mib'. Default is 'wall_time_s'.
+
+    Returns
+    -------
+    comparison : pd.DataFrame
+        Results indexed by benchmark, with one column per commit in run
+        order.
+    """
+
+    results = pd.read_json(filepath, lines = True)
+    for column in ('retention_type', 'method'):
+        if column not in results.columns:
+            results[column] = None
+    results[['retention_type', 'method']] = results[['retention_type', 'method']].fillna('')
+    results['commit'] = results['commit'].fillna('unknown')
+
+    # keep the latest run of each commit
+    latest_runs = results.groupby('commit')['run_time'].transform('max')
+    results = results[results['run_time'] == latest_runs]
+
+    comparison = results.pivot_table(
+        index = ['function', 'freq', 'retention_type', 'method', 'n_users', 'n_days'],
+        columns = 'commit',
+        values = value
+    )[results.sort_values('run_time')['commit'].unique()]
+
+    return comparison
+
+def parse_args():
+    """Parses metric benchmark command line arguments."""
+
+    parser = argparse.ArgumentParser(description = 'Benchmark metric functions on synthetic events.')
+    parser.add_argument(
+        '--users',
+        type = int,
+        nargs = '+',
+        default = [10_000, 100_000, 1_000_000],
+        help = 'Numbers of users to benchmark. Default is 10000 100000 1000000.'
+    )
+    parser.add_argument(
+        '--days',
+        type = int,
+        nargs = '+',
+        default = [90, 365],
+        help = 'Numbers of days of events to benchmark. Default is 90 365.'
+    )
+    parser.add_argument(
+        '--freqs',
+        nargs = '+',
+        choices = FREQUENCIES,
+        default = list(FREQUENCIES),
+        help = 'Metric frequencies to benchmark. Default is all.'
+    )
+    parser.add_argument(
+        '--retention-types',
+        nargs = '+',
+        choices = RETENTION_TYPES,
+        default = list(RETENTION_TYPES),
+        help = 'Retention types to benchmark. Default is all.'
+    )
+    parser.add_argument(
+        '--repeat',
+        type = int,
+        default = 3,
+        help = 'Number of timed calls per benchmark, of which the fastest is recorded. Default is 3.'
+    )
+    parser.add_argument(
+        '--seed',
+        type = int,
+        default = 0,
+        help = 'Random seed of the synthetic event generator. Default is 0.'
+    )
+    parser.add_argument(
+        '--output',
+        default = METRICS_BENCHMARK_FP,
+        help = 'Results file to append to, as JSON lines. Default is data/benchmarks/metrics.jsonl.'
+    )
+    parser.add_argument(
+        '--compare',
+        action = 'store_true',
+        help = 'Print recorded wall times by commit instead of running benchmarks.'
+    )
+
+    return parser.parse_args()
+
+def main(
+        users_grid,
+        days_grid,
+        freqs,
+        retention_types,
+        repeat,
+        seed,
+        output
+):
+    """Runs metric benchmarks and appends their results, tagged with the
+    current commit and run time, to a JSON lines file.
+
+    Parameters
+    ----------
+    users_grid : list
+        Numbers of users to generate events for.
+    days_grid : list
+        Numbers of days to generate events over.
+    freqs : list
+        Metric frequencies.
+    retention_types : list
+        Retention types.
+    repeat : int
+        Number of calls per benchmark.
+    seed : int
+        Random seed of the event generator.
+    output : str
+        Results filepath.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        Results of this run.
+    """
+
+    run = {
+        'commit': get_commit(),
+        'run_time': datetime.datetime.now().isoformat(timespec = 'seconds')
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok = True)
+    results = []
+    with open(output, 'a') as f:
+        for result in run_benchmarks(
+            users_grid = users_grid,
+            days_grid = days_grid,
+            freqs = freqs,
+            retention_types = retention_types,
+            repeat = repeat,
+            seed = seed
+        ):
+            result = {**run, **result}
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            results.append(result)
+            print(
+                f"{result['function']:<34} {result['freq']} {result.get('retention_type') or '':<13}"
+                f"{result.get('method') or '':<7} users={result['n_users']:<9} days={result['n_days']:<4} "
+                f"{result['wall_time_s']:>10.4f}s {result['peak_memory_mib']:>10.1f}MiB"
+            )
+
+    return pd.DataFrame(results)
+
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    if args.compare:
+        with pd.option_context('display.max_rows', None, 'display.width', None):
+            print(compare_results(filepath = args.output))
+        raise SystemExit
+
+    main(
+        users_grid = args.users,
+        days_grid = args.days,
+        freqs = args.freqs,
+        retention_types = args.retention_types,
+        repeat = args.repeat,
+        seed = args.seed,
+        output = args.output
+    )
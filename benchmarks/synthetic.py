@@ -0,0 +1,172 @@
+"""Seeded synthetic user event generator, producing events with the raw
+`event_stream.csv` schema (see `references/data_dictionary.md`)."""
+
+import numpy as np
+import pandas as pd
+
+from src.config.columns import COUNTRY, EVENT_TIME, EVENT_TYPE, MILES_AMOUNT, \
+    PLATFORM, TRANSACTION_CATEGORY, USER_ID, UTM_SOURCE, VERSION_TIME
+from src.config.filters import COUNTRIES, EVENT_TYPES, UTM_SOURCES
+
+RAW_COLUMNS = [
+    EVENT_TIME,
+    USER_ID,
+    EVENT_TYPE,
+    TRANSACTION_CATEGORY,
+    MILES_AMOUNT,
+    PLATFORM,
+    UTM_SOURCE,
+    COUNTRY
+]
+
+PLATFORMS = ['android', 'ios', 'web']
+TRANSACTION_CATEGORIES = ['dining', 'shopping', 'travel']
+
+# event type weights, in the order of `EVENT_TYPES`
+EVENT_TYPE_WEIGHTS = [0.3, 0.25, 0.1, 0.2, 0.15]
+
+# daily user state transition probabilities, where engaged users are
+# active on a day with their own activity rate and dormant users are not
+CHURN_RATE = 0.04
+RETURN_RATE = 0.01
+
+def generate_events(
+        n_users,
+        n_days,
+        start_date = '2025-01-01',
+        seed = 0
+):
+    """Generates synthetic user events with realistic churn and return
+    behaviour.
+
+    Users sign up uniformly over the date range, with an event on their
+    signup day. Each day, engaged users churn into dormancy with
+    probability `CHURN_RATE` and dormant users return with probability
+    `RETURN_RATE`. Engaged users are active with a per-user activity rate
+    drawn from a beta distribution, and make one or more events on days
+    they are active.
+
+    Parameters
+    ----------
+    n_users : int
+        Number of users.
+    n_days : int
+        Number of days of events.
+    start_date : str
+        First day of events, formatted as YYYY-MM-DD.
+        Default is '2025-01-01'.
+    seed : int
+        Random seed. Default is 0.
+
+    Returns
+    -------
+    events : pd.DataFrame
+        Events with the raw data columns (`RAW_COLUMNS`), where `user_id`
+        is categorical, ordered by event day.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    signup_days = rng.integers(0, n_days, n_users)
+    activity_rates = rng.beta(2, 5, n_users)
+    is_engaged = np.zeros(n_users, dtype = bool)
+
+    # simulate active users day by day, as (user code, day) pairs
+    day_user_codes = []
+    for day in range(n_days):
+        is_engaged &= rng.random(n_users) >= CHURN_RATE
+        is_engaged |= rng.random(n_users) < RETURN_RATE
+        is_engaged[signup_days > day] = False
+
+        is_active = is_engaged & (rng.random(n_users) < activity_rates)
+        is_active[signup_days == day] = True
+        is_engaged[signup_days == day] = True
+
+        day_user_codes.append(np.flatnonzero(is_active).astype(np.int32))
+
+    active_days = np.repeat(
+        np.arange(n_days, dtype = np.int64),
+        [user_codes.shape[0] for user_codes in day_user_codes]
+    )
+    active_user_codes = np.concatenate(day_user_codes)
+
+    # expand active user days into events at random microseconds of the
+    # day, so that (event_time, user_id) keys are unique in practice
+    n_events = rng.poisson(1.0, active_user_codes.shape[0]) + 1
+    user_codes = np.repeat(active_user_codes, n_events)
+    event_microseconds = np.repeat(active_days, n_events) * 86400 * 10**6 \
+        + rng.integers(0, 86400 * 10**6, user_codes.shape[0])
+    event_times = np.datetime64(start_date, 'us') + event_microseconds.astype('timedelta64[us]')
+
+    event_types = rng.choice(len(EVENT_TYPES), user_codes.shape[0], p = EVENT_TYPE_WEIGHTS)
+    is_miles = np.isin(np.asarray(EVENT_TYPES)[event_types], ['miles_earned', 'miles_redeemed'])
+
+    # users have a single country and signup source
+    user_ids = pd.Index([f'u{code:08d}' for code in range(n_users)])
+    user_countries = rng.integers(0, len(COUNTRIES), n_users)
+    user_sources = rng.integers(0, len(UTM_SOURCES), n_users)
+
+    events = pd.DataFrame({
+        EVENT_TIME: event_times.astype('datetime64[ns]'),
+        USER_ID: pd.Categorical.from_codes(user_codes, categories = user_ids),
+        EVENT_TYPE: pd.Categorical.from_codes(event_types, categories = EVENT_TYPES),
+        TRANSACTION_CATEGORY: pd.Categorical.from_codes(
+            np.where(is_miles, rng.integers(0, len(TRANSACTION_CATEGORIES), user_codes.shape[0]), -1),
+            categories = TRANSACTION_CATEGORIES
+        ),
+        MILES_AMOUNT: np.where(is_miles, rng.integers(1, 50, user_codes.shape[0]) * 10.0, np.nan),
+        PLATFORM: pd.Categorical.from_codes(
+            rng.integers(0, len(PLATFORMS), user_codes.shape[0]),
+            categories = PLATFORMS
+        ),
+        UTM_SOURCE: pd.Categorical.from_codes(user_sources[user_codes], categories = UTM_SOURCES),
+        COUNTRY: pd.Categorical.from_codes(user_countries[user_codes], categories = COUNTRIES)
+    })
+
+    return events
+
+def add_signup_times(
+        events
+):
+    """Adds user signup times to events, using each user's earliest event
+    time as the ingestion pipeline does for `dim_users`.
+
+    Parameters
+    ----------
+    events : pd.DataFrame
+        Events with `user_id` and `event_time` columns.
+
+    Returns
+    -------
+    events : pd.DataFrame
+        Events with an added `version_time` column.
+    """
+
+    events = events.copy()
+    events[VERSION_TIME] = events.groupby(USER_ID, observed = True)[EVENT_TIME].transform('min')
+
+    return events
+
+def write_event_stream(
+        events,
+        filepath
+):
+    """Writes events to a raw `event_stream.csv` file.
+
+    Parameters
+    ----------
+    events : pd.DataFrame
+        Events with the raw data columns (`RAW_COLUMNS`).
+    filepath : str
+        Output .csv filepath.
+
+    Returns
+    -------
+    None
+    """
+
+    events[RAW_COLUMNS].to_csv(
+        filepath,
+        index = False,
+        date_format = '%Y-%m-%d %H:%M:%S.%f'
+    )
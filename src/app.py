@@ -6,9 +6,14 @@ import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output
 from flask import Flask, redirect, request
 
+from src.config.logging_config import setup_logging
 from src.ui.components.content import content
 from src.ui.components.sidebar import sidebar
 from src.ui.utils.data import get_date_selector_init_dates
+from src.ui.utils.instrumentation import register_metrics_route, timed_callback
+from src.ui.utils.jobs import BACKGROUND_CALLBACK_MANAGER
+
+setup_logging()
 
 server = Flask(__name__)
 
@@ -20,6 +25,7 @@ app = dash.Dash(
         dbc.icons.BOOTSTRAP
     ],
     use_pages = True,
+    background_callback_manager = BACKGROUND_CALLBACK_MANAGER,
     pages_folder = 'ui/pages',
     assets_folder = 'ui/assets',
     url_base_pathname = '/'
@@ -42,6 +48,7 @@ app.layout = html.Div(
     Output(component_id = 'store', component_property = 'data'),
     Input(component_id = 'store', component_property = 'data')
 )
+@timed_callback('app.update_store')
 def update_store(
     data
 ):
@@ -56,6 +63,9 @@ def update_store(
         **date_dict
     }
 
+# publish callback, render stage and data read metrics to Prometheus
+register_metrics_route(server)
+
 @server.before_request
 def index_redirect():
 
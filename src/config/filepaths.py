@@ -11,6 +11,18 @@ DATA_DIR = os.path.join(REPO_DIR, 'data')
 RAW_DATA_DIR = os.path.join(DATA_DIR, 'raw')
 RAW_DATA_FP = os.path.join(RAW_DATA_DIR, 'event_stream.csv')
 
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+JOBS_CACHE_DIR = os.path.join(CACHE_DIR, 'jobs')
+FIGURES_CACHE_DIR = os.path.join(CACHE_DIR, 'figures')
+PLOTTING_DATA_CACHE_DIR = os.path.join(CACHE_DIR, 'plotting_data')
+PROMETHEUS_MULTIPROC_DIR = os.path.join(CACHE_DIR, 'prometheus')
+
+SNAPSHOTS_DIR = os.path.join(DATA_DIR, 'snapshots')
+
+BENCHMARKS_DIR = os.path.join(DATA_DIR, 'benchmarks')
+METRICS_BENCHMARK_FP = os.path.join(BENCHMARKS_DIR, 'metrics.jsonl')
+INGEST_BENCHMARK_FP = os.path.join(BENCHMARKS_DIR, 'ingest.jsonl')
+
 LOG_DIR = os.path.join(DATA_DIR, 'logs')
 INGESTION_PPL_LOGFILE = os.path.join(LOG_DIR, 'ingestion_ppl.log')
 DASH_APP_LOGFILE = os.path.join(LOG_DIR, 'app.log')
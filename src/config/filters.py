@@ -0,0 +1,29 @@
+"""This config file contains the options available for dashboard plot filters."""
+
+COUNTRY_OPTIONS = [
+    {'label': 'Indonesia', 'value': 'ID'},
+    {'label': 'Malaysia', 'value': 'MY'},
+    {'label': 'Philippines', 'value': 'PH'},
+    {'label': 'Singapore', 'value': 'SG'},
+    {'label': 'Thailand', 'value': 'TH'}
+]
+
+UTM_SOURCE_OPTIONS = [
+    {'label': 'Facebook', 'value': 'facebook'},
+    {'label': 'Google', 'value': 'google'},
+    {'label': 'Organic', 'value': 'organic'},
+    {'label': 'Referral', 'value': 'referral'},
+    {'label': 'Tiktok', 'value': 'tiktok'}
+]
+
+EVENT_TYPE_OPTIONS = [
+    {'label': 'Like', 'value': 'like'},
+    {'label': 'Miles Earned', 'value': 'miles_earned'},
+    {'label': 'Miles Redeemed', 'value': 'miles_redeemed'},
+    {'label': 'Reward Search', 'value': 'reward_search'},
+    {'label': 'Share', 'value': 'share'}
+]
+
+COUNTRIES = [option['value'] for option in COUNTRY_OPTIONS]
+UTM_SOURCES = [option['value'] for option in UTM_SOURCE_OPTIONS]
+EVENT_TYPES = [option['value'] for option in EVENT_TYPE_OPTIONS]
@@ -1,10 +1,66 @@
-"""This script contains log configs for this repo."""
+"""This script contains log configs for this repo.
 
+Loggers hand records to a queue handler, and a background listener thread
+per process formats them and writes them to log files, so logging calls
+never wait on disk I/O.
+"""
+
+import atexit
+import io
 import logging
 import logging.config
+import logging.handlers
+import os
+import queue
+
+from dotenv import load_dotenv
 
 from src.config.filepaths import INGESTION_PPL_LOGFILE, DASH_APP_LOGFILE
 
+load_dotenv()
+
+# 'text' writes plain log lines, 'json' writes one JSON object per record
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+if LOG_FORMAT not in ('text', 'json'):
+    raise ValueError(f'Invalid LOG_FORMAT - {LOG_FORMAT}')
+
+# the ingestion log is rotated beyond this size, keeping this many rotated files
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 2**20))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+
+FORMATTER = 'standard' if LOG_FORMAT == 'text' else 'json'
+
+def open_unbuffered(
+        handler
+):
+    """Opens a file handler's log file for writing records straight to the
+    file.
+
+    Buffered file streams hold a lock while writing. A process forked
+    while a listener thread is writing would inherit that lock held and
+    block on its first log record, so no buffer is used. Records are
+    flushed after each write anyway, so no writes are added.
+    """
+
+    return io.TextIOWrapper(
+        io.FileIO(handler.baseFilename, handler.mode),
+        encoding = handler.encoding,
+        errors = handler.errors,
+        write_through = True
+    )
+
+class UnbufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Size-rotated file handler writing records straight to the file, for
+    logs written by a single process."""
+
+    _open = open_unbuffered
+
+class UnbufferedWatchedFileHandler(logging.handlers.WatchedFileHandler):
+    """File handler writing records straight to the file and reopening it
+    once rotated externally, for logs written by several processes."""
+
+    _open = open_unbuffered
+
 LOGGING_CONFIG = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -12,34 +68,120 @@ LOGGING_CONFIG = {
         'standard': {
             'format': '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
         },
+        'json': {
+            '()': 'pythonjsonlogger.json.JsonFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s %(process)d %(threadName)s %(message)s'
+        },
     },
     'handlers': {
         'file_handler_ingestion_ppl': {
-            'class': 'logging.FileHandler',
+            'class': 'src.config.logging_config.UnbufferedRotatingFileHandler',
             'filename': INGESTION_PPL_LOGFILE,
-            'formatter': 'standard',
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
+            'formatter': FORMATTER,
             'level': 'INFO',
         },
+        # gunicorn workers and background jobs all append to the app log, and
+        # rotating it from several processes would lose records
         'file_handler_app': {
-            'class': 'logging.FileHandler',
+            'class': 'src.config.logging_config.UnbufferedWatchedFileHandler',
             'filename':  DASH_APP_LOGFILE,
-            'formatter': 'standard',
+            'formatter': FORMATTER,
             'level': 'INFO',
         },
+        'queue_handler_ingestion_ppl': {
+            'class': 'logging.handlers.QueueHandler',
+            'handlers': ['file_handler_ingestion_ppl'],
+            'respect_handler_level': True,
+        },
+        'queue_handler_app': {
+            'class': 'logging.handlers.QueueHandler',
+            'handlers': ['file_handler_app'],
+            'respect_handler_level': True,
+        },
     },
     'loggers': {
         'ingestion_ppl_logger': {
-            'handlers': ['file_handler_ingestion_ppl'],
+            'handlers': ['queue_handler_ingestion_ppl'],
             'level': 'INFO',
             'propagate': False
         },
         'app_logger': {
-            'handlers': ['file_handler_app'],
+            'handlers': ['queue_handler_app'],
             'level': 'INFO',
             'propagate': False
         },
     }
 }
 
+QUEUE_HANDLERS = ('queue_handler_ingestion_ppl', 'queue_handler_app')
+
+_is_configured = False
+
+def _get_listeners():
+    """Gets the background listener of each queue handler."""
+
+    return [logging.getHandlerByName(name).listener for name in QUEUE_HANDLERS]
+
+def _start_listeners_after_fork_in_child():
+    """Starts listener threads in the child with new queues, as the
+    inherited queues may have been locked by other parent threads."""
+
+    for name in QUEUE_HANDLERS:
+        handler = logging.getHandlerByName(name)
+        handler.queue = handler.listener.queue = queue.Queue(-1)
+        handler.listener.start()
+
+def stop_log_listeners():
+    """Writes out queued records and stops the listener threads. Must be
+    called before a process exits without running exit handlers, e.g. a
+    background job process.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    """
+
+    if not _is_configured:
+        return
+
+    for listener in _get_listeners():
+        atexit.unregister(listener.stop)
+        listener.stop()
+
 def setup_logging():
+    """Configures the repo's loggers and starts their background listeners,
+    if not already done in this process.
+
+    Forked processes (e.g. gunicorn workers of a preloaded app and
+    background jobs) start their own listeners.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    """
+
+    global _is_configured
+
+    if _is_configured:
+        return
+
+    os.makedirs(os.path.dirname(DASH_APP_LOGFILE), exist_ok = True)
     logging.config.dictConfig(LOGGING_CONFIG)
+
+    # listeners are stopped when the process exits, writing out queued records
+    for listener in _get_listeners():
+        listener.start()
+        atexit.register(listener.stop)
+
+    os.register_at_fork(after_in_child = _start_listeners_after_fork_in_child)
+    _is_configured = True
@@ -0,0 +1,96 @@
+"""Process-local sqlalchemy engine management for multi-process serving."""
+
+import os
+import threading
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+load_dotenv()
+
+def get_pool_settings():
+    """Gets connection pool settings from environment variables.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    pool_settings : dict
+        Keyword arguments for `create_engine`, read from `DB_POOL_SIZE`
+        (default 5), `DB_MAX_OVERFLOW` (default 10), `DB_POOL_PRE_PING`
+        (default true) and `DB_POOL_RECYCLE` (seconds, default 1800).
+    """
+
+    pool_settings = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800))
+    }
+
+    return pool_settings
+
+class EngineManager:
+    """Lazily creates one sqlalchemy engine per process.
+
+    Connection pools must not be shared between processes, so the engine
+    is created on first use in each process. When the process forks (e.g.
+    gunicorn workers forking from a preloaded master), the child drops the
+    inherited engine without closing the parent's connections, and creates
+    its own engine on next use.
+    """
+
+    def __init__(self):
+        self._engine = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        os.register_at_fork(after_in_child = self._after_fork)
+
+    def get(self):
+        """Gets the engine for the current process, creating it if needed.
+
+        Returns
+        -------
+        engine : sqlalchemy.engine.Engine
+            sqlalchemy engine instance.
+        """
+
+        with self._lock:
+            if self._engine is None or self._pid != os.getpid():
+                self._engine = create_engine(
+                    os.getenv('CONN_STRING'),
+                    **get_pool_settings()
+                )
+                self._pid = os.getpid()
+
+            return self._engine
+
+    def dispose(self):
+        """Closes all pooled connections of the current process's engine."""
+
+        with self._lock:
+            if self._engine is not None and self._pid == os.getpid():
+                self._engine.dispose()
+            self._engine = None
+            self._pid = None
+
+    def _after_fork(self):
+
+        # the lock may have been held by another thread at fork time
+        self._lock = threading.Lock()
+
+        # leave the parent's connections open, but never check them out here
+        if self._engine is not None:
+            self._engine.dispose(close = False)
+        self._engine = None
+        self._pid = None
+
+ENGINE_MANAGER = EngineManager()
+
+def get_engine():
+    """Gets the sqlalchemy engine for the current process."""
+
+    return ENGINE_MANAGER.get()
@@ -0,0 +1,205 @@
+"""Helper functions for incremental ingestion of append-only raw .csv files."""
+
+import hashlib
+import io
+import os
+
+from sqlalchemy import text
+
+from src.config.columns import EVENT_TIME
+
+# number of bytes hashed at the start and end of the loaded byte range
+FINGERPRINT_BYTES = 2**16
+
+class CsvSegmentReader(io.RawIOBase):
+    """Read-only binary stream over the byte range [start, end) of a .csv
+    file, prefixed with the file's header line if the range does not
+    start at the beginning of the file.
+
+    Parameters
+    ----------
+    csv_filepath : str
+        Path to .csv file.
+    start : int
+        Byte offset to start reading from. Must be at a line boundary.
+    end : int
+        Byte offset to stop reading at. Must be at a line boundary.
+    """
+
+    def __init__(
+            self,
+            csv_filepath,
+            start,
+            end
+    ):
+        super().__init__()
+        self._file = open(csv_filepath, 'rb')
+        header = self._file.readline()
+
+        if start <= len(header):
+            start = 0
+            self._prefix = b''
+        else:
+            self._prefix = header
+
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(
+            self,
+            b
+    ):
+        view = memoryview(b)
+
+        if self._prefix:
+            n = min(len(view), len(self._prefix))
+            view[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+
+        n = self._file.readinto(view[:self._remaining])
+        self._remaining -= n
+
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def get_complete_size(
+        csv_filepath
+):
+    """Gets the size of a file up to and including its last newline, so
+    that partially written trailing lines are excluded.
+
+    Parameters
+    ----------
+    csv_filepath : str
+        Path to .csv file.
+
+    Returns
+    -------
+    size : int
+        Byte offset after the last newline, or 0 if there is none.
+    """
+
+    with open(csv_filepath, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - FINGERPRINT_BYTES)
+            f.seek(start)
+            newline_idx = f.read(end - start).rfind(b'\n')
+            if newline_idx >= 0:
+                return start + newline_idx + 1
+            end = start
+
+    return 0
+
+def get_file_fingerprint(
+        csv_filepath,
+        offset
+):
+    """Fingerprints the first `offset` bytes of a file by hashing its size,
+    first and last `FINGERPRINT_BYTES` bytes. Used to check that previously
+    loaded bytes have not been modified, i.e. the file was only appended to.
+
+    Parameters
+    ----------
+    csv_filepath : str
+        Path to .csv file.
+    offset : int
+        Byte offset of the end of the range to fingerprint.
+
+    Returns
+    -------
+    fingerprint : str
+        SHA-256 hex digest.
+    """
+
+    file_hash = hashlib.sha256(str(offset).encode())
+
+    with open(csv_filepath, 'rb') as f:
+        file_hash.update(f.read(min(offset, FINGERPRINT_BYTES)))
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        file_hash.update(f.read(offset - f.tell()))
+
+    return file_hash.hexdigest()
+
+def get_ingest_state(
+        engine,
+        source
+):
+    """Gets the ingestion watermark of a source from the `ingest_state` table.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    source : str
+        Source identifier (e.g. absolute path of the raw .csv file).
+
+    Returns
+    -------
+    state : sqlalchemy.engine.Row
+        Row with `file_offset`, `file_hash` and `max_event_time`, or None
+        if the source has not been ingested.
+    """
+
+    with engine.connect() as conn:
+        state = conn.execute(
+            text("""
+            SELECT file_offset, file_hash, max_event_time
+            FROM ingest_state
+            WHERE source = :source
+            """),
+            {'source': source}
+        ).fetchone()
+
+    return state
+
+def update_ingest_state(
+        engine,
+        source,
+        file_offset,
+        file_hash
+):
+    """Records the ingestion watermark of a source in the `ingest_state`
+    table, along with the latest `event_time` in `fct_events`.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    source : str
+        Source identifier (e.g. absolute path of the raw .csv file).
+    file_offset : int
+        Byte offset up to which the source has been loaded.
+    file_hash : str
+        Fingerprint of the loaded bytes.
+
+    Returns
+    -------
+    None
+    """
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"""
+            INSERT INTO ingest_state (source, file_offset, file_hash, max_event_time, updated_at)
+            SELECT :source, :file_offset, :file_hash, MAX({EVENT_TIME}), NOW()
+            FROM fct_events
+            ON CONFLICT (source) DO UPDATE SET
+                file_offset = EXCLUDED.file_offset,
+                file_hash = EXCLUDED.file_hash,
+                max_event_time = EXCLUDED.max_event_time,
+                updated_at = EXCLUDED.updated_at;
+            """),
+            {
+                'source': source,
+                'file_offset': file_offset,
+                'file_hash': file_hash
+            }
+        )
@@ -1,7 +1,14 @@
+import argparse
+import io
 import logging
+import numpy as np
 import os
 import pandas as pd
+import pyarrow as pa
 import sqlalchemy
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
@@ -10,6 +17,14 @@ from src.config.columns import COUNTRY, EVENT_TIME, EVENT_TYPE, \
     MILES_AMOUNT, PLATFORM, TRANSACTION_CATEGORY, USER_ID, \
     UTM_SOURCE, VERSION_TIME
 from src.config.filepaths import RAW_DATA_FP
+from src.data.fetch import fetch_dataframe, iter_dataframes
+from src.data.incremental import CsvSegmentReader, get_complete_size, \
+    get_file_fingerprint, get_ingest_state, update_ingest_state
+from src.data.lifecycle_store import create_lifecycle_store_tables, refresh_lifecycle_store
+from src.data.retention_store import create_retention_store_tables, refresh_retention_store
+from src.data.rollups import create_rollup_tables, refresh_rollups
+from src.data.snapshots import DATA_BACKEND, export_snapshots
+from src.data.timing import STAGE_TIMINGS
 from src.config.logging_config import setup_logging
 
 load_dotenv()
@@ -17,13 +32,36 @@ setup_logging()
 
 logger = logging.getLogger('ingestion_ppl_logger')
 
-def get_engine():
+LOAD_METHODS = ('insert', 'copy')
+DEDUP_METHODS = ('client', 'server')
+
+USERS_DTYPES = {
+    USER_ID: sqlalchemy.types.Text(),
+    UTM_SOURCE: sqlalchemy.types.Text(),
+    COUNTRY: sqlalchemy.types.Text(),
+    VERSION_TIME: sqlalchemy.types.DateTime()
+}
+
+EVENTS_DTYPES = {
+    EVENT_TIME: sqlalchemy.types.DateTime(),
+    USER_ID: sqlalchemy.types.Text(),
+    EVENT_TYPE: sqlalchemy.types.Text(),
+    TRANSACTION_CATEGORY: sqlalchemy.types.Text(),
+    MILES_AMOUNT: sqlalchemy.types.Integer(),
+    PLATFORM: sqlalchemy.types.Text()
+}
+
+def get_engine(
+        pool_size = 5
+):
 
     """Creates sqlalchemy engine from `CONN_STRING` environment variable.
 
     Parameters
     ----------
-    None
+    pool_size : int
+        Number of connections to keep in the engine's connection pool.
+        Default is 5.
 
     Returns
     -------
@@ -32,7 +70,8 @@ def get_engine():
     """
 
     engine = create_engine(
-        os.getenv('CONN_STRING')
+        os.getenv('CONN_STRING'),
+        pool_size = pool_size
     )
 
     return engine
@@ -41,7 +80,9 @@ def create_tables(
         engine
 ):
 
-    """Creates `dim_users` and `fct_events` tables if they do not exist.
+    """Creates `dim_users` and `fct_events` tables, their staging
+    tables, and the `data_version` and `ingest_state` tables if they
+    do not exist.
 
     Parameters
     ----------
@@ -78,12 +119,73 @@ def create_tables(
             ) PARTITION BY RANGE (event_time);
         """))
 
+        # Create unlogged staging tables for server-side deduplication
+        conn.execute(text("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS stg_dim_users (
+                LIKE dim_users
+            );
+        """))
+        conn.execute(text("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS stg_fct_events (
+                LIKE fct_events
+            );
+        """))
+
+        # Create data version table, used by the dashboard to invalidate caches
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS data_version (
+                id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+                version BIGINT NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            );
+        """))
+
+        # Create ingestion watermark table for incremental loads
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS ingest_state (
+                source TEXT NOT NULL PRIMARY KEY,
+                file_offset BIGINT NOT NULL,
+                file_hash TEXT NOT NULL,
+                max_event_time TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL
+            );
+        """))
+
+def update_data_version(
+        engine
+):
+    """Increments the data version in the `data_version` table, signalling
+    that loaded data has changed.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+
+    Returns
+    -------
+    None
+    """
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO data_version (id, version, updated_at)
+            VALUES (1, 1, NOW())
+            ON CONFLICT (id) DO UPDATE SET
+                version = data_version.version + 1,
+                updated_at = EXCLUDED.updated_at;
+        """))
+
 def create_month_partition(
         engine,
         month
 ):
     """Creates monthly partition `fct_events` table if it does not exist.
 
+    Partition DDL is serialized with a transaction-level advisory lock, as
+    concurrent `CREATE TABLE IF NOT EXISTS` statements for the same table
+    can fail with a unique violation in the system catalogs.
+
     Parameters
     ----------
     engine : sqlalchemy.engine.Engine
@@ -112,7 +214,8 @@ def create_month_partition(
     FOR VALUES FROM (:start_date) TO (:end_date);
     """)
 
-    with engine.begin() as conn:
+    with STAGE_TIMINGS.stage('partition_ddl'), engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('fct_events_partition_ddl'));"))
         conn.execute(
             stmt,
             {
@@ -121,131 +224,913 @@ def create_month_partition(
             }
         )
 
-def insert_data(
+def copy_dataframe(
         engine,
-        csv_filepath
+        df,
+        table_name
 ):
-    """Inserts data from the specified .csv file and loads it
-    into the `dim_users` and `fct_events` tables.
+    """Bulk loads a DataFrame into an existing table by streaming it
+    as CSV through `COPY ... FROM STDIN`.
 
     Parameters
     ----------
     engine : sqlalchemy.engine.Engine
         sqlalchemy engine instance.
-    csv_filepath : str
-        Path to .csv file to ingest.
+    df : pd.DataFrame
+        DataFrame to load. Columns must match table column names.
+    table_name : str
+        Name of table to load data into.
 
     Returns
     -------
     None
     """
 
-    raw_df = pd.read_csv(
-        csv_filepath,
-        parse_dates = [EVENT_TIME],
+    # empty unquoted CSV fields are loaded as NULL
+    buffer = io.StringIO()
+    df.to_csv(
+        buffer,
+        index = False,
+        header = False,
         date_format = '%Y-%m-%d %H:%M:%S.%f'
     )
+    buffer.seek(0)
+
+    columns = ', '.join(df.columns)
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+def write_dataframe(
+        engine,
+        df,
+        table_name,
+        dtype,
+        load_method = 'insert'
+):
+    """Appends a DataFrame to an existing table.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    df : pd.DataFrame
+        DataFrame to load.
+    table_name : str
+        Name of table to load data into.
+    dtype : dict
+        Column sqlalchemy types, used by the 'insert' load method.
+    load_method : str
+        Method used to write data. Valid options are 'insert'
+        (`DataFrame.to_sql` INSERTs) and 'copy' (`COPY ... FROM STDIN`).
+        Default is 'insert'.
+
+    Returns
+    -------
+    None
+    """
+
+    with STAGE_TIMINGS.stage('write'):
+        if load_method == 'insert':
+            df.to_sql(
+                table_name,
+                con = engine,
+                if_exists = 'append',
+                index = False,
+                dtype = dtype
+            )
+        elif load_method == 'copy':
+            copy_dataframe(
+                engine = engine,
+                df = df,
+                table_name = table_name
+            )
+        else:
+            raise ValueError(f'Invalid load method - {load_method}')
+
+def load_month_partition(
+        engine,
+        month,
+        events_df,
+        load_method = 'insert'
+):
+    """Creates a monthly `fct_events` partition if it does not exist and
+    loads events into it.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    month : str
+        Month formatted as `YYYY_MM`.
+    events_df : pd.DataFrame
+        DataFrame of new events in the month.
+    load_method : str
+        Method used to write data. Valid options are 'insert'
+        and 'copy'. Default is 'insert'.
+
+    Returns
+    -------
+    elapsed : float
+        Time taken to load the partition, in seconds.
+    """
+
+    start_time = time.perf_counter()
+
+    # create new month partition table if it does not exist
+    create_month_partition(
+        engine = engine,
+        month = month
+    )
+
+    # insert new events into partition table
+    write_dataframe(
+        engine = engine,
+        df = events_df[list(EVENTS_DTYPES)],
+        table_name = f'fct_events_{month}',
+        dtype = EVENTS_DTYPES,
+        load_method = load_method
+    )
+
+    elapsed = time.perf_counter() - start_time
+    logger.info(f'{events_df.shape[0]} events loaded into `fct_events_{month}` in {elapsed:.2f}s.')
+
+    return elapsed
+
+def insert_new_data(
+        engine,
+        users_df,
+        events_df,
+        load_method = 'insert',
+        workers = 1
+):
+    """Deduplicates users and events against existing `dim_users` keys and
+    `fct_events` keys in the batch's time range in pandas, then inserts
+    new rows.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    users_df : pd.DataFrame
+        DataFrame of users in the batch, one row per user.
+    events_df : pd.DataFrame
+        DataFrame of events in the batch.
+    load_method : str
+        Method used to write data. Valid options are 'insert'
+        and 'copy'. Default is 'insert'.
+    workers : int
+        Number of monthly partitions to load concurrently. Default is 1.
+
+    Returns
+    -------
+    months : set
+        Months (formatted as `YYYY_MM`) with new events.
+    """
+
+    # check for existing users and select new users
+    with STAGE_TIMINGS.stage('dedup'):
+        existing_users = fetch_dataframe(
+            engine = engine,
+            stmt = text(f'SELECT {USER_ID} FROM dim_users'),
+            column_types = {USER_ID: pa.string()}
+        )
+        new_users_df = users_df[~users_df[USER_ID].isin(set(existing_users[USER_ID]))]
+
+    # insert new users into dim_users table
+    write_dataframe(
+        engine = engine,
+        df = new_users_df,
+        table_name = 'dim_users',
+        dtype = USERS_DTYPES,
+        load_method = load_method
+    )
+
+    logger.info(f'{new_users_df.shape[0]} new users added to `dim_users` table.')
+
+    # check for existing events, streamed in chunks to bound memory, and
+    # select new events. only events in the batch's time range can match, so
+    # only the partitions it covers are scanned (e.g. the months of an
+    # incremental run's appended rows), rather than the full history
+    with STAGE_TIMINGS.stage('dedup'):
+        df_pairs = pd.MultiIndex.from_frame(events_df[[USER_ID, EVENT_TIME]])
+        is_existing = np.zeros(df_pairs.shape[0], dtype = bool)
+        if not events_df.empty:
+            existing_events_stmt = text(f"""
+                SELECT {USER_ID}, {EVENT_TIME}
+                FROM fct_events
+                WHERE {EVENT_TIME} BETWEEN :start_time AND :end_time
+            """).bindparams(
+                start_time = events_df[EVENT_TIME].min(),
+                end_time = events_df[EVENT_TIME].max()
+            )
+            for existing_events in iter_dataframes(
+                engine = engine,
+                stmt = existing_events_stmt,
+                column_types = {USER_ID: pa.string(), EVENT_TIME: pa.timestamp('ns')}
+            ):
+                existing_pairs = pd.MultiIndex.from_arrays([
+                    existing_events[USER_ID].astype(object),
+                    existing_events[EVENT_TIME]
+                ])
+                is_existing |= df_pairs.isin(existing_pairs)
+        df = events_df[~is_existing].copy()
+
+    # group transactions by event year and month and load partitions concurrently,
+    # with each worker using its own pooled connection
+    df['event_month'] = df[EVENT_TIME].dt.strftime('%Y_%m')
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        futures = [
+            executor.submit(
+                load_month_partition,
+                engine = engine,
+                month = month,
+                events_df = group,
+                load_method = load_method
+            )
+            for month, group in df.groupby('event_month')
+        ]
+        partition_timings = [future.result() for future in futures]
+
+    if partition_timings:
+        logger.info(
+            f'{len(partition_timings)} partitions loaded with {workers} workers '
+            f'(total {sum(partition_timings):.2f}s, max {max(partition_timings):.2f}s).'
+        )
+
+    logger.info(f'{df.shape[0]} new events added to `fct_events` table.')
 
-    # prepare user dataframe
-    users_df = raw_df[[USER_ID, UTM_SOURCE, COUNTRY, EVENT_TIME]] \
+    return set(df['event_month'])
+
+def merge_new_users(
+        engine,
+        users_df,
+        load_method = 'insert'
+):
+    """Loads users into the unlogged `stg_dim_users` staging table, then
+    merges them into `dim_users` with `INSERT ... ON CONFLICT DO NOTHING`,
+    so that existing users are deduplicated by the database.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    users_df : pd.DataFrame
+        DataFrame of users in the batch, one row per user.
+    load_method : str
+        Method used to write data to the staging table. Valid
+        options are 'insert' and 'copy'. Default is 'insert'.
+
+    Returns
+    -------
+    new_users : int
+        Number of users added to `dim_users`.
+    """
+
+    with engine.begin() as conn:
+        conn.execute(text('TRUNCATE stg_dim_users;'))
+
+    write_dataframe(
+        engine = engine,
+        df = users_df[list(USERS_DTYPES)],
+        table_name = 'stg_dim_users',
+        dtype = USERS_DTYPES,
+        load_method = load_method
+    )
+
+    users_cols = ', '.join(USERS_DTYPES)
+
+    # deduplicating insert from the staging table
+    with STAGE_TIMINGS.stage('dedup'), engine.begin() as conn:
+        result = conn.execute(text(f"""
+            INSERT INTO dim_users ({users_cols})
+            SELECT {users_cols}
+            FROM stg_dim_users
+            ON CONFLICT ({USER_ID}) DO NOTHING;
+        """))
+        conn.execute(text('TRUNCATE stg_dim_users;'))
+
+    return result.rowcount
+
+def merge_new_events(
+        engine,
+        events_df,
+        load_method = 'insert',
+        existing_months = None
+):
+    """Loads events into the unlogged `stg_fct_events` staging table, then
+    merges them into `fct_events` with `INSERT ... ON CONFLICT DO NOTHING`,
+    so that existing events are deduplicated by the database. Rows are
+    routed to their monthly partitions by `event_time`.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    events_df : pd.DataFrame
+        DataFrame of events in the batch.
+    load_method : str
+        Method used to write data to the staging table. Valid
+        options are 'insert' and 'copy'. Default is 'insert'.
+    existing_months : set
+        Months (formatted as `YYYY_MM`) whose partitions are known to
+        exist. Newly created months are added to the set. Default is None.
+
+    Returns
+    -------
+    new_events : dict
+        Number of events added to `fct_events` per month (formatted as
+        `YYYY_MM`), for months with new events only.
+    """
+
+    if existing_months is None:
+        existing_months = set()
+
+    with engine.begin() as conn:
+        conn.execute(text('TRUNCATE stg_fct_events;'))
+
+    write_dataframe(
+        engine = engine,
+        df = events_df[list(EVENTS_DTYPES)],
+        table_name = 'stg_fct_events',
+        dtype = EVENTS_DTYPES,
+        load_method = load_method
+    )
+
+    # create new month partition tables if they do not exist
+    for month in events_df[EVENT_TIME].dt.strftime('%Y_%m').unique():
+        if month not in existing_months:
+            create_month_partition(
+                engine = engine,
+                month = month
+            )
+            existing_months.add(month)
+
+    events_cols = ', '.join(EVENTS_DTYPES)
+
+    # deduplicating insert from the staging table, counting inserted rows
+    # per month so that only months with new events are refreshed
+    with STAGE_TIMINGS.stage('dedup'), engine.begin() as conn:
+        result = conn.execute(text(f"""
+            WITH inserted AS (
+                INSERT INTO fct_events ({events_cols})
+                SELECT {events_cols}
+                FROM stg_fct_events
+                ON CONFLICT ({EVENT_TIME}, {USER_ID}) DO NOTHING
+                RETURNING {EVENT_TIME}
+            )
+            SELECT TO_CHAR({EVENT_TIME}, 'YYYY_MM') AS month, COUNT(*) AS new_events
+            FROM inserted
+            GROUP BY 1;
+        """))
+        new_events = {row.month: row.new_events for row in result}
+        conn.execute(text('TRUNCATE stg_fct_events;'))
+
+    return new_events
+
+def merge_new_data(
+        engine,
+        users_df,
+        events_df,
+        load_method = 'insert'
+):
+    """Merges users and events into the `dim_users` and `fct_events`
+    tables through their staging tables, deduplicating in the database.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    users_df : pd.DataFrame
+        DataFrame of users in the batch, one row per user.
+    events_df : pd.DataFrame
+        DataFrame of events in the batch.
+    load_method : str
+        Method used to write data to the staging tables. Valid
+        options are 'insert' and 'copy'. Default is 'insert'.
+
+    Returns
+    -------
+    months : set
+        Months (formatted as `YYYY_MM`) with new events.
+    """
+
+    new_users = merge_new_users(
+        engine = engine,
+        users_df = users_df,
+        load_method = load_method
+    )
+    logger.info(f'{new_users} new users added to `dim_users` table.')
+
+    new_events = merge_new_events(
+        engine = engine,
+        events_df = events_df,
+        load_method = load_method
+    )
+    logger.info(f'{sum(new_events.values())} new events added to `fct_events` table.')
+
+    return set(new_events)
+
+def read_csv_chunks(
+        csv_filepath,
+        chunksize
+):
+    """Reads the specified .csv file in chunks of rows.
+
+    Parameters
+    ----------
+    csv_filepath : str or file-like object
+        Path to .csv file to read, or a binary stream of .csv data.
+    chunksize : int
+        Number of rows per chunk.
+
+    Yields
+    ------
+    chunk : pd.DataFrame
+        DataFrame of raw events.
+    """
+
+    with pd.read_csv(
+        csv_filepath,
+        parse_dates = [EVENT_TIME],
+        date_format = '%Y-%m-%d %H:%M:%S.%f',
+        chunksize = chunksize
+    ) as reader:
+        while True:
+            with STAGE_TIMINGS.stage('parse'):
+                chunk = next(reader, None)
+            if chunk is None:
+                return
+            yield chunk
+
+def get_first_seen_users(
+        df
+):
+    """Gets each user's attributes at their earliest event, with the
+    earliest `event_time` as `version_time`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame of raw events.
+
+    Returns
+    -------
+    users_df : pd.DataFrame
+        DataFrame of users, one row per user.
+    """
+
+    users_df = df[[USER_ID, UTM_SOURCE, COUNTRY, EVENT_TIME]] \
         .sort_values(EVENT_TIME) \
         .drop_duplicates(subset = USER_ID, keep = 'first') \
         .rename(columns = {EVENT_TIME: VERSION_TIME}) \
         .reset_index(drop=True)
 
-    # check for existing users
-    with engine.connect() as conn:
-        existing_users = pd.read_sql(
-            text(f'SELECT {USER_ID} FROM dim_users'),
-            conn
-        )
+    return users_df
 
-    # select new users
-    new_users_df = users_df[~users_df[USER_ID].isin(set(existing_users[USER_ID]))]
+def stream_data(
+        engine,
+        csv_filepath,
+        chunksize,
+        load_method = 'insert'
+):
+    """Streams data from the specified .csv file in chunks of rows and
+    merges it into the `dim_users` and `fct_events` tables, so that memory
+    use is bounded by the chunk size and number of distinct users rather
+    than the file size.
 
-    # insert new users into dim_users table
-    new_users_df.to_sql(
-        'dim_users',
-        con = engine,
-        if_exists = 'append',
-        index = False,
-        dtype = {
-            USER_ID: sqlalchemy.types.Text(),
-            UTM_SOURCE: sqlalchemy.types.Text(),
-            COUNTRY: sqlalchemy.types.Text(),
-            VERSION_TIME: sqlalchemy.types.DateTime()
-        }
+    Each chunk's events are merged into their month partitions as they
+    are read, while first-seen users are tracked across chunks and merged
+    into `dim_users` once the whole file has been read.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    csv_filepath : str or file-like object
+        Path to .csv file to ingest, or a binary stream of .csv data.
+    chunksize : int
+        Number of rows per chunk.
+    load_method : str
+        Method used to write data to the staging tables. Valid
+        options are 'insert' and 'copy'. Default is 'insert'.
+
+    Returns
+    -------
+    months : set
+        Months (formatted as `YYYY_MM`) with new events.
+    """
+
+    users_df = None
+    existing_months = set()
+    new_events = {}
+
+    for chunk in read_csv_chunks(
+        csv_filepath = csv_filepath,
+        chunksize = chunksize
+    ):
+
+        # keep each user's earliest event across chunks
+        with STAGE_TIMINGS.stage('parse'):
+            users_df = pd.concat([users_df, get_first_seen_users(chunk)]) \
+                .sort_values(VERSION_TIME) \
+                .drop_duplicates(subset = USER_ID, keep = 'first')
+
+        for month, month_events in merge_new_events(
+            engine = engine,
+            events_df = chunk,
+            load_method = load_method,
+            existing_months = existing_months
+        ).items():
+            new_events[month] = new_events.get(month, 0) + month_events
+
+    logger.info(f'{sum(new_events.values())} new events added to `fct_events` table.')
+
+    if users_df is None:
+        return set(new_events)
+
+    new_users = merge_new_users(
+        engine = engine,
+        users_df = users_df,
+        load_method = load_method
     )
+    logger.info(f'{new_users} new users added to `dim_users` table.')
 
-    logger.info(f'{new_users_df.shape[0]} new users added to `dim_users` table.')
+    return set(new_events)
 
-    # check for existing events
-    with engine.connect() as conn:
-        existing_events = pd.read_sql(
-            text(f'SELECT {USER_ID}, {EVENT_TIME} FROM fct_events'),
-            conn
+def insert_data(
+        engine,
+        csv_filepath,
+        load_method = 'insert',
+        dedup_method = 'client',
+        chunksize = None,
+        workers = 1
+):
+    """Inserts data from the specified .csv file and loads it
+    into the `dim_users` and `fct_events` tables.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    csv_filepath : str or file-like object
+        Path to .csv file to ingest, or a binary stream of .csv data.
+    load_method : str
+        Method used to write data. Valid options are 'insert'
+        and 'copy'. Default is 'insert'.
+    dedup_method : str
+        Where existing users and events are deduplicated. Valid
+        options are 'client' (existing keys are pulled into pandas)
+        and 'server' (batch is merged from staging tables with
+        `ON CONFLICT DO NOTHING`). Default is 'client'.
+    chunksize : int
+        If specified, the .csv file is streamed in chunks of this many
+        rows. Requires `dedup_method='server'`. Default is None.
+    workers : int
+        Number of monthly partitions to load concurrently. Only
+        supported by the 'client' dedup method without `chunksize`, as
+        server-side merges go through shared staging tables.
+        Default is 1.
+
+    Returns
+    -------
+    months : set
+        Months (formatted as `YYYY_MM`) with new events.
+    """
+
+    if workers > 1 and (dedup_method != 'client' or chunksize is not None):
+        raise ValueError('Concurrent partition loads require `client` dedup method without chunking.')
+
+    if chunksize is not None:
+
+        if dedup_method != 'server':
+            raise ValueError('Chunked ingestion requires `server` dedup method.')
+
+        return stream_data(
+            engine = engine,
+            csv_filepath = csv_filepath,
+            chunksize = chunksize,
+            load_method = load_method
         )
 
-    # select new events
-    existing_pairs = pd.MultiIndex.from_frame(existing_events)
-    df_pairs = pd.MultiIndex.from_frame(raw_df[[USER_ID, EVENT_TIME]])
-    df = raw_df[~df_pairs.isin(existing_pairs)].copy()
+    with STAGE_TIMINGS.stage('parse'):
+        raw_df = pd.read_csv(
+            csv_filepath,
+            parse_dates = [EVENT_TIME],
+            date_format = '%Y-%m-%d %H:%M:%S.%f'
+        )
 
-    # group transactions by event year and month for data loading
-    df['event_month'] = df[EVENT_TIME].dt.strftime('%Y_%m')
-    for month, group in df.groupby('event_month'):
+        # prepare user dataframe
+        users_df = get_first_seen_users(raw_df)
 
-        # create new month partition table if it does not exist
-        create_month_partition(
+    if dedup_method == 'client':
+        months = insert_new_data(
             engine = engine,
-            month = month
+            users_df = users_df,
+            events_df = raw_df,
+            load_method = load_method,
+            workers = workers
         )
+    elif dedup_method == 'server':
+        months = merge_new_data(
+            engine = engine,
+            users_df = users_df,
+            events_df = raw_df,
+            load_method = load_method
+        )
+    else:
+        raise ValueError(f'Invalid dedup method - {dedup_method}')
 
-        # insert new events into partition table
-        group[[EVENT_TIME, USER_ID, EVENT_TYPE,
-               TRANSACTION_CATEGORY, MILES_AMOUNT, PLATFORM]] \
-            .to_sql(
-            f'fct_events_{month}',
-            con = engine,
-            if_exists = 'append',
-            index = False,
-            dtype = {
-                EVENT_TIME: sqlalchemy.types.DateTime(),
-                USER_ID: sqlalchemy.types.Text(),
-                EVENT_TYPE: sqlalchemy.types.Text(),
-                TRANSACTION_CATEGORY: sqlalchemy.types.Text(),
-                MILES_AMOUNT: sqlalchemy.types.Integer(),
-                PLATFORM: sqlalchemy.types.Text()
-            }
+    return months
+
+def insert_incremental_data(
+        engine,
+        csv_filepath,
+        load_method = 'insert',
+        dedup_method = 'client',
+        chunksize = None,
+        workers = 1
+):
+    """Inserts only the rows appended to the specified .csv file since the
+    last incremental run, using the byte offset watermark recorded for the
+    file in the `ingest_state` table.
+
+    If the previously loaded bytes have changed (e.g. the file was
+    replaced), the whole file is reloaded and deduplicated as usual.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    csv_filepath : str
+        Path to .csv file to ingest.
+    load_method : str
+        Method used to write data. Valid options are 'insert'
+        and 'copy'. Default is 'insert'.
+    dedup_method : str
+        Where existing users and events are deduplicated. Valid
+        options are 'client' and 'server'. Default is 'client'.
+    chunksize : int
+        If specified, new rows are streamed in chunks of this many
+        rows. Default is None.
+    workers : int
+        Number of monthly partitions to load concurrently, as in
+        `insert_data`. Default is 1.
+
+    Returns
+    -------
+    months : set
+        Months (formatted as `YYYY_MM`) of the new events.
+    """
+
+    source = os.path.abspath(csv_filepath)
+    state = get_ingest_state(
+        engine = engine,
+        source = source
+    )
+
+    # only read up to the last complete line
+    end_offset = get_complete_size(csv_filepath)
+
+    start_offset = 0
+    if state is not None:
+        if state.file_offset <= end_offset and \
+                get_file_fingerprint(csv_filepath, state.file_offset) == state.file_hash:
+            start_offset = state.file_offset
+            logger.info(
+                f'Resuming from byte {start_offset} of {source} '
+                f'(last event time: {state.max_event_time}).'
+            )
+        else:
+            logger.warning(f'Previously loaded data in {source} has changed, reloading whole file.')
+
+    if start_offset == end_offset:
+        logger.info(f'No new data in {source}.')
+        return set()
+
+    with CsvSegmentReader(
+        csv_filepath = csv_filepath,
+        start = start_offset,
+        end = end_offset
+    ) as raw_reader, io.BufferedReader(raw_reader) as reader:
+        months = insert_data(
+            engine = engine,
+            csv_filepath = reader,
+            load_method = load_method,
+            dedup_method = dedup_method,
+            chunksize = chunksize,
+            workers = workers
         )
 
-    logger.info(f'{df.shape[0]} new events added to `fct_events` table.')
+    update_ingest_state(
+        engine = engine,
+        source = source,
+        file_offset = end_offset,
+        file_hash = get_file_fingerprint(csv_filepath, end_offset)
+    )
 
-def main():
+    logger.info(f'{end_offset - start_offset} new bytes loaded from {source}.')
 
-    """Main method for executing the ingestion pipeline."""
+    return months
 
-    logger.info('Starting ingestion pipeline...')
+def main(
+        csv_filepath = RAW_DATA_FP,
+        load_method = 'insert',
+        dedup_method = 'client',
+        chunksize = None,
+        incremental = False,
+        workers = 1,
+        rebuild_rollups = False,
+        warmup = False
+):
+
+    """Main method for executing the ingestion pipeline. Wall time spent
+    in each stage is logged when the pipeline completes, and is available
+    from `STAGE_TIMINGS`.
+
+    Parameters
+    ----------
+    csv_filepath : str
+        Path to the raw .csv file to ingest. Default is `RAW_DATA_FP`.
+    load_method : str
+        Method used to write data. Valid options are 'insert'
+        and 'copy'. Default is 'insert'.
+    dedup_method : str
+        Where existing users and events are deduplicated. Valid
+        options are 'client' and 'server'. Default is 'client'.
+    chunksize : int
+        If specified, the raw .csv file is streamed in chunks of this
+        many rows. Default is None.
+    incremental : bool
+        Whether to only load rows appended to the raw .csv file since
+        the last incremental run. Default is False.
+    workers : int
+        Number of monthly partitions to load concurrently. Default is 1.
+    rebuild_rollups : bool
+        Whether to rebuild rollup tables, the lifecycle and retention
+        stores and Parquet snapshots for all months, instead of only the
+        months of newly loaded events.
+        Default is False.
+    warmup : bool
+        Whether to precompute commonly viewed dashboard figures after
+        loading (see `src.ui.warmup`). Default is False.
+    """
+
+    logger.info(
+        f'Starting ingestion pipeline (load method: {load_method}, '
+        f'dedup method: {dedup_method}, chunksize: {chunksize}, incremental: {incremental}, '
+        f'workers: {workers})...'
+    )
+    STAGE_TIMINGS.reset()
     try:
-        engine = get_engine()
+        engine = get_engine(pool_size = max(5, workers))
         logger.info('Database engine created successfully.')
 
         create_tables(engine)
+        create_rollup_tables(engine)
+        create_lifecycle_store_tables(engine)
+        create_retention_store_tables(engine)
 
-        if not os.path.exists(RAW_DATA_FP):
-            logger.error(f'Raw CSV file not found at path: {RAW_DATA_FP}')
+        if not os.path.exists(csv_filepath):
+            logger.error(f'Raw CSV file not found at path: {csv_filepath}')
             return
 
-        insert_data(
-            engine = engine,
-            csv_filepath = RAW_DATA_FP
-        )
+        if incremental:
+            months = insert_incremental_data(
+                engine = engine,
+                csv_filepath = csv_filepath,
+                load_method = load_method,
+                dedup_method = dedup_method,
+                chunksize = chunksize,
+                workers = workers
+            )
+        else:
+            months = insert_data(
+                engine = engine,
+                csv_filepath = csv_filepath,
+                load_method = load_method,
+                dedup_method = dedup_method,
+                chunksize = chunksize,
+                workers = workers
+            )
+
+        # update rollup tables for newly loaded partitions
+        with STAGE_TIMINGS.stage('rollups'):
+            refresh_rollups(
+                engine = engine,
+                months = None if rebuild_rollups else months
+            )
+
+        # update lifecycle and retained user counts for periods with new activity
+        with STAGE_TIMINGS.stage('metric_stores'):
+            refresh_lifecycle_store(
+                engine = engine,
+                months = None if rebuild_rollups else months
+            )
+            refresh_retention_store(
+                engine = engine,
+                months = None if rebuild_rollups else months
+            )
+
+        # keep caches and snapshots of the current version if nothing was loaded
+        if months or rebuild_rollups:
+            update_data_version(engine)
+
+            # export changed partitions for the parquet data backend
+            if DATA_BACKEND == 'parquet':
+                with STAGE_TIMINGS.stage('snapshots'):
+                    export_snapshots(
+                        engine = engine,
+                        months = None if rebuild_rollups else months
+                    )
+        else:
+            logger.info('No new events loaded, data version unchanged.')
+
+        # precompute default dashboard views for the new data version. the
+        # dashboard modules are only imported if needed, as importing them
+        # sets up the dashboard's caches
+        if warmup:
+            from src.ui.warmup import warm_up
+
+            with STAGE_TIMINGS.stage('warmup'):
+                warm_up()
+
+        logger.info(f'Ingestion pipeline completed. Stage timings: {STAGE_TIMINGS}.')
     except Exception as e:
         logger.critical(
             f'An unhandled error occurred in the data ingestion pipeline: {e}',
             exc_info = True
         )
 
+def parse_args():
+
+    """Parses ingestion pipeline command line arguments."""
+
+    parser = argparse.ArgumentParser(description = 'HeyMax data ingestion pipeline.')
+    parser.add_argument(
+        '--load-method',
+        choices = LOAD_METHODS,
+        default = 'insert',
+        help = 'Method used to write data: parameterized INSERTs or COPY FROM STDIN.'
+    )
+    parser.add_argument(
+        '--dedup-method',
+        choices = DEDUP_METHODS,
+        default = 'client',
+        help = 'Deduplicate against existing rows in pandas or in the database via staging tables.'
+    )
+    parser.add_argument(
+        '--chunksize',
+        type = int,
+        default = None,
+        help = 'Stream the raw CSV in chunks of this many rows (requires --dedup-method server).'
+    )
+    parser.add_argument(
+        '--incremental',
+        action = 'store_true',
+        help = 'Only load rows appended to the raw CSV since the last incremental run.'
+    )
+    parser.add_argument(
+        '--workers',
+        type = int,
+        default = 1,
+        help = 'Number of monthly partitions to load concurrently (requires --dedup-method client without --chunksize).'
+    )
+    parser.add_argument(
+        '--rebuild-rollups',
+        action = 'store_true',
+        help = 'Rebuild rollup tables, metric stores and Parquet snapshots for all months instead of only newly loaded months.'
+    )
+    parser.add_argument(
+        '--warmup',
+        action = 'store_true',
+        help = 'Precompute commonly viewed dashboard figures after loading.'
+    )
+
+    args = parser.parse_args()
+
+    if args.workers > 1 and (args.dedup_method != 'client' or args.chunksize is not None):
+        parser.error('--workers requires --dedup-method client without --chunksize')
+
+    return args
+
 if __name__ == "__main__":
 
-    main()
+    args = parse_args()
+    main(
+        load_method = args.load_method,
+        dedup_method = args.dedup_method,
+        chunksize = args.chunksize,
+        incremental = args.incremental,
+        workers = args.workers,
+        rebuild_rollups = args.rebuild_rollups,
+        warmup = args.warmup
+    )
@@ -0,0 +1,237 @@
+"""Functions for maintaining and reading the incremental lifecycle store,
+which holds active, retained and new user counts per period for each
+frequency and user segment (country, utm_source)."""
+
+import logging
+import pandas as pd
+import time
+
+from sqlalchemy import Text, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from src.config.columns import COUNTRY, USER_ID, UTM_SOURCE, VERSION_TIME
+from src.metrics.database import FREQUENCY_UNITS, get_frequency_unit
+
+logger = logging.getLogger('ingestion_ppl_logger')
+
+def create_lifecycle_store_tables(
+        engine
+):
+    """Creates the `agg_lifecycle_counts` table if it does not exist.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+
+    Returns
+    -------
+    None
+    """
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS agg_lifecycle_counts (
+                freq TEXT NOT NULL,
+                {COUNTRY} TEXT NOT NULL,
+                {UTM_SOURCE} TEXT NOT NULL,
+                period DATE NOT NULL,
+                active INTEGER NOT NULL,
+                retained INTEGER NOT NULL,
+                active_new INTEGER NOT NULL,
+                retained_new INTEGER NOT NULL,
+                PRIMARY KEY (freq, {COUNTRY}, {UTM_SOURCE}, period)
+            );
+        """))
+
+def build_refresh_statement(
+        freq
+):
+    """Builds a statement which inserts user counts for all periods on or
+    after `:since`, reading activity from one period before `:since` so
+    that users retained into the first refreshed period are counted.
+
+    Parameters
+    ----------
+    freq : str
+        Metric frequency string. Valid options are
+        'D' (daily), 'W' (weekly), 'M' (monthly).
+
+    Returns
+    -------
+    stmt : sqlalchemy.sql.TextClause
+        Insert statement.
+    """
+
+    unit = get_frequency_unit(freq)
+
+    stmt = text(f"""
+        WITH user_periods AS (
+            SELECT DISTINCT
+                {USER_ID},
+                DATE_TRUNC('{unit}', activity_date)::DATE AS period
+            FROM agg_daily_user_activity
+            WHERE activity_date >= CAST(:since AS DATE) - INTERVAL '1 {unit}'
+        ),
+        user_activity AS (
+            SELECT
+                p.period,
+                u.{COUNTRY} AS country,
+                u.{UTM_SOURCE} AS utm_source,
+                p.period = DATE_TRUNC('{unit}', u.{VERSION_TIME})::DATE AS is_new,
+                COALESCE(
+                    LAG(p.period) OVER (PARTITION BY p.{USER_ID} ORDER BY p.period)
+                        = (p.period - INTERVAL '1 {unit}')::DATE,
+                    FALSE
+                ) AS is_retained
+            FROM user_periods AS p
+            JOIN dim_users AS u ON u.{USER_ID} = p.{USER_ID}
+        )
+        INSERT INTO agg_lifecycle_counts
+            (freq, {COUNTRY}, {UTM_SOURCE}, period, active, retained, active_new, retained_new)
+        SELECT
+            :freq,
+            country,
+            utm_source,
+            period,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE is_retained),
+            COUNT(*) FILTER (WHERE is_new),
+            COUNT(*) FILTER (WHERE is_retained AND is_new)
+        FROM user_activity
+        WHERE period >= :since
+        GROUP BY country, utm_source, period;
+    """)
+
+    return stmt
+
+def refresh_lifecycle_store(
+        engine,
+        months = None
+):
+    """Refreshes the lifecycle store after new events are loaded.
+
+    Counts of a period only depend on activity in that period and the one
+    before it, so only periods on or after the earliest period containing
+    new events are deleted and recomputed.
+
+    Requires the `agg_daily_user_activity` rollup to be up to date.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    months : set
+        Months (formatted as `YYYY_MM`) with new events. If None, or if
+        the store is empty, the store is rebuilt for all periods.
+        Default is None.
+
+    Returns
+    -------
+    None
+    """
+
+    start_time = time.time()
+
+    with engine.begin() as conn:
+
+        is_empty = conn.execute(text('SELECT NOT EXISTS (SELECT 1 FROM agg_lifecycle_counts)')).scalar()
+        if months is None or is_empty:
+            since = conn.execute(text('SELECT MIN(activity_date) FROM agg_daily_user_activity')).scalar()
+        elif months:
+            since = pd.to_datetime(min(months), format = '%Y_%m').date()
+        else:
+            since = None
+
+        if since is None:
+            logger.info('No new activity to add to the lifecycle store.')
+            return
+
+        for freq in FREQUENCY_UNITS:
+
+            # start of the earliest affected period
+            period_since = pd.Period(since, freq = freq).start_time.date()
+
+            conn.execute(
+                text('DELETE FROM agg_lifecycle_counts WHERE freq = :freq AND period >= :since;'),
+                {'freq': freq, 'since': period_since}
+            )
+            conn.execute(
+                build_refresh_statement(freq = freq),
+                {'freq': freq, 'since': period_since}
+            )
+
+    logger.info(f'Lifecycle store refreshed from {since} in {time.time() - start_time:.2f}s.')
+
+def query_lifecycle_counts(
+        conn,
+        freq,
+        start_date,
+        end_date,
+        user_countries,
+        user_sources
+):
+    """Reads user counts per period from the lifecycle store, summed over
+    the selected user segments.
+
+    Parameters
+    ----------
+    conn : sqlalchemy.engine.Connection
+        sqlalchemy connection instance.
+    freq : str
+        Metric frequency string. Valid options are
+        'D' (daily), 'W' (weekly), 'M' (monthly).
+    start_date : str
+        Range start date (inclusive), formatted as YYYY-MM-DD.
+    end_date : str
+        Range end date (inclusive), formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+
+    Returns
+    -------
+    counts : pd.DataFrame
+        DataFrame with `period`, `active`, `retained`, `active_new` and
+        `retained_new` columns, ordered by period.
+    """
+
+    stmt = text(f"""
+        SELECT
+            period,
+            SUM(active) AS active,
+            SUM(retained) AS retained,
+            SUM(active_new) AS active_new,
+            SUM(retained_new) AS retained_new
+        FROM agg_lifecycle_counts
+        WHERE
+            freq = :freq
+            AND
+            period BETWEEN :start_date AND :end_date
+            AND
+            {COUNTRY} = ANY(:countries)
+            AND
+            {UTM_SOURCE} = ANY(:utm_sources)
+        GROUP BY period
+        ORDER BY period
+    """).bindparams(
+        bindparam('countries', type_ = ARRAY(Text)),
+        bindparam('utm_sources', type_ = ARRAY(Text))
+    )
+
+    counts = pd.DataFrame(
+        conn.execute(
+            stmt,
+            {
+                'freq': freq,
+                'start_date': start_date,
+                'end_date': end_date,
+                'countries': sorted(user_countries),
+                'utm_sources': sorted(user_sources)
+            }
+        ).fetchall(),
+        columns = ['period', 'active', 'retained', 'active_new', 'retained_new']
+    )
+
+    return counts
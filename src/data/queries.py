@@ -0,0 +1,179 @@
+"""SQLAlchemy Core table definitions and query builders for reading
+ingested data."""
+
+from sqlalchemy import Column, Date, DateTime, MetaData, Numeric, Table, Text, \
+    any_, bindparam, cast, select
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from src.config.columns import COUNTRY, EVENT_TIME, EVENT_TYPE, \
+    MILES_AMOUNT, PLATFORM, TRANSACTION_CATEGORY, USER_ID, \
+    UTM_SOURCE, VERSION_TIME
+from src.config.filters import COUNTRIES, EVENT_TYPES, UTM_SOURCES
+
+METADATA = MetaData()
+
+DIM_USERS = Table(
+    'dim_users',
+    METADATA,
+    Column(USER_ID, Text, primary_key = True),
+    Column(UTM_SOURCE, Text),
+    Column(COUNTRY, Text),
+    Column(VERSION_TIME, DateTime)
+)
+
+FCT_EVENTS = Table(
+    'fct_events',
+    METADATA,
+    Column(EVENT_TIME, DateTime, primary_key = True),
+    Column(USER_ID, Text, primary_key = True),
+    Column(EVENT_TYPE, Text),
+    Column(TRANSACTION_CATEGORY, Text),
+    Column(MILES_AMOUNT, Numeric),
+    Column(PLATFORM, Text)
+)
+
+AGG_DAILY_USER_ACTIVITY = Table(
+    'agg_daily_user_activity',
+    METADATA,
+    Column('activity_date', Date, primary_key = True),
+    Column(USER_ID, Text, primary_key = True),
+    Column(EVENT_TYPE, Text, primary_key = True)
+)
+
+def in_array(
+        column,
+        param_name,
+        values,
+        domain
+):
+    """Builds a `column = ANY(:param)` predicate with the values bound as
+    a single array parameter, so that the statement text does not depend
+    on the number of selected values.
+
+    Parameters
+    ----------
+    column : sqlalchemy.Column
+        Column to filter.
+    param_name : str
+        Bind parameter name.
+    values : list
+        Selected values.
+    domain : list
+        All possible values of the column.
+
+    Returns
+    -------
+    predicate : sqlalchemy.sql.ColumnElement
+        Filter predicate, or None if all values in the domain are
+        selected and the predicate can be dropped.
+    """
+
+    if set(domain).issubset(values):
+        return None
+
+    return column == any_(
+        bindparam(
+            param_name,
+            value = sorted(values),
+            type_ = ARRAY(Text)
+        )
+    )
+
+def build_filters(
+        *predicates
+):
+    """Gets the list of predicates to filter on, skipping pruned (None)
+    predicates."""
+
+    return [predicate for predicate in predicates if predicate is not None]
+
+def build_plotting_data_query(
+        start_date,
+        end_date,
+        user_countries,
+        user_sources,
+        user_activity,
+        source = 'events'
+):
+    """Builds a query for the user activity needed by the metrics
+    functions, i.e. `event_time`, `user_id` and `version_time`.
+
+    Filter values are bound as parameters, and filters which select
+    every value in their domain are dropped.
+
+    Binding keeps the statement text independent of the selection, so
+    sqlalchemy's compiled statement cache is reused when the query is run
+    with `conn.execute` (e.g. by `METRICS_ENGINE=database`). Plotting
+    data is fetched through `COPY` instead (see `src.data.fetch`), which
+    renders the values into the query and compiles it on every call, so
+    this reuse does not apply to plotting data reads. Neither path lets
+    postgreSQL reuse plans, as psycopg2 always renders parameters into
+    the query text before sending it.
+
+    Parameters
+    ----------
+    start_date : str
+        Query start date (inclusive), formatted as YYYY-MM-DD.
+    end_date : str
+        Query end date (exclusive), formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+    source : str
+        Data source to read. Valid options are 'events' (raw events in
+        `fct_events`) and 'rollup' (distinct daily user activity in
+        `agg_daily_user_activity`). Default is 'events'.
+
+    Returns
+    -------
+    stmt : sqlalchemy.sql.Select
+        Query statement.
+    """
+
+    if source == 'events':
+        activity = select(
+            FCT_EVENTS.c[EVENT_TIME],
+            FCT_EVENTS.c[USER_ID]
+        ).where(
+            *build_filters(
+                FCT_EVENTS.c[EVENT_TIME] >= bindparam('start_date', value = start_date, type_ = DateTime),
+                FCT_EVENTS.c[EVENT_TIME] < bindparam('end_date', value = end_date, type_ = DateTime),
+                in_array(FCT_EVENTS.c[EVENT_TYPE], 'event_types', user_activity, EVENT_TYPES)
+            )
+        ).subquery('activity')
+
+    elif source == 'rollup':
+        activity_date = AGG_DAILY_USER_ACTIVITY.c.activity_date
+        activity = select(
+            cast(activity_date, DateTime).label(EVENT_TIME),
+            AGG_DAILY_USER_ACTIVITY.c[USER_ID]
+        ).distinct().where(
+            *build_filters(
+                activity_date >= bindparam('start_date', value = start_date, type_ = Date),
+                activity_date < bindparam('end_date', value = end_date, type_ = Date),
+                in_array(AGG_DAILY_USER_ACTIVITY.c[EVENT_TYPE], 'event_types', user_activity, EVENT_TYPES)
+            )
+        ).subquery('activity')
+
+    else:
+        raise ValueError(f'Invalid data source - {source}')
+
+    stmt = select(
+        activity.c[EVENT_TIME],
+        activity.c[USER_ID],
+        DIM_USERS.c[VERSION_TIME]
+    ).join_from(
+        activity,
+        DIM_USERS,
+        activity.c[USER_ID] == DIM_USERS.c[USER_ID]
+    ).where(
+        *build_filters(
+            in_array(DIM_USERS.c[COUNTRY], 'countries', user_countries, COUNTRIES),
+            in_array(DIM_USERS.c[UTM_SOURCE], 'utm_sources', user_sources, UTM_SOURCES)
+        )
+    )
+
+    return stmt
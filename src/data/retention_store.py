@@ -0,0 +1,310 @@
+"""Functions for maintaining and reading the incremental retention store,
+which holds retained user counts per cohort period and event period for
+each frequency, retention type and user segment (country, utm_source)."""
+
+import logging
+import pandas as pd
+import time
+
+from sqlalchemy import Text, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from src.config.columns import COUNTRY, USER_ID, UTM_SOURCE, VERSION_TIME
+from src.metrics.database import FREQUENCY_UNITS, get_frequency_unit
+
+logger = logging.getLogger('ingestion_ppl_logger')
+
+RETENTION_TYPES = ('all_activity', 'new_activity', 'signup')
+
+# cohort period expressions of each retention type, over user periods
+COHORT_PERIODS = {
+    'all_activity': 'cohorts.period',
+    'new_activity': 'MIN(user_periods.period) OVER (PARTITION BY user_periods.user_id)',
+    'signup': 'user_periods.signup_period'
+}
+
+def create_retention_store_tables(
+        engine
+):
+    """Creates the `agg_retention_counts` table if it does not exist.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+
+    Returns
+    -------
+    None
+    """
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS agg_retention_counts (
+                freq TEXT NOT NULL,
+                retention_type TEXT NOT NULL,
+                {COUNTRY} TEXT NOT NULL,
+                {UTM_SOURCE} TEXT NOT NULL,
+                cohort_period DATE NOT NULL,
+                event_period DATE NOT NULL,
+                users INTEGER NOT NULL,
+                PRIMARY KEY (freq, retention_type, {COUNTRY}, {UTM_SOURCE}, cohort_period, event_period)
+            );
+        """))
+
+def build_refresh_statement(
+        freq,
+        retention_type
+):
+    """Builds a statement which inserts retained user counts for all cells
+    with an event period on or after `:since`, computed only from users
+    active since the start of that period.
+
+    Parameters
+    ----------
+    freq : str
+        Retention frequency.
+        Valid options are 'D' (daily), 'W' (weekly), 'M' (monthly).
+    retention_type : str
+        Type of retention.
+        Valid options are 'all_activity', 'new_activity', 'signup'.
+
+    Returns
+    -------
+    stmt : sqlalchemy.sql.TextClause
+        Insert statement.
+    """
+
+    if retention_type not in COHORT_PERIODS:
+        raise ValueError(f'Invalid retention type - {retention_type}')
+
+    unit = get_frequency_unit(freq)
+
+    # every period is a cohort of its active users for all activity retention
+    cohorts_join = """
+                JOIN user_periods AS cohorts
+                ON cohorts.user_id = user_periods.user_id
+                AND cohorts.period <= user_periods.period
+    """ if retention_type == 'all_activity' else ''
+
+    stmt = text(f"""
+        WITH touched_users AS (
+            SELECT DISTINCT {USER_ID}
+            FROM agg_daily_user_activity
+            WHERE activity_date >= :since
+        ),
+        user_periods AS (
+            SELECT DISTINCT
+                a.{USER_ID} AS user_id,
+                DATE_TRUNC('{unit}', a.activity_date)::DATE AS period,
+                DATE_TRUNC('{unit}', u.{VERSION_TIME})::DATE AS signup_period,
+                u.{COUNTRY} AS country,
+                u.{UTM_SOURCE} AS utm_source
+            FROM agg_daily_user_activity AS a
+            JOIN touched_users AS t ON t.{USER_ID} = a.{USER_ID}
+            JOIN dim_users AS u ON u.{USER_ID} = a.{USER_ID}
+        ),
+        user_cohorts AS (
+            SELECT
+                user_periods.user_id,
+                user_periods.country,
+                user_periods.utm_source,
+                {COHORT_PERIODS[retention_type]} AS cohort_period,
+                user_periods.period AS event_period
+            FROM user_periods
+            {cohorts_join}
+        )
+        INSERT INTO agg_retention_counts
+            (freq, retention_type, {COUNTRY}, {UTM_SOURCE}, cohort_period, event_period, users)
+        SELECT
+            :freq,
+            :retention_type,
+            country,
+            utm_source,
+            cohort_period,
+            event_period,
+            COUNT(DISTINCT user_id)
+        FROM user_cohorts
+        WHERE event_period >= :since
+        GROUP BY country, utm_source, cohort_period, event_period;
+    """)
+
+    return stmt
+
+def refresh_retention_store(
+        engine,
+        months = None
+):
+    """Refreshes the retention store after new events are loaded.
+
+    Only cells with an event period on or after the earliest period
+    containing new events can change, so only those cells are deleted and
+    recomputed, from the activity of users active since that period.
+
+    Requires the `agg_daily_user_activity` rollup to be up to date.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    months : set
+        Months (formatted as `YYYY_MM`) with new events. If None, or if
+        the store is empty, the store is rebuilt for all periods.
+        Default is None.
+
+    Returns
+    -------
+    None
+    """
+
+    start_time = time.time()
+
+    with engine.begin() as conn:
+
+        is_empty = conn.execute(text('SELECT NOT EXISTS (SELECT 1 FROM agg_retention_counts)')).scalar()
+        if months is None or is_empty:
+            since = conn.execute(text('SELECT MIN(activity_date) FROM agg_daily_user_activity')).scalar()
+        elif months:
+            since = pd.to_datetime(min(months), format = '%Y_%m').date()
+        else:
+            since = None
+
+        if since is None:
+            logger.info('No new activity to add to the retention store.')
+            return
+
+        for freq in FREQUENCY_UNITS:
+
+            # start of the earliest affected period
+            period_since = pd.Period(since, freq = freq).start_time.date()
+
+            for retention_type in RETENTION_TYPES:
+
+                conn.execute(
+                    text("""
+                    DELETE FROM agg_retention_counts
+                    WHERE
+                        freq = :freq
+                        AND
+                        retention_type = :retention_type
+                        AND
+                        event_period >= :since;
+                    """),
+                    {'freq': freq, 'retention_type': retention_type, 'since': period_since}
+                )
+                conn.execute(
+                    build_refresh_statement(
+                        freq = freq,
+                        retention_type = retention_type
+                    ),
+                    {'freq': freq, 'retention_type': retention_type, 'since': period_since}
+                )
+
+    logger.info(f'Retention store refreshed from {since} in {time.time() - start_time:.2f}s.')
+
+def is_period_aligned(
+        start_date,
+        end_date,
+        freq
+):
+    """Checks if a date range covers whole periods of a frequency, so that
+    stored retention counts (computed over whole periods) can be used.
+
+    Parameters
+    ----------
+    start_date : str
+        Range start date (inclusive), formatted as YYYY-MM-DD.
+    end_date : str
+        Range end date (inclusive), formatted as YYYY-MM-DD.
+    freq : str
+        Retention frequency.
+        Valid options are 'D' (daily), 'W' (weekly), 'M' (monthly).
+
+    Returns
+    -------
+    is_aligned : bool
+        Whether the range starts and ends on period boundaries.
+    """
+
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+
+    return start_date == start_date.to_period(freq).start_time \
+        and end_date == end_date.to_period(freq).end_time.normalize()
+
+def query_retention_counts(
+        conn,
+        freq,
+        retention_type,
+        start_date,
+        end_date,
+        user_countries,
+        user_sources
+):
+    """Reads retained user counts per cohort period and event period from
+    the retention store, summed over the selected user segments.
+
+    Parameters
+    ----------
+    conn : sqlalchemy.engine.Connection
+        sqlalchemy connection instance.
+    freq : str
+        Retention frequency.
+        Valid options are 'D' (daily), 'W' (weekly), 'M' (monthly).
+    retention_type : str
+        Type of retention.
+        Valid options are 'all_activity', 'new_activity', 'signup'.
+    start_date : str
+        Range start date (inclusive), formatted as YYYY-MM-DD.
+    end_date : str
+        Range end date (inclusive), formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+
+    Returns
+    -------
+    counts : pd.DataFrame
+        DataFrame with `cohort_period`, `event_period` and `users` columns.
+    """
+
+    # all activity cohorts are periods of activity, so must be in range too
+    cohort_filter = 'cohort_period >= :start_date AND' if retention_type == 'all_activity' else ''
+
+    stmt = text(f"""
+        SELECT cohort_period, event_period, SUM(users) AS users
+        FROM agg_retention_counts
+        WHERE
+            freq = :freq
+            AND
+            retention_type = :retention_type
+            AND
+            event_period BETWEEN :start_date AND :end_date
+            AND
+            {cohort_filter}
+            {COUNTRY} = ANY(:countries)
+            AND
+            {UTM_SOURCE} = ANY(:utm_sources)
+        GROUP BY cohort_period, event_period
+    """).bindparams(
+        bindparam('countries', type_ = ARRAY(Text)),
+        bindparam('utm_sources', type_ = ARRAY(Text))
+    )
+
+    counts = pd.DataFrame(
+        conn.execute(
+            stmt,
+            {
+                'freq': freq,
+                'retention_type': retention_type,
+                'start_date': start_date,
+                'end_date': end_date,
+                'countries': sorted(user_countries),
+                'utm_sources': sorted(user_sources)
+            }
+        ).fetchall(),
+        columns = ['cohort_period', 'event_period', 'users']
+    )
+
+    return counts
@@ -0,0 +1,131 @@
+"""Functions for maintaining pre-aggregated daily rollup tables."""
+
+import logging
+
+from sqlalchemy import text
+
+from src.config.columns import EVENT_TIME, EVENT_TYPE, USER_ID
+
+logger = logging.getLogger('ingestion_ppl_logger')
+
+def create_rollup_tables(
+        engine
+):
+    """Creates the `agg_daily_user_activity` rollup table if it does not
+    exist.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+
+    Returns
+    -------
+    None
+    """
+
+    with engine.begin() as conn:
+
+        # Create distinct daily user activity table
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS agg_daily_user_activity (
+                activity_date DATE NOT NULL,
+                user_id TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                PRIMARY KEY (activity_date, user_id, event_type)
+            );
+        """))
+
+def get_event_months(
+        engine
+):
+    """Gets all months with events in `fct_events`.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+
+    Returns
+    -------
+    months : set
+        Months formatted as `YYYY_MM`.
+    """
+
+    with engine.connect() as conn:
+        result = conn.execute(text(f"""
+            SELECT DISTINCT TO_CHAR({EVENT_TIME}, 'YYYY_MM') AS month
+            FROM fct_events
+        """))
+        months = {row.month for row in result}
+
+    return months
+
+def refresh_month_rollups(
+        engine,
+        month
+):
+    """Refreshes rollup tables for a single month of events. Daily user
+    activity is appended, as events are never deleted.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    month : str
+        Month formatted as `YYYY_MM`.
+
+    Returns
+    -------
+    None
+    """
+
+    params = {'month': month}
+    month_start = "TO_DATE(:month, 'YYYY_MM')"
+    month_end = f"({month_start} + INTERVAL '1 month')"
+
+    with engine.begin() as conn:
+
+        conn.execute(
+            text(f"""
+            INSERT INTO agg_daily_user_activity (activity_date, {USER_ID}, {EVENT_TYPE})
+            SELECT DISTINCT {EVENT_TIME}::DATE, {USER_ID}, {EVENT_TYPE}
+            FROM fct_events
+            WHERE
+                {EVENT_TIME} >= {month_start}
+                AND
+                {EVENT_TIME} < {month_end}
+            ON CONFLICT DO NOTHING;
+            """),
+            params
+        )
+
+def refresh_rollups(
+        engine,
+        months = None
+):
+    """Refreshes rollup tables for newly loaded months of events.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    months : set
+        Months (formatted as `YYYY_MM`) to refresh. If None, rollups are
+        rebuilt for all months in `fct_events`. Default is None.
+
+    Returns
+    -------
+    None
+    """
+
+    if months is None:
+        months = get_event_months(engine)
+
+    for month in sorted(months):
+        refresh_month_rollups(
+            engine = engine,
+            month = month
+        )
+
+    logger.info(f'Rollup tables refreshed for {len(months)} months.')
@@ -0,0 +1,416 @@
+"""Parquet snapshots of ingested data, exported by the ingestion pipeline
+and queried in-process with DuckDB as an alternative read backend to
+postgreSQL."""
+
+import json
+import logging
+import os
+import tempfile
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dotenv import load_dotenv
+from pyarrow import csv
+from sqlalchemy import text
+
+from src.config.columns import COUNTRY, EVENT_TIME, EVENT_TYPE, MILES_AMOUNT, \
+    PLATFORM, TRANSACTION_CATEGORY, USER_ID, UTM_SOURCE, VERSION_TIME
+from src.config.filepaths import SNAPSHOTS_DIR
+from src.config.filters import COUNTRIES, EVENT_TYPES, UTM_SOURCES
+from src.data.fetch import SPOOL_MAX_BYTES, copy_query, get_convert_options
+from src.data.rollups import get_event_months
+
+load_dotenv()
+
+logger = logging.getLogger('ingestion_ppl_logger')
+
+# 'postgres' reads plotting data from postgreSQL, 'parquet' reads Parquet
+# snapshots with DuckDB, which the ingestion pipeline then exports
+DATA_BACKEND = os.getenv('DATA_BACKEND', 'postgres')
+
+FCT_EVENTS_SNAPSHOT_TYPES = {
+    EVENT_TIME: pa.timestamp('us'),
+    USER_ID: pa.string(),
+    EVENT_TYPE: pa.string(),
+    TRANSACTION_CATEGORY: pa.string(),
+    MILES_AMOUNT: pa.float64(),
+    PLATFORM: pa.string()
+}
+
+DIM_USERS_SNAPSHOT_TYPES = {
+    USER_ID: pa.string(),
+    UTM_SOURCE: pa.string(),
+    COUNTRY: pa.string(),
+    VERSION_TIME: pa.timestamp('us')
+}
+
+# CSV bytes parsed per parquet row group, whose `event_time` statistics let
+# DuckDB skip row groups outside the queried date range
+BLOCK_SIZE = 2**26
+
+def get_partition_dir(
+        directory = SNAPSHOTS_DIR
+):
+    """Gets the snapshot directory of monthly `fct_events` partitions."""
+
+    return os.path.join(directory, 'fct_events')
+
+def get_partition_filepath(
+        month,
+        directory = SNAPSHOTS_DIR
+):
+    """Gets the snapshot filepath of a monthly `fct_events` partition.
+
+    Parameters
+    ----------
+    month : str
+        Month formatted as `YYYY_MM`.
+    directory : str
+        Snapshot directory. Default is `SNAPSHOTS_DIR`.
+
+    Returns
+    -------
+    filepath : str
+        Parquet filepath.
+    """
+
+    return os.path.join(get_partition_dir(directory), f'fct_events_{month}.parquet')
+
+def get_dim_users_filepath(
+        directory = SNAPSHOTS_DIR
+):
+    """Gets the snapshot filepath of `dim_users`."""
+
+    return os.path.join(directory, 'dim_users.parquet')
+
+def get_manifest_filepath(
+        directory = SNAPSHOTS_DIR
+):
+    """Gets the filepath of the snapshot manifest, which records the data
+    version of the latest export."""
+
+    return os.path.join(directory, 'manifest.json')
+
+def export_table(
+        engine,
+        stmt,
+        column_types,
+        filepath
+):
+    """Exports query results to a Parquet file with bounded memory.
+
+    Results are spooled through `COPY (query) TO STDOUT`, parsed
+    incrementally and written to a temporary file, which then replaces
+    `filepath` so that readers never see a partially written file.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    stmt : sqlalchemy.sql.Executable
+        Query statement.
+    column_types : dict
+        Mapping of result column names to pyarrow types.
+    filepath : str
+        Output .parquet filepath.
+
+    Returns
+    -------
+    n_rows : int
+        Number of rows written.
+    """
+
+    os.makedirs(os.path.dirname(filepath), exist_ok = True)
+    schema = pa.schema(column_types.items())
+    tmp_filepath = f'{filepath}.tmp'
+
+    n_rows = 0
+    with tempfile.SpooledTemporaryFile(max_size = SPOOL_MAX_BYTES) as buffer:
+        copy_query(
+            engine = engine,
+            stmt = stmt,
+            buffer = buffer
+        )
+
+        reader = csv.open_csv(
+            buffer,
+            read_options = csv.ReadOptions(block_size = BLOCK_SIZE),
+            convert_options = get_convert_options(column_types)
+        )
+        with pq.ParquetWriter(tmp_filepath, schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch.cast(schema))
+                n_rows += batch.num_rows
+
+    os.replace(tmp_filepath, filepath)
+
+    return n_rows
+
+def export_snapshots(
+        engine,
+        months = None,
+        directory = SNAPSHOTS_DIR
+):
+    """Exports monthly `fct_events` partitions and `dim_users` to Parquet
+    snapshots, then records the current data version in the manifest.
+
+    Partitions are exported sorted by `event_time`, one file per month,
+    so that queries only read files and row groups in their date range.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        sqlalchemy engine instance.
+    months : set
+        Months (formatted as `YYYY_MM`) of partitions to export. If None,
+        or if no snapshot has been exported yet, all partitions are
+        exported. Default is None.
+    directory : str
+        Snapshot directory. Default is `SNAPSHOTS_DIR`.
+
+    Returns
+    -------
+    None
+    """
+
+    if months is None or not os.path.exists(get_manifest_filepath(directory)):
+        months = get_event_months(engine)
+
+    columns = ', '.join(FCT_EVENTS_SNAPSHOT_TYPES)
+    for month in sorted(months):
+        n_rows = export_table(
+            engine = engine,
+            stmt = text(f'SELECT {columns} FROM fct_events_{month} ORDER BY {EVENT_TIME}'),
+            column_types = FCT_EVENTS_SNAPSHOT_TYPES,
+            filepath = get_partition_filepath(month, directory)
+        )
+        logger.info(f'Exported {n_rows} rows of partition fct_events_{month} to snapshot.')
+
+    columns = ', '.join(DIM_USERS_SNAPSHOT_TYPES)
+    n_rows = export_table(
+        engine = engine,
+        stmt = text(f'SELECT {columns} FROM dim_users'),
+        column_types = DIM_USERS_SNAPSHOT_TYPES,
+        filepath = get_dim_users_filepath(directory)
+    )
+    logger.info(f'Exported {n_rows} rows of dim_users to snapshot.')
+
+    with engine.connect() as conn:
+        version = conn.execute(text('SELECT version FROM data_version WHERE id = 1')).scalar()
+
+    # the manifest is written last, so its version never runs ahead of the files
+    tmp_filepath = f'{get_manifest_filepath(directory)}.tmp'
+    with open(tmp_filepath, 'w') as f:
+        json.dump({'version': version or 0}, f)
+    os.replace(tmp_filepath, get_manifest_filepath(directory))
+
+    logger.info(f'Parquet snapshots exported for {len(months)} months (data version {version}).')
+
+def get_snapshot_version(
+        directory = SNAPSHOTS_DIR
+):
+    """Gets the data version of the latest snapshot export.
+
+    Parameters
+    ----------
+    directory : str
+        Snapshot directory. Default is `SNAPSHOTS_DIR`.
+
+    Returns
+    -------
+    version : int
+        Data version, or 0 if no snapshot has been exported.
+    """
+
+    try:
+        with open(get_manifest_filepath(directory)) as f:
+            return json.load(f)['version']
+    except FileNotFoundError:
+        return 0
+
+def get_partition_filepaths(
+        start_date = None,
+        end_date = None,
+        directory = SNAPSHOTS_DIR
+):
+    """Gets the snapshot filepaths of partitions overlapping a date range.
+
+    Parameters
+    ----------
+    start_date : str
+        Start date (inclusive), formatted as YYYY-MM-DD. If None, the
+        range is not bounded below. Default is None.
+    end_date : str
+        End date (exclusive), formatted as YYYY-MM-DD. If None, the
+        range is not bounded above. Default is None.
+    directory : str
+        Snapshot directory. Default is `SNAPSHOTS_DIR`.
+
+    Returns
+    -------
+    filepaths : list
+        Sorted filepaths of exported partitions in the range.
+    """
+
+    partition_dir = get_partition_dir(directory)
+    if not os.path.isdir(partition_dir):
+        return []
+
+    # partition files are named fct_events_YYYY_MM.parquet
+    months = sorted(
+        filename[len('fct_events_'):-len('.parquet')]
+        for filename in os.listdir(partition_dir)
+        if filename.startswith('fct_events_') and filename.endswith('.parquet')
+    )
+    if start_date is not None:
+        months = [month for month in months if month >= pd.Timestamp(start_date).strftime('%Y_%m')]
+    if end_date is not None:
+        last_month = (pd.Timestamp(end_date) - pd.Timedelta(microseconds = 1)).strftime('%Y_%m')
+        months = [month for month in months if month <= last_month]
+
+    return [get_partition_filepath(month, directory) for month in months]
+
+def to_sql_list(
+        filepaths
+):
+    """Formats filepaths as a DuckDB list literal."""
+
+    return '[' + ', '.join("'" + filepath.replace("'", "''") + "'" for filepath in filepaths) + ']'
+
+def to_where_clause(
+        filters
+):
+    """Joins filter predicates into a WHERE clause, which is empty if there
+    are no predicates."""
+
+    return f"WHERE {' AND '.join(filters)}" if filters else ''
+
+def query_snapshot_plotting_data(
+        start_date,
+        end_date,
+        user_countries,
+        user_sources,
+        user_activity,
+        column_types,
+        source = 'events',
+        directory = SNAPSHOTS_DIR
+):
+    """Queries the user activity needed by the metrics functions from
+    Parquet snapshots, as `build_plotting_data_query` does from postgreSQL.
+
+    Only partitions in the date range are read, only the queried columns
+    are decoded, and filters which select every value in their domain
+    are dropped.
+
+    Parameters
+    ----------
+    start_date : str
+        Query start date (inclusive), formatted as YYYY-MM-DD.
+    end_date : str
+        Query end date (exclusive), formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+    column_types : dict
+        Mapping of result column names to pyarrow types.
+    source : str
+        Activity to read. Valid options are 'events' (raw events) and
+        'rollup' (distinct daily user activity, with `event_time` at day
+        resolution). Default is 'events'.
+    directory : str
+        Snapshot directory. Default is `SNAPSHOTS_DIR`.
+
+    Returns
+    -------
+    table : pa.Table
+        Query results with `column_types` columns.
+    """
+
+    if source == 'events':
+        activity_columns = f'{EVENT_TIME}, {USER_ID}'
+    elif source == 'rollup':
+        activity_columns = f'DISTINCT CAST(CAST({EVENT_TIME} AS DATE) AS TIMESTAMP) AS {EVENT_TIME}, {USER_ID}'
+    else:
+        raise ValueError(f'Invalid data source - {source}')
+
+    schema = pa.schema(column_types.items())
+    filepaths = get_partition_filepaths(
+        start_date = start_date,
+        end_date = end_date,
+        directory = directory
+    )
+    if not filepaths:
+        return schema.empty_table()
+
+    params = {
+        'start_date': start_date,
+        'end_date': end_date
+    }
+    activity_filters = [
+        f'{EVENT_TIME} >= CAST($start_date AS TIMESTAMP)',
+        f'{EVENT_TIME} < CAST($end_date AS TIMESTAMP)'
+    ]
+    user_filters = []
+    for column, param_name, values, domain, filters in (
+        (EVENT_TYPE, 'event_types', user_activity, EVENT_TYPES, activity_filters),
+        (COUNTRY, 'countries', user_countries, COUNTRIES, user_filters),
+        (UTM_SOURCE, 'utm_sources', user_sources, UTM_SOURCES, user_filters)
+    ):
+        if not set(domain).issubset(values):
+            filters.append(f'list_contains(${param_name}, {column})')
+            params[param_name] = sorted(values)
+
+    sql = f"""
+        WITH activity AS (
+            SELECT {activity_columns}
+            FROM read_parquet({to_sql_list(filepaths)})
+            {to_where_clause(activity_filters)}
+        )
+        SELECT activity.{EVENT_TIME}, activity.{USER_ID}, users.{VERSION_TIME}
+        FROM activity
+        JOIN read_parquet({to_sql_list([get_dim_users_filepath(directory)])}) AS users
+            ON activity.{USER_ID} = users.{USER_ID}
+        {to_where_clause(user_filters)}
+    """
+
+    with duckdb.connect() as conn:
+        table = conn.execute(sql, params).to_arrow_table()
+
+    return table.cast(schema)
+
+def query_snapshot_date_range(
+        directory = SNAPSHOTS_DIR
+):
+    """Gets the first and last event times in Parquet snapshots, read from
+    Parquet column statistics where possible.
+
+    Parameters
+    ----------
+    directory : str
+        Snapshot directory. Default is `SNAPSHOTS_DIR`.
+
+    Returns
+    -------
+    min_date : pd.Timestamp
+        First event time, or None if no snapshot has been exported.
+    max_date : pd.Timestamp
+        Last event time, or None if no snapshot has been exported.
+    """
+
+    filepaths = get_partition_filepaths(directory = directory)
+    if not filepaths:
+        return None, None
+
+    with duckdb.connect() as conn:
+        min_date, max_date = conn.execute(f"""
+            SELECT MIN({EVENT_TIME}), MAX({EVENT_TIME})
+            FROM read_parquet({to_sql_list(filepaths)})
+        """).fetchone()
+
+    return pd.Timestamp(min_date), pd.Timestamp(max_date)
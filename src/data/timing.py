@@ -0,0 +1,55 @@
+"""Per-stage wall time accounting for the ingestion pipeline."""
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+class StageTimings:
+    """Thread-safe accumulator of wall time spent in named pipeline stages.
+
+    Stages may run in several threads at once (e.g. concurrent partition
+    loads), in which case their times are summed across threads.
+    """
+
+    def __init__(self):
+        self._seconds = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(
+            self,
+            name
+    ):
+        """Context manager adding the wall time of its block to a stage.
+
+        Parameters
+        ----------
+        name : str
+            Stage name, e.g. 'parse', 'dedup', 'partition_ddl', 'write'.
+        """
+
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            with self._lock:
+                self._seconds[name] = self._seconds.get(name, 0.0) + elapsed
+
+    def reset(self):
+        """Clears all recorded stage times."""
+
+        with self._lock:
+            self._seconds = {}
+
+    def as_dict(self):
+        """Gets recorded stage times in seconds, in order of first use."""
+
+        with self._lock:
+            return dict(self._seconds)
+
+    def __str__(self):
+        return ', '.join(f'{name} {seconds:.2f}s' for name, seconds in self.as_dict().items())
+
+STAGE_TIMINGS = StageTimings()
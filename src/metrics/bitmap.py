@@ -0,0 +1,183 @@
+"""Bitmap index of active users per period for user set algebra."""
+
+import numpy as np
+
+WORD_BITS = 64
+
+class UserBitmapIndex:
+    """Compact bitmap index over dense integer user codes, with one bitset
+    of `n_users` bits per period stored as rows of uint64 words.
+
+    Set operations between indexes (intersection, difference, union) are
+    applied period-wise as word-level bitwise operations, and set sizes are
+    obtained with a vectorized popcount.
+
+    Parameters
+    ----------
+    words : np.ndarray
+        `n_periods` x `n_words` uint64 array of user bitsets.
+    n_users : int
+        Number of users (bits) represented in each bitset.
+    """
+
+    def __init__(
+            self,
+            words,
+            n_users
+    ):
+        self.words = words
+        self.n_users = n_users
+
+    @classmethod
+    def from_codes(
+            cls,
+            user_codes,
+            period_codes,
+            n_users,
+            n_periods
+    ):
+        """Builds a bitmap index from paired user and period codes.
+
+        Parameters
+        ----------
+        user_codes : np.ndarray
+            Integer user codes in the range [0, n_users).
+        period_codes : np.ndarray
+            Integer period codes in the range [0, n_periods). Negative
+            period codes are ignored.
+        n_users : int
+            Total number of users.
+        n_periods : int
+            Total number of periods.
+
+        Returns
+        -------
+        index : UserBitmapIndex
+            Bitmap index with one bitset per period.
+        """
+
+        user_codes = np.asarray(user_codes, dtype = np.int64)
+        period_codes = np.asarray(period_codes, dtype = np.int64)
+        valid = period_codes >= 0
+
+        n_words = -(-n_users // WORD_BITS)
+        words = np.zeros((n_periods, n_words), dtype = np.uint64)
+
+        # unique bits sorted by flat word position, OR-reduced into their words
+        bit_keys = np.unique(period_codes[valid] * n_words * WORD_BITS + user_codes[valid])
+        word_keys = bit_keys // WORD_BITS
+        bit_values = np.left_shift(
+            np.uint64(1),
+            (bit_keys % WORD_BITS).astype(np.uint64)
+        )
+
+        if bit_keys.shape[0] > 0:
+            word_starts = np.flatnonzero(np.r_[True, word_keys[1:] != word_keys[:-1]])
+            words.ravel()[word_keys[word_starts]] = np.bitwise_or.reduceat(bit_values, word_starts)
+
+        return cls(
+            words = words,
+            n_users = n_users
+        )
+
+    @property
+    def n_periods(self):
+        return self.words.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def popcount(self):
+        """Counts the number of users in each period's bitset.
+
+        Returns
+        -------
+        counts : np.ndarray
+            int64 array of user counts per period.
+        """
+
+        return np.bitwise_count(self.words).sum(
+            axis = 1,
+            dtype = np.int64
+        )
+
+    def intersect(
+            self,
+            other
+    ):
+        """Period-wise intersection (users in both indexes)."""
+
+        return UserBitmapIndex(
+            words = self.words & other.words,
+            n_users = self.n_users
+        )
+
+    def difference(
+            self,
+            other
+    ):
+        """Period-wise difference (users in this index but not `other`)."""
+
+        return UserBitmapIndex(
+            words = self.words & ~other.words,
+            n_users = self.n_users
+        )
+
+    def union(
+            self,
+            other
+    ):
+        """Period-wise union (users in either index)."""
+
+        return UserBitmapIndex(
+            words = self.words | other.words,
+            n_users = self.n_users
+        )
+
+    def shift(
+            self,
+            periods = 1
+    ):
+        """Shifts bitsets forward by `periods`, so that row t holds the
+        bitset of period t - periods. Vacated rows are empty.
+
+        Parameters
+        ----------
+        periods : int
+            Number of periods to shift by. Default is 1.
+
+        Returns
+        -------
+        index : UserBitmapIndex
+            Shifted bitmap index.
+        """
+
+        words = np.zeros_like(self.words)
+        if periods < self.n_periods:
+            words[periods:] = self.words[:self.n_periods - periods]
+
+        return UserBitmapIndex(
+            words = words,
+            n_users = self.n_users
+        )
+
+    def intersection_counts(self):
+        """Counts the number of users shared by every pair of periods.
+
+        Returns
+        -------
+        counts : np.ndarray
+            `n_periods` x `n_periods` symmetric int64 array where
+            counts[i, j] is the number of users in both period i and j.
+        """
+
+        counts = np.zeros((self.n_periods, self.n_periods), dtype = np.int64)
+        for i in range(self.n_periods):
+            counts[i, i:] = np.bitwise_count(self.words[i] & self.words[i:]).sum(
+                axis = 1,
+                dtype = np.int64
+            )
+            counts[i:, i] = counts[i, i:]
+
+        return counts
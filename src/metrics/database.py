@@ -0,0 +1,456 @@
+"""In-database metric computation, returning the same outputs as the
+pandas metric functions while only transferring aggregated counts."""
+
+import numpy as np
+import pandas as pd
+
+from sqlalchemy import DateTime, and_, func, select
+
+from src.config.columns import EVENT_TIME, USER_ID, VERSION_TIME
+from src.metrics.retention import calculate_retention_rates, \
+    pivot_cohort_counts, pivot_overlap_counts
+
+# date_trunc units matching pandas period frequencies, where weeks start
+# on Monday as with pandas 'W' (W-SUN) periods
+FREQUENCY_UNITS = {
+    'D': 'day',
+    'W': 'week',
+    'M': 'month'
+}
+
+def get_frequency_unit(
+        freq
+):
+    """Gets the `date_trunc` unit for a metric frequency string."""
+
+    if freq not in FREQUENCY_UNITS:
+        raise ValueError(f'Invalid frequency - {freq}')
+
+    return FREQUENCY_UNITS[freq]
+
+def build_user_periods(
+        activity,
+        freq
+):
+    """Builds a subquery of distinct (user_id, period, signup_period) rows
+    from a user activity subquery.
+
+    Parameters
+    ----------
+    activity : sqlalchemy.sql.Subquery
+        User activity with `event_time`, `user_id` and `version_time`
+        columns (e.g. from `build_plotting_data_query`).
+    freq : str
+        Metric frequency string. Valid options are
+        'D' (daily), 'W' (weekly), 'M' (monthly).
+
+    Returns
+    -------
+    user_periods : sqlalchemy.sql.Subquery
+        Distinct user activity periods.
+    """
+
+    unit = get_frequency_unit(freq)
+
+    user_periods = select(
+        activity.c[USER_ID],
+        func.date_trunc(unit, activity.c[EVENT_TIME], type_ = DateTime).label('period'),
+        func.date_trunc(unit, activity.c[VERSION_TIME], type_ = DateTime).label('signup_period')
+    ).distinct().subquery('user_periods')
+
+    return user_periods
+
+def build_user_lifecycle_query(
+        activity_query,
+        freq
+):
+    """Builds a query computing new, churned, retained and resurrected
+    users per period, following `calculate_user_lifecycle_metrics`.
+
+    Periods are numbered over periods with activity, so that a user is
+    retained if they were also active in the previous period with
+    activity (found with `LAG` over each user's active periods).
+
+    Parameters
+    ----------
+    activity_query : sqlalchemy.sql.Select
+        User activity query with `event_time`, `user_id` and
+        `version_time` columns (e.g. from `build_plotting_data_query`).
+    freq : str
+        Metric frequency string. Valid options are
+        'D' (daily), 'W' (weekly), 'M' (monthly).
+
+    Returns
+    -------
+    stmt : sqlalchemy.sql.Select
+        Query returning one row per period with activity, with `period`,
+        `new_users`, `churned_users`, `resurrected_users` and
+        `retained_users` columns.
+    """
+
+    user_periods = build_user_periods(
+        activity = activity_query.subquery('activity'),
+        freq = freq
+    )
+
+    # number periods with activity in order
+    distinct_periods = select(user_periods.c.period).distinct().subquery('distinct_periods')
+    active_periods = select(
+        distinct_periods.c.period,
+        func.row_number().over(order_by = distinct_periods.c.period).label('period_idx')
+    ).subquery('active_periods')
+
+    # flag new and retained users in each of their active periods
+    user_activity = select(
+        active_periods.c.period,
+        (user_periods.c.period == user_periods.c.signup_period).label('is_new'),
+        (
+            func.lag(active_periods.c.period_idx).over(
+                partition_by = user_periods.c[USER_ID],
+                order_by = active_periods.c.period_idx
+            ) == active_periods.c.period_idx - 1
+        ).label('is_retained')
+    ).join_from(
+        user_periods,
+        active_periods,
+        user_periods.c.period == active_periods.c.period
+    ).subquery('user_activity')
+
+    period_counts = select(
+        user_activity.c.period,
+        func.count().label('active'),
+        func.count().filter(user_activity.c.is_retained).label('retained'),
+        func.count().filter(user_activity.c.is_new).label('active_new'),
+        func.count().filter(and_(user_activity.c.is_retained, user_activity.c.is_new)).label('retained_new')
+    ).group_by(
+        user_activity.c.period
+    ).subquery('period_counts')
+
+    # signups per period, where signups in periods without activity are dropped
+    signups = select(
+        user_periods.c.signup_period.label('period'),
+        func.count(user_periods.c[USER_ID].distinct()).label('new_users')
+    ).group_by(
+        user_periods.c.signup_period
+    ).subquery('signups')
+
+    stmt = select(
+        period_counts.c.period,
+        func.coalesce(signups.c.new_users, 0).label('new_users'),
+        -func.coalesce(
+            func.lag(period_counts.c.active).over(order_by = period_counts.c.period) - period_counts.c.retained,
+            0
+        ).label('churned_users'),
+        (
+            period_counts.c.active
+            - period_counts.c.active_new
+            - period_counts.c.retained
+            + period_counts.c.retained_new
+        ).label('resurrected_users'),
+        period_counts.c.retained.label('retained_users')
+    ).outerjoin_from(
+        period_counts,
+        signups,
+        period_counts.c.period == signups.c.period
+    ).order_by(
+        period_counts.c.period
+    )
+
+    return stmt
+
+def build_retention_query(
+        activity_query,
+        freq,
+        retention_type
+):
+    """Builds a query counting retained users per cohort period and event
+    period, following `calculate_retention`.
+
+    Parameters
+    ----------
+    activity_query : sqlalchemy.sql.Select
+        User activity query with `event_time`, `user_id` and
+        `version_time` columns (e.g. from `build_plotting_data_query`).
+    freq : str
+        Retention frequency to compute.
+        Valid options are 'D' (daily), 'W' (weekly), 'M' (monthly).
+    retention_type : str
+        Type of retention to compute.
+        Valid options are 'all_activity', 'new_activity', 'signup'.
+
+    Returns
+    -------
+    stmt : sqlalchemy.sql.Select
+        Query returning `cohort_period`, `event_period` and `users`
+        columns, for (cohort, event period) pairs with retained users.
+    """
+
+    user_periods = build_user_periods(
+        activity = activity_query.subquery('activity'),
+        freq = freq
+    )
+
+    if retention_type == 'all_activity':
+
+        # every period is a cohort of its active users, self-joined on
+        # user to their activity in the same or later periods
+        cohorts = user_periods.alias('cohorts')
+        stmt = select(
+            cohorts.c.period.label('cohort_period'),
+            user_periods.c.period.label('event_period'),
+            func.count().label('users')
+        ).join_from(
+            cohorts,
+            user_periods,
+            and_(
+                cohorts.c[USER_ID] == user_periods.c[USER_ID],
+                user_periods.c.period >= cohorts.c.period
+            )
+        ).group_by(
+            cohorts.c.period,
+            user_periods.c.period
+        )
+
+        return stmt
+
+    if retention_type == 'new_activity':
+        cohort_period = func.min(user_periods.c.period).over(partition_by = user_periods.c[USER_ID])
+    elif retention_type == 'signup':
+        cohort_period = user_periods.c.signup_period
+    else:
+        raise ValueError(f'Invalid retention type - {retention_type}')
+
+    user_cohorts = select(
+        user_periods.c[USER_ID],
+        user_periods.c.period,
+        cohort_period.label('cohort_period')
+    ).subquery('user_cohorts')
+
+    stmt = select(
+        user_cohorts.c.cohort_period,
+        user_cohorts.c.period.label('event_period'),
+        func.count(user_cohorts.c[USER_ID].distinct()).label('users')
+    ).group_by(
+        user_cohorts.c.cohort_period,
+        user_cohorts.c.period
+    )
+
+    return stmt
+
+def query_user_lifecycle_metrics(
+        conn,
+        activity_query,
+        freq
+):
+    """Calculates new, churned, retained and resurrected users per period
+    in the database. Output matches `calculate_user_lifecycle_metrics`.
+
+    Parameters
+    ----------
+    conn : sqlalchemy.engine.Connection
+        sqlalchemy connection instance.
+    activity_query : sqlalchemy.sql.Select
+        User activity query with `event_time`, `user_id` and
+        `version_time` columns (e.g. from `build_plotting_data_query`).
+    freq : str
+        Metric frequency string. Valid options are
+        'D' (daily), 'W' (weekly), 'M' (monthly).
+
+    Returns
+    -------
+    user_lifecycle_metrics : pd.DataFrame
+        Time period indexed DataFrame with the following columns:
+        ['new_users', 'churned_users', 'resurrected_users', 'retained_users']
+    """
+
+    stmt = build_user_lifecycle_query(
+        activity_query = activity_query,
+        freq = freq
+    )
+    rows = conn.execute(stmt).fetchall()
+
+    user_lifecycle_metrics = pd.DataFrame(
+        [row[1:] for row in rows],
+        columns = ['new_users', 'churned_users', 'resurrected_users', 'retained_users'],
+        index = pd.DatetimeIndex(
+            [row.period for row in rows],
+            name = 'period'
+        ).as_unit('ns')
+    ).astype(np.int64)
+
+    return user_lifecycle_metrics
+
+def query_retention(
+        conn,
+        activity_query,
+        freq,
+        retention_type
+):
+    """Calculates client retention in the database. Output matches
+    `calculate_retention`.
+
+    Parameters
+    ----------
+    conn : sqlalchemy.engine.Connection
+        sqlalchemy connection instance.
+    activity_query : sqlalchemy.sql.Select
+        User activity query with `event_time`, `user_id` and
+        `version_time` columns (e.g. from `build_plotting_data_query`).
+    freq : str
+        Retention frequency to compute.
+        Valid options are 'D' (daily), 'W' (weekly), 'M' (monthly).
+    retention_type : str
+        Type of retention to compute.
+        Valid options are 'all_activity', 'new_activity', 'signup'.
+
+    Returns
+    -------
+    retention_matrix : pd.DataFrame
+        Retention matrix dataframe containing retention rates
+        where columns are periods since signup / observed
+        activity, indexed by cohort period.
+    """
+
+    stmt = build_retention_query(
+        activity_query = activity_query,
+        freq = freq,
+        retention_type = retention_type
+    )
+    counts = pd.DataFrame(
+        conn.execute(stmt).fetchall(),
+        columns = ['cohort_period', 'event_period', 'users']
+    )
+
+    retention_matrix = calculate_retention_from_counts(
+        counts = counts,
+        freq = freq,
+        retention_type = retention_type
+    )
+
+    return retention_matrix
+
+def calculate_retention_from_counts(
+        counts,
+        freq,
+        retention_type
+):
+    """Calculates a retention matrix from retained user counts per cohort
+    period and event period. Output matches `calculate_retention`.
+
+    Parameters
+    ----------
+    counts : pd.DataFrame
+        DataFrame with `cohort_period` and `event_period` period start
+        dates, and `users` counts, with one row per (cohort, event period)
+        pair with retained users.
+    freq : str
+        Retention frequency.
+        Valid options are 'D' (daily), 'W' (weekly), 'M' (monthly).
+    retention_type : str
+        Type of retention.
+        Valid options are 'all_activity', 'new_activity', 'signup'.
+
+    Returns
+    -------
+    retention_matrix : pd.DataFrame
+        Retention matrix dataframe containing retention rates
+        where columns are periods since signup / observed
+        activity, indexed by cohort period.
+    """
+
+    cohort_periods = pd.PeriodIndex(pd.to_datetime(counts['cohort_period']), freq = freq)
+    cohort_ordinals = cohort_periods.asi8
+    event_periods = pd.PeriodIndex(pd.to_datetime(counts['event_period']), freq = freq)
+    event_ordinals = event_periods.asi8
+
+    # create periods for iteration and reindexing
+    periods = pd.period_range(
+        start = event_periods.min(),
+        end = event_periods.max(),
+        freq = freq
+    )
+
+    if retention_type == 'all_activity':
+
+        overlap = np.zeros((periods.shape[0], periods.shape[0]), dtype = np.int64)
+        overlap[cohort_ordinals - periods[0].ordinal, event_ordinals - periods[0].ordinal] = counts['users']
+
+        cohort_pivot = pivot_overlap_counts(
+            overlap = overlap,
+            periods = periods
+        )
+
+    else:
+
+        cohort_counts = pd.Series(
+            counts['users'].to_numpy(dtype = np.int64),
+            index = pd.MultiIndex.from_arrays(
+                [
+                    cohort_periods,
+                    event_ordinals - cohort_ordinals
+                ],
+                names = ['cohort_period', 'period_number']
+            ),
+            name = USER_ID
+        )
+
+        cohort_pivot = pivot_cohort_counts(
+            cohort_counts = cohort_counts,
+            periods = periods
+        )
+
+    retention_matrix = calculate_retention_rates(cohort_pivot)
+
+    return retention_matrix
+
+def calculate_user_lifecycle_metrics_from_counts(
+        counts
+):
+    """Calculates user lifecycle metrics from active, retained and new
+    user counts per period. Output matches `calculate_user_lifecycle_metrics`
+    for the same periods.
+
+    The first period is treated as the start of the data, so its retained
+    users are counted as resurrected and no users churn into it.
+
+    Parameters
+    ----------
+    counts : pd.DataFrame
+        DataFrame with one row per consecutive period with activity, with
+        `period` start dates, `active` users, `retained` users (also active
+        in the previous period), `active_new` users (who signed up in the
+        period) and `retained_new` users (both retained and new).
+
+    Returns
+    -------
+    user_lifecycle_metrics : pd.DataFrame
+        Time period indexed DataFrame with the following columns:
+        ['new_users', 'churned_users', 'resurrected_users', 'retained_users']
+    """
+
+    active_count = counts['active'].to_numpy(dtype = np.int64)
+    retained_count = counts['retained'].to_numpy(dtype = np.int64).copy()
+    active_new_count = counts['active_new'].to_numpy(dtype = np.int64)
+    retained_new_count = counts['retained_new'].to_numpy(dtype = np.int64).copy()
+
+    # no users are retained from before the first period
+    retained_count[:1] = 0
+    retained_new_count[:1] = 0
+
+    churned_count = np.zeros(active_count.shape[0], dtype = np.int64)
+    churned_count[1:] = active_count[:-1] - retained_count[1:]
+
+    user_lifecycle_metrics = pd.DataFrame(
+        {
+            'new_users': active_new_count,
+            'churned_users': -churned_count,
+            'resurrected_users': active_count - active_new_count - retained_count + retained_new_count,
+            'retained_users': retained_count
+        },
+        index = pd.DatetimeIndex(
+            pd.to_datetime(counts['period']),
+            name = 'period'
+        ).as_unit('ns')
+    ).astype(np.int64)
+
+    return user_lifecycle_metrics
@@ -3,9 +3,13 @@
 import numpy as np
 import pandas as pd
 
+from src.metrics.bitmap import UserBitmapIndex
+from src.metrics.frame import get_period_ordinals, get_user_codes
+
 def calculate_user_lifecycle_metrics(
         df,
-        freq
+        freq,
+        method = 'sort'
 ):
     """Calculates new, churned, retained and resurrected users per period where,
     for a given time period:
@@ -18,11 +22,16 @@ def calculate_user_lifecycle_metrics(
 
     Parameters
     ----------
-    df : pd.DataFrame
-        DataFrame containing user events and their signup times.
+    df : pd.DataFrame or EventFrame
+        DataFrame containing user events and their signup times, or
+        the equivalent compact EventFrame.
     freq: str
         Metric frequency string. Valid options are
         'D' (daily), 'W' (weekly), 'M' (monthly).
+    method : str
+        User set algebra implementation. Valid options are
+        'sort' (sorted (user, period) activity table) and
+        'bitmap' (per-period user bitmaps). Default is 'sort'.
 
     Returns
     -------
@@ -31,61 +40,90 @@ def calculate_user_lifecycle_metrics(
         ['new_users', 'churned_users', 'resurrected_users', 'retained_users']
     """
 
-    df = df.copy()
-
-    df['event_period'] = df['event_time'].dt.to_period(freq)
-    active_per_period = df.groupby('event_period')['user_id'] \
-        .apply(set) \
-        .rename_axis('period') \
-        .rename('active_users')
-
-    df['signup_period'] = df['version_time'].dt.to_period(freq)
-    signups_per_period = df.groupby('signup_period')['user_id'] \
-        .apply(set) \
-        .rename_axis('period') \
-        .rename('signups')
-
-    users_per_period = pd.concat(
-        [
-            active_per_period,
-            signups_per_period
-        ],
-        axis = 1
-    ).dropna(
-        subset = ['active_users']
+    # factorize users and periods into dense integer codes, where period
+    # codes are positions in the sorted array of periods with activity
+    user_codes, n_users = get_user_codes(df)
+    period_codes, active_ordinals = pd.factorize(
+        get_period_ordinals(df, freq),
+        sort = True
     )
+    active_periods = pd.PeriodIndex.from_ordinals(active_ordinals, freq = freq)
+    n_periods = active_periods.shape[0]
+
+    # signup period codes, where signups in periods without activity are dropped
+    signup_codes = pd.Index(active_ordinals).get_indexer(
+        get_period_ordinals(df, freq, column = 'version_time')
+    )
+
+    if method == 'sort':
 
-    lifecycle_data = []
-    prev_active = set()
+        # sorted (user, period) activity table encoded as single int64 keys
+        activity_keys = np.unique(user_codes.astype(np.int64) * n_periods + period_codes)
+        activity_periods = activity_keys % n_periods
 
-    for period, row in users_per_period.iterrows():
+        # signup (user, period) table
+        has_signup = signup_codes >= 0
+        signup_keys = np.unique(
+            user_codes[has_signup].astype(np.int64) * n_periods + signup_codes[has_signup]
+        )
 
-        current_active = row['active_users']
+        # retained users: consecutive keys of the same user in consecutive periods
+        is_retained = np.zeros(activity_keys.shape[0], dtype = bool)
+        is_retained[1:] = (np.diff(activity_keys) == 1) & (activity_periods[1:] > 0)
 
-        # new users: users who signed up during this period
-        new_users = row['signups'] if isinstance(row['signups'], set) else set()
+        # new users flagged within the activity table
+        is_new = np.isin(activity_keys, signup_keys, assume_unique = True)
 
-        # churned users: users who were previously active but not currently active
-        churned_users = prev_active.difference(current_active)
+        active_count = np.bincount(activity_periods, minlength = n_periods)
+        retained_count = np.bincount(activity_periods[is_retained], minlength = n_periods)
+        new_count = np.bincount(signup_keys % n_periods, minlength = n_periods)
+        active_new_count = np.bincount(activity_periods[is_new], minlength = n_periods)
+        retained_new_count = np.bincount(activity_periods[is_retained & is_new], minlength = n_periods)
 
-        # retained users: users who were active in this and previous time period
-        retained_users = current_active.intersection(prev_active)
+        # churned users: previously active users who are not currently active
+        churned_count = np.zeros(n_periods, dtype = np.int64)
+        churned_count[1:] = active_count[:-1] - retained_count[1:]
 
         # resurrected users: active users who are neither new nor retained
-        resurrected_users = current_active.difference(new_users, retained_users)
-
-        prev_active = current_active
-
-        lifecycle_data.append(
-            {
-                'period': period.to_timestamp(),
-                'new_users': len(new_users),
-                'churned_users': -len(churned_users),
-                'resurrected_users': len(resurrected_users),
-                'retained_users': len(retained_users)
-            }
+        resurrected_count = active_count - active_new_count - retained_count + retained_new_count
+
+    elif method == 'bitmap':
+
+        active = UserBitmapIndex.from_codes(
+            user_codes = user_codes,
+            period_codes = period_codes,
+            n_users = n_users,
+            n_periods = n_periods
+        )
+        signups = UserBitmapIndex.from_codes(
+            user_codes = user_codes,
+            period_codes = signup_codes,
+            n_users = n_users,
+            n_periods = n_periods
+        )
+        prev_active = active.shift(periods = 1)
+
+        new_count = signups.popcount()
+        churned_count = prev_active.difference(active).popcount()
+        retained_count = active.intersect(prev_active).popcount()
+        resurrected_count = active.difference(signups).difference(prev_active).popcount()
+
+    else:
+        raise ValueError(f'Invalid method - {method}')
+
+    user_lifecycle_metrics = pd.DataFrame(
+        {
+            'new_users': new_count,
+            'churned_users': -churned_count,
+            'resurrected_users': resurrected_count,
+            'retained_users': retained_count
+        },
+        index = pd.DatetimeIndex(
+            active_periods.to_timestamp(),
+            freq = None,
+            name = 'period'
         )
-    user_lifecycle_metrics = pd.DataFrame(lifecycle_data).set_index('period')
+    ).astype(np.int64)
 
     return user_lifecycle_metrics
 
@@ -0,0 +1,219 @@
+"""Compact in-memory representation of user events for metric computation."""
+
+import numpy as np
+import pandas as pd
+
+from src.config.columns import COUNTRY, EVENT_TIME, EVENT_TYPE, \
+    PLATFORM, TRANSACTION_CATEGORY, USER_ID, UTM_SOURCE, VERSION_TIME
+
+# low-cardinality columns stored as categoricals
+DIMENSION_COLUMNS = (
+    EVENT_TYPE,
+    COUNTRY,
+    UTM_SOURCE,
+    PLATFORM,
+    TRANSACTION_CATEGORY
+)
+
+def to_day_ordinals(
+        times
+):
+    """Converts timestamps to int64 day ordinals (days since 1970-01-01)."""
+
+    return np.asarray(times, dtype = 'datetime64[ns]') \
+        .astype('datetime64[D]') \
+        .astype(np.int64)
+
+def get_day_period_ordinals(
+        days,
+        freq
+):
+    """Converts int64 day ordinals to pandas period ordinals of a given
+    frequency. Periods are only computed for unique days.
+
+    Parameters
+    ----------
+    days : np.ndarray
+        int64 day ordinals.
+    freq : str
+        Period frequency string, e.g. 'D', 'W', 'M'.
+
+    Returns
+    -------
+    ordinals : np.ndarray
+        int64 period ordinals, one per day ordinal.
+    """
+
+    day_codes, unique_days = pd.factorize(days)
+    unique_ordinals = pd.PeriodIndex(
+        unique_days.astype('datetime64[D]'),
+        freq = freq
+    ).asi8
+
+    return unique_ordinals[day_codes]
+
+class EventFrame:
+    """Compact columnar frame of user events, holding user ids as dense
+    int32 codes, event dates as int64 day ordinals and low-cardinality
+    dimensions as categoricals. Signup dates are stored once per user.
+
+    Metric functions accept an EventFrame in place of a DataFrame of
+    events, and read its arrays without copying.
+
+    Parameters
+    ----------
+    user_codes : np.ndarray
+        int32 user codes, one per event, indexing `users`.
+    users : pd.Index
+        Unique user ids.
+    event_days : np.ndarray
+        int64 event day ordinals, one per event.
+    signup_days : np.ndarray
+        int64 signup day ordinals, one per user.
+    dimensions : dict
+        Mapping of column names to pd.Categorical values, one per event.
+        Default is None.
+    """
+
+    def __init__(
+            self,
+            user_codes,
+            users,
+            event_days,
+            signup_days,
+            dimensions = None
+    ):
+        self.user_codes = user_codes
+        self.users = users
+        self.event_days = event_days
+        self.signup_days = signup_days
+        self.dimensions = dimensions or {}
+
+    @classmethod
+    def from_dataframe(
+            cls,
+            df
+    ):
+        """Builds an EventFrame from a DataFrame of user events.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            DataFrame containing `user_id`, `event_time` and `version_time`
+            columns, and optionally any of `DIMENSION_COLUMNS`.
+
+        Returns
+        -------
+        frame : EventFrame
+            Compact event frame.
+        """
+
+        user_codes, users = pd.factorize(df[USER_ID])
+        user_codes = user_codes.astype(np.int32)
+
+        # users have a single signup time, so any event's value can be kept
+        signup_days = np.zeros(users.shape[0], dtype = np.int64)
+        signup_days[user_codes] = to_day_ordinals(df[VERSION_TIME])
+
+        return cls(
+            user_codes = user_codes,
+            users = pd.Index(users, name = USER_ID),
+            event_days = to_day_ordinals(df[EVENT_TIME]),
+            signup_days = signup_days,
+            dimensions = {
+                column: pd.Categorical(df[column])
+                for column in DIMENSION_COLUMNS
+                if column in df.columns
+            }
+        )
+
+    def __len__(self):
+        return self.user_codes.shape[0]
+
+    @property
+    def n_users(self):
+        return self.users.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.user_codes.nbytes \
+            + self.users.memory_usage(deep = True) \
+            + self.event_days.nbytes \
+            + self.signup_days.nbytes \
+            + sum(values.nbytes for values in self.dimensions.values())
+
+    def get_event_periods(
+            self,
+            freq
+    ):
+        """Gets the period ordinal of each event."""
+
+        return get_day_period_ordinals(self.event_days, freq)
+
+    def get_signup_periods(
+            self,
+            freq
+    ):
+        """Gets the signup period ordinal of the user of each event."""
+
+        return get_day_period_ordinals(self.signup_days, freq)[self.user_codes]
+
+def get_user_codes(
+        df
+):
+    """Gets dense integer user codes from a DataFrame of user events or an
+    EventFrame.
+
+    Parameters
+    ----------
+    df : pd.DataFrame or EventFrame
+        User events.
+
+    Returns
+    -------
+    user_codes : np.ndarray
+        Integer user codes, one per event.
+    n_users : int
+        Number of unique users.
+    """
+
+    if isinstance(df, EventFrame):
+        return df.user_codes, df.n_users
+
+    user_codes, users = pd.factorize(df[USER_ID])
+
+    return user_codes, users.shape[0]
+
+def get_period_ordinals(
+        df,
+        freq,
+        column = EVENT_TIME
+):
+    """Gets period ordinals of event or signup times from a DataFrame of
+    user events or an EventFrame.
+
+    Parameters
+    ----------
+    df : pd.DataFrame or EventFrame
+        User events.
+    freq : str
+        Period frequency string, e.g. 'D', 'W', 'M'.
+    column : str
+        Time column. Valid options are `event_time` and `version_time`.
+        Default is `event_time`.
+
+    Returns
+    -------
+    ordinals : np.ndarray
+        int64 period ordinals, one per event.
+    """
+
+    if column not in (EVENT_TIME, VERSION_TIME):
+        raise ValueError(f'Invalid time column - {column}')
+
+    if isinstance(df, EventFrame):
+        if column == EVENT_TIME:
+            return df.get_event_periods(freq)
+        return df.get_signup_periods(freq)
+
+    return pd.PeriodIndex(df[column].dt.to_period(freq)).asi8
@@ -1,24 +1,89 @@
 import numpy as np
 import pandas as pd
 
+from src.metrics.bitmap import UserBitmapIndex
+from src.metrics.frame import get_period_ordinals, get_user_codes
+
+def calculate_activity_overlap(
+        user_codes,
+        period_codes,
+        n_periods,
+        chunk_size = 2**14
+):
+    """Counts the number of users active in each pair of periods from a
+    user x period incidence matrix, i.e. overlap = A.T @ A.
+
+    Users are processed in chunks so that only a `chunk_size` x `n_periods`
+    slice of the incidence matrix is held in memory at any time.
+
+    Parameters
+    ----------
+    user_codes : np.ndarray
+        Integer user codes (e.g. from `pd.factorize`), one per event.
+    period_codes : np.ndarray
+        Integer period codes in the range [0, n_periods), one per event.
+    n_periods : int
+        Total number of periods.
+    chunk_size : int
+        Number of users per incidence matrix chunk. Default is 2**14.
+
+    Returns
+    -------
+    overlap : np.ndarray
+        `n_periods` x `n_periods` int64 array where overlap[i, j] is the
+        number of users active in both period i and period j.
+    """
+
+    # sorted unique (user, period) pairs
+    activity_keys = np.unique(np.asarray(user_codes, dtype = np.int64) * n_periods + period_codes)
+    activity_users = activity_keys // n_periods
+    activity_periods = activity_keys % n_periods
+
+    overlap = np.zeros((n_periods, n_periods), dtype = np.int64)
+    if activity_keys.shape[0] == 0:
+        return overlap
+
+    chunk_bounds = np.searchsorted(
+        activity_users,
+        np.arange(0, activity_users[-1] + chunk_size + 1, chunk_size)
+    )
+    for start, end in zip(chunk_bounds[:-1], chunk_bounds[1:]):
+
+        if start == end:
+            continue
+
+        chunk_users = activity_users[start:end]
+        incidence = np.zeros((chunk_users[-1] - chunk_users[0] + 1, n_periods), dtype = np.float32)
+        incidence[chunk_users - chunk_users[0], activity_periods[start:end]] = 1
+        overlap += (incidence.T @ incidence).astype(np.int64)
+
+    return overlap
+
 def calculate_retention(
         df,
         freq,
-        retention_type
+        retention_type,
+        method = 'matmul'
 ):
     """Calculates client retention given a dataframe of user events,
     retention frequency and retention type.
 
     Parameters
     ----------
-    df : pd.DataFrame
-        DataFrame containing user events.
+    df : pd.DataFrame or EventFrame
+        DataFrame containing user events, or the equivalent
+        compact EventFrame.
     freq : str
         Retention frequency to compute.
         Valid options are 'D' (daily), 'W' (weekly), 'M' (monthly).
     retention_type : str
         Type of retention to compute.
         Valid options are 'all_activity', 'new_activity', 'signup'.
+    method : str
+        Implementation used to intersect period active users for
+        'all_activity' retention. Valid options are 'matmul'
+        (incidence matrix product) and 'bitmap' (per-period user
+        bitmaps). Default is 'matmul'.
 
     Returns
     -------
@@ -28,88 +93,164 @@ def calculate_retention(
         activity, indexed by cohort period.
     """
 
-    df = df.copy()
-
-    # normalize event_time to selected frequency
-    df['event_period'] = df['event_time'].dt.to_period(freq)
+    user_codes, n_users = get_user_codes(df)
+    event_ordinals = get_period_ordinals(df, freq)
 
     # create periods for iteration and reindexing
-    periods = pd.period_range(
-        start = df['event_period'].min(),
-        end = df['event_period'].max(),
+    periods = pd.PeriodIndex.from_ordinals(
+        np.arange(event_ordinals.min(), event_ordinals.max() + 1),
         freq = freq
     )
 
     if retention_type == 'all_activity':
 
-        retention_data = []
-        for t0 in periods:
-            cohort_users = set(df[df['event_period'] == t0]['user_id'])
-            retention_data.append(
-                {
-                    'cohort_period': t0,
-                    'period_number': 0,
-                    'retained_users': len(cohort_users)
-                 }
+        # unique (user, period) activity pairs as dense integer codes
+        period_codes = event_ordinals - periods[0].ordinal
+
+        # active users shared by every pair of periods, computed in one pass
+        if method == 'matmul':
+            overlap = calculate_activity_overlap(
+                user_codes = user_codes,
+                period_codes = period_codes,
+                n_periods = periods.shape[0]
             )
+        elif method == 'bitmap':
+            overlap = UserBitmapIndex.from_codes(
+                user_codes = user_codes,
+                period_codes = period_codes,
+                n_users = n_users,
+                n_periods = periods.shape[0]
+            ).intersection_counts()
+        else:
+            raise ValueError(f'Invalid method - {method}')
 
-            for period in periods:
-
-                # excluding cases where period is before t0
-                if period <= t0:
-                    continue
-
-                period_number = (period - t0).n
-                period_users = set(df[df['event_period'] == period]['user_id'])
-                retained_users = cohort_users.intersection(period_users)
-
-                retention_data.append(
-                    {
-                        'cohort_period': t0,
-                        'period_number': period_number,
-                        'retained_users': len(retained_users)
-                    }
-                )
-
-        retention_data_df = pd.DataFrame(retention_data)
-        cohort_pivot = retention_data_df.set_index(['cohort_period', 'period_number'])['retained_users'] \
-            .unstack(
-            level = 'period_number'
-        ).reindex(
-            periods
+        cohort_pivot = pivot_overlap_counts(
+            overlap = overlap,
+            periods = periods
         )
 
     else:
 
         if retention_type == 'new_activity':
-
-            df['cohort_period'] = df.groupby('user_id')['event_period'].transform('min')
-
+            cohort_ordinals = event_ordinals
         elif retention_type == 'signup':
-
-            df['signup_period'] = df['version_time'].dt.to_period(freq)
-            df['cohort_period'] = df.groupby('user_id')['signup_period'].transform('min')
-
+            cohort_ordinals = get_period_ordinals(df, freq, column = 'version_time')
         else:
             raise ValueError(f'Invalid retention type - {retention_type}')
 
+        # cohort period is the user's earliest activity / signup period
+        activity = pd.DataFrame({
+            'user_id': user_codes,
+            'cohort_period': pd.Series(cohort_ordinals).groupby(user_codes).transform('min').to_numpy(),
+            'event_period': event_ordinals
+        })
+
         # calculate time offset from cohort
-        df['period_number'] = (df['event_period'] - df['cohort_period']).apply(lambda diff: diff.n)
+        activity['period_number'] = activity['event_period'] - activity['cohort_period']
 
         # get unique values per cohort and time period
-        cohort_pivot = (
-            df.groupby(['cohort_period', 'period_number'])['user_id']
-            .nunique()
-            .unstack(fill_value = np.nan)
-        ).reindex(
-            periods
+        cohort_counts = activity.groupby(['cohort_period', 'period_number'])['user_id'].nunique()
+        cohort_counts.index = cohort_counts.index.set_levels(
+            pd.PeriodIndex.from_ordinals(cohort_counts.index.levels[0], freq = freq),
+            level = 'cohort_period'
+        )
+        cohort_pivot = pivot_cohort_counts(
+            cohort_counts = cohort_counts,
+            periods = periods
         )
 
-        if cohort_pivot.isnull().all().all():
-            cohort_pivot = pd.DataFrame(
-                index = periods,
-                columns = range(periods.shape[0])
-            )
+    retention_matrix = calculate_retention_rates(cohort_pivot)
+
+    return retention_matrix
+
+def pivot_overlap_counts(
+        overlap,
+        periods
+):
+    """Rearranges period x period active user overlap counts into a cohort x
+    period number pivot of retained user counts.
+
+    Parameters
+    ----------
+    overlap : np.ndarray
+        `n_periods` x `n_periods` array where overlap[i, j] (for j >= i) is
+        the number of users active in both period i and period j.
+    periods : pd.PeriodIndex
+        Consecutive periods corresponding to the overlap rows and columns.
+
+    Returns
+    -------
+    cohort_pivot : pd.DataFrame
+        Retained user counts, indexed by cohort period with period numbers
+        as columns. Cells past the last period are NaN.
+    """
+
+    cohort_idx = np.arange(periods.shape[0])[:, np.newaxis]
+    period_idx = cohort_idx + np.arange(periods.shape[0])
+    cohort_pivot = pd.DataFrame(
+        np.where(
+            period_idx < periods.shape[0],
+            overlap[cohort_idx, np.minimum(period_idx, periods.shape[0] - 1)],
+            np.nan
+        ),
+        index = periods,
+        columns = pd.Index(
+            range(periods.shape[0]),
+            name = 'period_number'
+        )
+    )
+
+    return cohort_pivot
+
+def pivot_cohort_counts(
+        cohort_counts,
+        periods
+):
+    """Pivots retained user counts per cohort and period number.
+
+    Parameters
+    ----------
+    cohort_counts : pd.Series
+        Retained user counts indexed by (cohort_period, period_number).
+    periods : pd.PeriodIndex
+        Cohort periods to include.
+
+    Returns
+    -------
+    cohort_pivot : pd.DataFrame
+        Retained user counts, indexed by cohort period with period numbers
+        as columns. Missing cells are NaN.
+    """
+
+    cohort_pivot = cohort_counts \
+        .unstack(fill_value = np.nan) \
+        .reindex(periods)
+
+    if cohort_pivot.isnull().all().all():
+        cohort_pivot = pd.DataFrame(
+            index = periods,
+            columns = range(periods.shape[0])
+        )
+
+    return cohort_pivot
+
+def calculate_retention_rates(
+        cohort_pivot
+):
+    """Calculates a retention matrix from retained user counts per cohort
+    and period number, as a fraction of the cohort size (period number 0).
+
+    Parameters
+    ----------
+    cohort_pivot : pd.DataFrame
+        Retained user counts, indexed by cohort period with period numbers
+        as columns.
+
+    Returns
+    -------
+    retention_matrix : pd.DataFrame
+        Retention matrix dataframe containing retention rates.
+    """
 
     # calculate retention rate
     retention_matrix_raw = cohort_pivot.divide(cohort_pivot[0], axis=0)
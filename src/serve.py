@@ -0,0 +1,155 @@
+"""Production entry point serving the Dash app with multiple gunicorn
+worker processes."""
+
+import argparse
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+
+from src.config.filepaths import PROMETHEUS_MULTIPROC_DIR
+
+load_dotenv()
+
+# metrics of workers and their background jobs are aggregated through files
+# in a shared directory. multiprocess mode is selected from the environment
+# when prometheus_client is imported, so the directory is exported first
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = PROMETHEUS_MULTIPROC_DIR
+
+from src.ui.utils.instrumentation import archive_process_metrics, clear_multiprocess_dir
+
+class DashboardApplication(BaseApplication):
+    """gunicorn application serving the dashboard's Flask server.
+
+    Parameters
+    ----------
+    options : dict
+        gunicorn settings, e.g. `bind` and `workers`.
+    """
+
+    def __init__(
+            self,
+            options
+    ):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from src.app import server
+
+        return server
+
+def child_exit(
+        server,
+        worker
+):
+    """gunicorn hook called in the master process after a worker exits,
+    archiving the worker's metric files."""
+
+    archive_process_metrics(worker.pid)
+
+def parse_args():
+    """Parses command line arguments for serving the dashboard.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    args : argparse.Namespace
+        Parsed command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description = 'Serve the dashboard with gunicorn.')
+    parser.add_argument(
+        '--bind',
+        default = os.getenv('APP_BIND', '0.0.0.0:8080'),
+        help = 'Address to bind to. Default is the `APP_BIND` environment variable, or 0.0.0.0:8080.'
+    )
+    parser.add_argument(
+        '--workers',
+        type = int,
+        default = int(os.getenv('APP_WORKERS', multiprocessing.cpu_count())),
+        help = 'Number of worker processes. Default is the `APP_WORKERS` environment variable, or the CPU count.'
+    )
+    parser.add_argument(
+        '--threads',
+        type = int,
+        default = int(os.getenv('APP_THREADS', 1)),
+        help = 'Number of threads per worker. Default is the `APP_THREADS` environment variable, or 1.'
+    )
+    parser.add_argument(
+        '--timeout',
+        type = int,
+        default = int(os.getenv('APP_TIMEOUT', 120)),
+        help = 'Seconds before a silent worker is restarted. Default is the `APP_TIMEOUT` environment variable, or 120.'
+    )
+    parser.add_argument(
+        '--preload',
+        action = 'store_true',
+        help = 'Import the app in the master process before forking workers.'
+    )
+
+    return parser.parse_args()
+
+def main(
+        bind,
+        workers,
+        threads,
+        timeout,
+        preload
+):
+    """Serves the dashboard with gunicorn.
+
+    Database connection pools are created lazily in each worker process
+    (see `src.data.engine`), so the app can be preloaded safely.
+
+    Parameters
+    ----------
+    bind : str
+        Address to bind to, e.g. 0.0.0.0:8080.
+    workers : int
+        Number of worker processes.
+    threads : int
+        Number of threads per worker.
+    timeout : int
+        Seconds before a silent worker is restarted.
+    preload : bool
+        Whether to import the app before forking workers.
+
+    Returns
+    -------
+    None
+    """
+
+    # metrics of previous runs must not be aggregated with this run's
+    clear_multiprocess_dir()
+
+    DashboardApplication(
+        options = {
+            'bind': bind,
+            'workers': workers,
+            'threads': threads,
+            'timeout': timeout,
+            'preload_app': preload,
+            'child_exit': child_exit
+        }
+    ).run()
+
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    main(
+        bind = args.bind,
+        workers = args.workers,
+        threads = args.threads,
+        timeout = args.timeout,
+        preload = args.preload
+    )
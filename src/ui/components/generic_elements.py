@@ -49,3 +49,34 @@ def icon_text_button(
         },
         **button_kwargs
     )
+
+
+def progress_bar(
+    id
+):
+
+    """Returns a dbc.Progress bar for reporting the progress of
+    background callbacks, hidden until a callback is running.
+
+    Parameters
+    ----------
+    id : str
+        Progress bar id.
+
+    Returns
+    --------
+    _ : dbc.Progress
+        Progress bar object.
+    """
+
+    return dbc.Progress(
+        id = id,
+        value = 0,
+        label = '',
+        striped = True,
+        animated = True,
+        className = 'mb-3',
+        style = {
+            'display': 'none'
+        }
+    )
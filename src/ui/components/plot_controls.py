@@ -6,6 +6,10 @@ from dash import dcc, html, Input, Output, State
 from datetime import datetime
 from dash.exceptions import PreventUpdate
 
+from src.config.filters import COUNTRIES, COUNTRY_OPTIONS, EVENT_TYPES, \
+    EVENT_TYPE_OPTIONS, UTM_SOURCES, UTM_SOURCE_OPTIONS
+from src.ui.utils.instrumentation import timed_callback
+
 from .generic_elements import icon_text_button
 
 def plot_settings_button_collapse(
@@ -17,6 +21,7 @@ def plot_settings_button_collapse(
         [Input(f'{button_id}-collapse-button', 'n_clicks')],
         [State(f'{button_id}-collapse', 'is_open')],
     )
+    @timed_callback(f'{button_id}.toggle_collapse')
     def toggle_collapse(n, is_open):
         if n:
             return not is_open
@@ -113,14 +118,8 @@ def country_control_card(
         card_title = 'Countries:',
         control_child = dcc.Dropdown(
             id = f'{id}-user-countries-dropdown',
-            options = [
-                {'label': 'Indonesia', 'value': 'ID'},
-                {'label': 'Malaysia', 'value': 'MY'},
-                {'label': 'Philippines', 'value': 'PH'},
-                {'label': 'Singapore', 'value': 'SG'},
-                {'label': 'Thailand', 'value': 'TH'}
-            ],
-            value = ['ID', 'MY', 'PH', 'SG', 'TH'],
+            options = COUNTRY_OPTIONS,
+            value = COUNTRIES,
             multi = True,
             persistence = True,
             persistence_type = 'session',
@@ -185,14 +184,8 @@ def signup_source_control_card(
         card_title = 'User Signup Source:',
         control_child = dcc.Dropdown(
             id = f'{id}-user-source-dropdown',
-            options = [
-                {'label': 'Facebook', 'value': 'facebook'},
-                {'label': 'Google', 'value': 'google'},
-                {'label': 'Organic', 'value': 'organic'},
-                {'label': 'Referral', 'value': 'referral'},
-                {'label': 'Tiktok', 'value': 'tiktok'}
-            ],
-            value = ['facebook', 'google', 'organic', 'referral', 'tiktok'],
+            options = UTM_SOURCE_OPTIONS,
+            value = UTM_SOURCES,
             multi = True,
             persistence = True,
             persistence_type = 'session',
@@ -212,14 +205,8 @@ def user_activity_control_card(
         card_title = 'User Activity:',
         control_child = dcc.Dropdown(
             id = f'{id}-user-activity-dropdown',
-            options = [
-                {'label': 'Like', 'value': 'like'},
-                {'label': 'Miles Earned', 'value': 'miles_earned'},
-                {'label': 'Miles Redeemed', 'value': 'miles_redeemed'},
-                {'label': 'Reward Search', 'value': 'reward_search'},
-                {'label': 'Share', 'value': 'share'}
-            ],
-            value = ['like', 'miles_earned', 'miles_redeemed', 'reward_search', 'share'],
+            options = EVENT_TYPE_OPTIONS,
+            value = EVENT_TYPES,
             multi = True,
             persistence = True,
             persistence_type = 'session',
@@ -262,6 +249,7 @@ def linked_freq_date_selectors(
         ],
         [Input(component_id='store', component_property='data')]
     )
+    @timed_callback(f'{id}.update_date_selectors')
     def update_date_selectors(
             data
     ):
@@ -284,6 +272,7 @@ def linked_freq_date_selectors(
         State(component_id=f'{id}-date-selector', component_property='min_date_allowed'),
         State(component_id=f'{id}-date-selector', component_property='max_date_allowed')
     )
+    @timed_callback(f'{id}.update_disabled_dates')
     def update_disabled_dates(
             start_date,
             freq,
@@ -5,13 +5,13 @@ import pandas as pd
 from dash import dcc, html, Input, Output, State
 from dash.exceptions import PreventUpdate
 
-from src.metrics.engagement import calculate_quick_ratio, calculate_user_lifecycle_metrics
-from src.plot.engagement import plot_user_engagement
 from src.ui.components.plot_controls import country_control_card, linked_freq_date_selectors, \
     metric_type_control_card, plot_settings_button_collapse, signup_source_control_card, \
     user_activity_control_card
-from src.ui.components.generic_elements import icon_text_button
-from src.ui.utils.data import get_plotting_data
+from src.ui.components.generic_elements import icon_text_button, progress_bar
+from src.ui.utils.figures import render_engagement_figure
+from src.ui.utils.instrumentation import timed_callback
+from src.ui.utils.jobs import progress_running_style
 
 dash.register_page(
     __name__,
@@ -90,6 +90,7 @@ header = html.Div(
 plot_jumbotron = html.Div(
     dbc.Container(
         [
+            progress_bar(id = 'engagement-progress'),
             dcc.Graph(
                 id = 'engagement-plot'
             )
@@ -116,9 +117,20 @@ layout = html.Div(
     State(component_id = 'engagement-freq-selector', component_property = 'value'),
     State(component_id = 'engagement-user-countries-dropdown', component_property = 'value'),
     State(component_id = 'engagement-user-source-dropdown', component_property = 'value'),
-    State(component_id = 'engagement-user-activity-dropdown', component_property = 'value')
+    State(component_id = 'engagement-user-activity-dropdown', component_property = 'value'),
+    background = True,
+    progress = [
+        Output(component_id = 'engagement-progress', component_property = 'value'),
+        Output(component_id = 'engagement-progress', component_property = 'label')
+    ],
+    running = progress_running_style(id = 'engagement-progress'),
+    cancel = [
+        Input(component_id = 'url', component_property = 'pathname')
+    ]
 )
+@timed_callback('engagement.render_graph')
 def render_graph(
+        set_progress,
         n_clicks,
         start_date,
         end_date,
@@ -131,25 +143,12 @@ def render_graph(
     if not start_date or not end_date:
         return dash.no_update
 
-    df = get_plotting_data(
+    return render_engagement_figure(
         metric_freq = metric_freq,
         start_date = start_date,
         end_date = end_date,
         user_countries = user_countries,
         user_sources = user_sources,
-        user_activity = user_activity
-    )
-
-    # CALCULATE METRICS
-    user_lifecycle_metrics = calculate_user_lifecycle_metrics(
-        df = df.copy(),
-        freq = metric_freq
+        user_activity = user_activity,
+        set_progress = set_progress
     )
-    quick_ratio = calculate_quick_ratio(df = user_lifecycle_metrics.copy())
-
-    fig = plot_user_engagement(
-        user_lifecycle_metrics_df=user_lifecycle_metrics,
-        quick_ratio_series=quick_ratio,
-        freq = metric_freq)
-
-    return fig
@@ -4,13 +4,13 @@ import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output, State
 from dash.exceptions import PreventUpdate
 
-from src.metrics.retention import calculate_retention
-from src.plot.retention import plot_user_retention
 from src.ui.components.plot_controls import country_control_card, linked_freq_date_selectors, \
     plot_settings_button_collapse, retention_type_control_card, signup_source_control_card, \
     user_activity_control_card
-from src.ui.components.generic_elements import icon_text_button
-from src.ui.utils.data import get_plotting_data
+from src.ui.components.generic_elements import icon_text_button, progress_bar
+from src.ui.utils.figures import render_retention_figure
+from src.ui.utils.instrumentation import timed_callback
+from src.ui.utils.jobs import progress_running_style
 
 dash.register_page(
     __name__,
@@ -89,6 +89,7 @@ header = html.Div(
 plot_jumbotron = html.Div(
     dbc.Container(
         [
+            progress_bar(id = 'retention-progress'),
             dcc.Graph(
                 id = 'retention-plot'
             )
@@ -116,9 +117,20 @@ layout = html.Div(
     State(component_id = 'retention-retention-type-radio', component_property = 'value'),
     State(component_id = 'retention-user-countries-dropdown', component_property = 'value'),
     State(component_id = 'retention-user-source-dropdown', component_property = 'value'),
-    State(component_id = 'retention-user-activity-dropdown', component_property = 'value')
+    State(component_id = 'retention-user-activity-dropdown', component_property = 'value'),
+    background = True,
+    progress = [
+        Output(component_id = 'retention-progress', component_property = 'value'),
+        Output(component_id = 'retention-progress', component_property = 'label')
+    ],
+    running = progress_running_style(id = 'retention-progress'),
+    cancel = [
+        Input(component_id = 'url', component_property = 'pathname')
+    ]
 )
+@timed_callback('retention.render_graph')
 def render_graph(
+    set_progress,
     n_clicks,
     start_date,
     end_date,
@@ -131,24 +143,13 @@ def render_graph(
     if not start_date or not end_date:
         raise PreventUpdate
 
-    df = get_plotting_data(
+    return render_retention_figure(
         metric_freq = metric_freq,
+        retention_type = retention_type,
         start_date = start_date,
         end_date = end_date,
         user_countries = user_countries,
         user_sources = user_sources,
-        user_activity = user_activity
-    )
-
-    retention_matrix = calculate_retention(
-        df = df,
-        freq = metric_freq,
-        retention_type = retention_type
-    )
-
-    fig = plot_user_retention(
-        retention_matrix = retention_matrix,
-        freq = metric_freq
-    )
-
-    return fig
\ No newline at end of file
+        user_activity = user_activity,
+        set_progress = set_progress
+    )
\ No newline at end of file
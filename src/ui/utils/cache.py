@@ -0,0 +1,253 @@
+"""Disk-backed caches for dashboard query results and figures, shared by
+all app processes."""
+
+import diskcache
+import pandas as pd
+import pyarrow as pa
+
+from src.config.columns import USER_ID
+from src.metrics.frame import EventFrame
+
+def serialize_event_frame(
+        frame
+):
+    """Serializes an EventFrame as Arrow IPC streams, one of per-event
+    columns and one of per-user columns.
+
+    Parameters
+    ----------
+    frame : EventFrame
+        Frame to serialize.
+
+    Returns
+    -------
+    data : tuple
+        Serialized (events, users) Arrow IPC streams, as bytes.
+    """
+
+    events = pa.table({
+        'user_code': frame.user_codes,
+        'event_day': frame.event_days,
+        **{column: pa.array(values) for column, values in frame.dimensions.items()}
+    })
+    users = pa.table({
+        USER_ID: pa.array(frame.users, type = pa.string()),
+        'signup_day': frame.signup_days
+    })
+
+    streams = []
+    for table in (events, users):
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        streams.append(sink.getvalue().to_pybytes())
+
+    return tuple(streams)
+
+def deserialize_event_frame(
+        data
+):
+    """Deserializes an EventFrame serialized by `serialize_event_frame`.
+
+    Parameters
+    ----------
+    data : tuple
+        Serialized (events, users) Arrow IPC streams.
+
+    Returns
+    -------
+    frame : EventFrame
+        Deserialized frame.
+    """
+
+    events, users = (pa.ipc.open_stream(stream).read_all().combine_chunks() for stream in data)
+
+    return EventFrame(
+        user_codes = events.column('user_code').to_numpy(),
+        users = pd.Index(
+            users.column(USER_ID).to_pandas(types_mapper = {pa.string(): pd.StringDtype('pyarrow')}.get),
+            name = USER_ID
+        ),
+        event_days = events.column('event_day').to_numpy(),
+        signup_days = users.column('signup_day').to_numpy(),
+        dimensions = {
+            column: events.column(column).to_pandas().values
+            for column in events.column_names
+            if column not in ('user_code', 'event_day')
+        }
+    )
+
+class EventFrameCache:
+    """Disk-backed least recently used cache of EventFrames, bounded by
+    the total size of cached frames and shared by all app processes
+    (including background jobs, which run in processes of their own).
+
+    Frames are stored as Arrow IPC streams. Cache keys should include the
+    data version, so that frames are not served after new data is
+    ingested, while entries of previous versions are evicted over time.
+
+    Parameters
+    ----------
+    directory : str
+        Cache directory.
+    max_bytes : int
+        Maximum total size of cached frames, in bytes.
+    """
+
+    def __init__(
+            self,
+            directory,
+            max_bytes
+    ):
+        self._cache = diskcache.Cache(
+            directory,
+            size_limit = max_bytes,
+            eviction_policy = 'least-recently-used'
+        )
+        self._cache.stats(enable = True)
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def nbytes(self):
+        return self._cache.volume()
+
+    @property
+    def hits(self):
+        return self._cache.stats()[0]
+
+    @property
+    def misses(self):
+        return self._cache.stats()[1]
+
+    def get(
+            self,
+            key
+    ):
+        """Gets a cached EventFrame.
+
+        Parameters
+        ----------
+        key : hashable
+            Cache key.
+
+        Returns
+        -------
+        frame : EventFrame
+            Cached frame, or None if the key is not cached.
+        """
+
+        data = self._cache.get(key)
+        if data is None:
+            return None
+
+        return deserialize_event_frame(data)
+
+    def put(
+            self,
+            key,
+            frame
+    ):
+        """Serializes and caches an EventFrame, evicting least recently
+        used frames if the cache exceeds `max_bytes`.
+
+        Parameters
+        ----------
+        key : hashable
+            Cache key.
+        frame : EventFrame
+            Frame to cache.
+
+        Returns
+        -------
+        None
+        """
+
+        self._cache.set(key, serialize_event_frame(frame))
+
+class FigureCache:
+    """Disk-backed least recently used cache of rendered plotly figures,
+    bounded by the total size of cached figures and shared by all app
+    processes (including background jobs).
+
+    Figures are stored as plain dicts, which cache hits return as callback
+    outputs without building, validating or decoding a figure. Dash still
+    encodes the figure once into its response, as for any output. Hits and
+    misses are counted across processes.
+
+    Parameters
+    ----------
+    directory : str
+        Cache directory.
+    max_bytes : int
+        Maximum total size of cached figures, in bytes.
+    """
+
+    def __init__(
+            self,
+            directory,
+            max_bytes
+    ):
+        self._cache = diskcache.Cache(
+            directory,
+            size_limit = max_bytes,
+            eviction_policy = 'least-recently-used'
+        )
+        self._cache.stats(enable = True)
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def nbytes(self):
+        return self._cache.volume()
+
+    @property
+    def hits(self):
+        return self._cache.stats()[0]
+
+    @property
+    def misses(self):
+        return self._cache.stats()[1]
+
+    def get(
+            self,
+            key
+    ):
+        """Gets a cached figure.
+
+        Parameters
+        ----------
+        key : hashable
+            Cache key.
+
+        Returns
+        -------
+        fig_dict : dict
+            Figure as a plain dict, or None if the key is not cached.
+        """
+
+        return self._cache.get(key)
+
+    def put(
+            self,
+            key,
+            fig
+    ):
+        """Caches a figure as a plain dict, evicting least recently used
+        figures if the cache exceeds `max_bytes`.
+
+        Parameters
+        ----------
+        key : hashable
+            Cache key.
+        fig : plotly.graph_objects.Figure
+            Figure to cache.
+
+        Returns
+        -------
+        None
+        """
+
+        self._cache.set(key, fig.to_plotly_json())
@@ -1,13 +1,141 @@
 import os
 import pandas as pd
+import pyarrow as pa
+import time
 
 from dotenv import load_dotenv
 from pandas.tseries.offsets import DateOffset
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from src.config.columns import EVENT_TIME, USER_ID, VERSION_TIME
+from src.config.filepaths import FIGURES_CACHE_DIR, PLOTTING_DATA_CACHE_DIR
+from src.config.filters import EVENT_TYPES
+from src.data.engine import get_engine
+from src.data.fetch import fetch_dataframe, to_dataframe
+from src.data.queries import build_plotting_data_query
+from src.data.lifecycle_store import query_lifecycle_counts
+from src.data.retention_store import is_period_aligned, query_retention_counts
+from src.data.snapshots import DATA_BACKEND, get_snapshot_version, query_snapshot_date_range, \
+    query_snapshot_plotting_data
+from src.metrics.database import calculate_retention_from_counts, \
+    calculate_user_lifecycle_metrics_from_counts, query_retention, query_user_lifecycle_metrics
+from src.metrics.frame import EventFrame
+from src.ui.utils.cache import EventFrameCache, FigureCache
+from src.ui.utils.instrumentation import PLOTTING_DATA_DURATION, PLOTTING_DATA_ROWS
 
 load_dotenv()
 
-ENGINE = create_engine(os.getenv('CONN_STRING'))
+# 'true' serves user lifecycle metrics from the lifecycle store where possible
+LIFECYCLE_STORE = os.getenv('LIFECYCLE_STORE', 'false').lower() in ('1', 'true', 'yes')
+
+# 'true' serves retention matrices from the retention store where possible
+RETENTION_STORE = os.getenv('RETENTION_STORE', 'false').lower() in ('1', 'true', 'yes')
+
+# 'events' reads raw events, 'rollup' reads the daily rollup tables
+PLOTTING_DATA_SOURCE = os.getenv('PLOTTING_DATA_SOURCE', 'events')
+
+# 'pandas' computes metrics from plotting data, 'database' computes them in postgres
+METRICS_ENGINE = os.getenv('METRICS_ENGINE', 'pandas')
+
+# the stores and database metrics are maintained in postgres, so metrics are
+# computed in pandas from the snapshots when reading from parquet
+if DATA_BACKEND == 'parquet':
+    LIFECYCLE_STORE = RETENTION_STORE = False
+    METRICS_ENGINE = 'pandas'
+
+PLOTTING_DATA_TYPES = {
+    EVENT_TIME: pa.timestamp('ns'),
+    USER_ID: pa.string(),
+    VERSION_TIME: pa.timestamp('ns')
+}
+
+# plotting data query results, keyed by query parameters and data version
+PLOTTING_DATA_CACHE = EventFrameCache(
+    directory = PLOTTING_DATA_CACHE_DIR,
+    max_bytes = int(os.getenv('PLOTTING_DATA_CACHE_BYTES', 2**28))
+)
+
+# rendered plot figures, keyed by plot controls and data version
+FIGURE_CACHE = FigureCache(
+    directory = FIGURES_CACHE_DIR,
+    max_bytes = int(os.getenv('FIGURE_CACHE_BYTES', 2**28))
+)
+
+def get_data_version():
+    """Gets the current data version written by the ingestion pipeline.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    version : int
+        Data version, or 0 if no version has been written. With the
+        'parquet' data backend, this is the version of the latest
+        snapshot export.
+    """
+
+    if DATA_BACKEND == 'parquet':
+        return get_snapshot_version()
+
+    with get_engine().connect() as conn:
+        version = conn.execute(text('SELECT version FROM data_version WHERE id = 1')).scalar()
+
+    return version or 0
+
+def get_figure_cache_key(
+    page,
+    metric_freq,
+    start_date,
+    end_date,
+    user_countries,
+    user_sources,
+    user_activity,
+    retention_type = None
+):
+    """Gets the figure cache key for a plot, including the current data
+    version so that figures are not served after new data is ingested.
+
+    Parameters
+    ----------
+    page : str
+        Dashboard page name, e.g. 'engagement', 'retention'.
+    metric_freq : str
+        String specifying desired metric frequency.
+        Valid options include 'D', 'W', 'M'.
+    start_date : str
+        Selected plot start date, formatted as YYYY-MM-DD.
+    end_date : str
+        Selected plot end date, formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+    retention_type : str
+        Type of retention plotted, if any. Default is None.
+
+    Returns
+    -------
+    cache_key : tuple
+        Figure cache key.
+    """
+
+    cache_key = (
+        page,
+        metric_freq,
+        start_date,
+        end_date,
+        tuple(sorted(user_countries)),
+        tuple(sorted(user_sources)),
+        tuple(sorted(user_activity)),
+        retention_type,
+        get_data_version()
+    )
+
+    return cache_key
 
 def get_date_selector_init_dates(
     num_days_data = 30
@@ -27,33 +155,33 @@ def get_date_selector_init_dates(
         YYYY-MM-DD formatted strings.
     """
 
-    with ENGINE.connect() as conn:
-        stmt = text("""
-        SELECT
-            MIN(event_time) AS min_date,
-            MAX(event_time) AS max_date
-        FROM fct_events
-        """)
-        result = conn.execute(stmt).fetchone()
+    if DATA_BACKEND == 'parquet':
+        min_date, max_date = query_snapshot_date_range()
+    else:
+        with get_engine().connect() as conn:
+            stmt = text("""
+            SELECT
+                MIN(event_time) AS min_date,
+                MAX(event_time) AS max_date
+            FROM fct_events
+            """)
+            min_date, max_date = conn.execute(stmt).fetchone()
 
     date_dict = {
-        'min_date': result.min_date.strftime('%Y-%m-%d'),
-        'max_date': result.max_date.strftime('%Y-%m-%d'),
-        'start_date': (result.max_date - DateOffset(days = num_days_data)).strftime('%Y-%m-%d')
+        'min_date': min_date.strftime('%Y-%m-%d'),
+        'max_date': max_date.strftime('%Y-%m-%d'),
+        'start_date': (max_date - DateOffset(days = num_days_data)).strftime('%Y-%m-%d')
     }
 
     return date_dict
 
-def get_plotting_data(
+def get_query_dates(
     metric_freq,
     start_date,
     end_date,
-    user_countries,
-    user_sources,
-    user_activity,
     rollback = False
 ):
-    """Pulls required data based on engagement plot controls.
+    """Gets the query date range for selected plot dates.
 
     Parameters
     ----------
@@ -64,19 +192,15 @@ def get_plotting_data(
         Selected plot start date, formatted as YYYY-MM-DD.
     end_date : str
         Selected plot end date, formatted as YYYY-MM-DD.
-    user_countries : list
-        List of user countries to include.
-    user_sources : list
-        List of user sources to include.
-    user_activity : list
-        List of event types to include.
     rollback : bool
         Whether to roll the start date back by one period.
 
     Returns
     -------
-    df : pd.DataFrame
-        DataFrame containing user activity to plot.
+    query_start_date : str
+        Query start date (inclusive), formatted as YYYY-MM-DD.
+    query_end_date : str
+        Query end date (exclusive), formatted as YYYY-MM-DD.
     """
 
     # move start date back to include required date range for rolling metrics
@@ -92,36 +216,400 @@ def get_plotting_data(
     else:
         query_start_date = start_date
 
-    # offset by one day since BETWEEN clauses do not include the end date
+    # offset by one day to include events on the end date
     query_end_date = (pd.Timestamp(end_date) + DateOffset(days = 1)) \
         .strftime('%Y-%m-%d')
 
-    stmt = text(f"""
-    SELECT
-        events.*, users.utm_source, users.country, users.version_time
-    FROM (
-        SELECT *
-        FROM fct_events
-        WHERE
-            event_type IN ('{'\',\''.join(user_activity)}')
-            AND
-            event_time BETWEEN '{query_start_date}' and '{query_end_date}'
-    ) AS events
-    INNER JOIN (
-        SELECT *
-        FROM dim_users
-        WHERE
-            country IN ('{'\',\''.join(user_countries)}')
-            AND
-            utm_source IN ('{'\',\''.join(user_sources)}')
-    ) AS users
-    ON events.user_id = users.user_id;
-    """)
-
-    with ENGINE.connect() as conn:
-        df = pd.read_sql(
-            stmt,
-            conn
+    return query_start_date, query_end_date
+
+def get_plotting_data(
+    metric_freq,
+    start_date,
+    end_date,
+    user_countries,
+    user_sources,
+    user_activity,
+    rollback = False,
+    source = PLOTTING_DATA_SOURCE
+):
+    """Pulls required data based on engagement plot controls, from
+    postgreSQL or from Parquet snapshots depending on the `DATA_BACKEND`
+    environment variable.
+
+    Parameters
+    ----------
+    metric_freq : str
+        String specifying desired metric frequency.
+        Valid options include 'D', 'W', 'M'.
+    start_date : str
+        Selected plot start date, formatted as YYYY-MM-DD.
+    end_date : str
+        Selected plot end date, formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+    rollback : bool
+        Whether to roll the start date back by one period.
+    source : str
+        Data source to read. Valid options are 'events' (raw events in
+        `fct_events`) and 'rollup' (distinct daily user activity in
+        `agg_daily_user_activity`, with `event_time` at day resolution,
+        or computed from raw event snapshots).
+        Default is the `PLOTTING_DATA_SOURCE` environment variable, or
+        'events' if it is not set.
+
+    Returns
+    -------
+    frame : EventFrame
+        Compact frame of the `event_time`, `user_id` and `version_time`
+        of user activity to plot. Results are cached on disk for all app
+        processes by query date range, sorted filters and data version.
+    """
+
+    query_start_date, query_end_date = get_query_dates(
+        metric_freq = metric_freq,
+        start_date = start_date,
+        end_date = end_date,
+        rollback = rollback
+    )
+
+    # serve repeated queries from the cache shared by all processes, keyed by
+    # normalized query parameters and the data version
+    start_time = time.perf_counter()
+    cache_key = (
+        DATA_BACKEND,
+        source,
+        query_start_date,
+        query_end_date,
+        tuple(sorted(user_countries)),
+        tuple(sorted(user_sources)),
+        tuple(sorted(user_activity)),
+        get_data_version()
+    )
+    frame = PLOTTING_DATA_CACHE.get(cache_key)
+    if frame is not None:
+        PLOTTING_DATA_DURATION.labels(backend = DATA_BACKEND, source = source, cache = 'hit') \
+            .observe(time.perf_counter() - start_time)
+        return frame
+
+    if DATA_BACKEND == 'postgres':
+        stmt = build_plotting_data_query(
+            start_date = query_start_date,
+            end_date = query_end_date,
+            user_countries = user_countries,
+            user_sources = user_sources,
+            user_activity = user_activity,
+            source = source
+        )
+
+        df = fetch_dataframe(
+            engine = get_engine(),
+            stmt = stmt,
+            column_types = PLOTTING_DATA_TYPES
+        )
+
+    elif DATA_BACKEND == 'parquet':
+        table = query_snapshot_plotting_data(
+            start_date = query_start_date,
+            end_date = query_end_date,
+            user_countries = user_countries,
+            user_sources = user_sources,
+            user_activity = user_activity,
+            column_types = PLOTTING_DATA_TYPES,
+            source = source
+        )
+        df = to_dataframe(table)
+
+    else:
+        raise ValueError(f'Invalid data backend - {DATA_BACKEND}')
+
+    frame = EventFrame.from_dataframe(df)
+
+    PLOTTING_DATA_DURATION.labels(backend = DATA_BACKEND, source = source, cache = 'miss') \
+        .observe(time.perf_counter() - start_time)
+    PLOTTING_DATA_ROWS.labels(backend = DATA_BACKEND, source = source).observe(len(frame))
+
+    PLOTTING_DATA_CACHE.put(
+        key = cache_key,
+        frame = frame
+    )
+
+    return frame
+
+def get_user_lifecycle_metrics(
+    metric_freq,
+    start_date,
+    end_date,
+    user_countries,
+    user_sources,
+    user_activity,
+    source = PLOTTING_DATA_SOURCE
+):
+    """Calculates user lifecycle metrics in the database based on
+    engagement plot controls, without pulling plotting data.
+
+    Parameters
+    ----------
+    metric_freq : str
+        String specifying desired metric frequency.
+        Valid options include 'D', 'W', 'M'.
+    start_date : str
+        Selected plot start date, formatted as YYYY-MM-DD.
+    end_date : str
+        Selected plot end date, formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+    source : str
+        Data source to read, as in `get_plotting_data`.
+
+    Returns
+    -------
+    user_lifecycle_metrics : pd.DataFrame
+        Time period indexed DataFrame, as returned by
+        `calculate_user_lifecycle_metrics`.
+    """
+
+    query_start_date, query_end_date = get_query_dates(
+        metric_freq = metric_freq,
+        start_date = start_date,
+        end_date = end_date
+    )
+
+    activity_query = build_plotting_data_query(
+        start_date = query_start_date,
+        end_date = query_end_date,
+        user_countries = user_countries,
+        user_sources = user_sources,
+        user_activity = user_activity,
+        source = source
+    )
+
+    with get_engine().connect() as conn:
+        user_lifecycle_metrics = query_user_lifecycle_metrics(
+            conn = conn,
+            activity_query = activity_query,
+            freq = metric_freq
+        )
+
+    return user_lifecycle_metrics
+
+def get_retention_matrix(
+    metric_freq,
+    retention_type,
+    start_date,
+    end_date,
+    user_countries,
+    user_sources,
+    user_activity,
+    source = PLOTTING_DATA_SOURCE
+):
+    """Calculates a retention matrix in the database based on retention
+    plot controls, without pulling plotting data.
+
+    Parameters
+    ----------
+    metric_freq : str
+        String specifying desired metric frequency.
+        Valid options include 'D', 'W', 'M'.
+    retention_type : str
+        Type of retention to compute.
+        Valid options are 'all_activity', 'new_activity', 'signup'.
+    start_date : str
+        Selected plot start date, formatted as YYYY-MM-DD.
+    end_date : str
+        Selected plot end date, formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+    source : str
+        Data source to read, as in `get_plotting_data`.
+
+    Returns
+    -------
+    retention_matrix : pd.DataFrame
+        Retention matrix dataframe, as returned by `calculate_retention`.
+    """
+
+    query_start_date, query_end_date = get_query_dates(
+        metric_freq = metric_freq,
+        start_date = start_date,
+        end_date = end_date
+    )
+
+    activity_query = build_plotting_data_query(
+        start_date = query_start_date,
+        end_date = query_end_date,
+        user_countries = user_countries,
+        user_sources = user_sources,
+        user_activity = user_activity,
+        source = source
+    )
+
+    with get_engine().connect() as conn:
+        retention_matrix = query_retention(
+            conn = conn,
+            activity_query = activity_query,
+            freq = metric_freq,
+            retention_type = retention_type
+        )
+
+    return retention_matrix
+
+def get_stored_retention_matrix(
+    metric_freq,
+    retention_type,
+    start_date,
+    end_date,
+    user_countries,
+    user_sources,
+    user_activity
+):
+    """Calculates a retention matrix from the retention store, which holds
+    retained user counts per cohort and user segment maintained by the
+    ingestion pipeline.
+
+    Stored counts cover whole periods of all event types, so the store is
+    only used if all event types are selected and the selected dates are
+    aligned to period boundaries. New activity cohorts are based on the
+    full activity history, so the start date must also precede all data.
+
+    Parameters
+    ----------
+    metric_freq : str
+        String specifying desired metric frequency.
+        Valid options include 'D', 'W', 'M'.
+    retention_type : str
+        Type of retention to compute.
+        Valid options are 'all_activity', 'new_activity', 'signup'.
+    start_date : str
+        Selected plot start date, formatted as YYYY-MM-DD.
+    end_date : str
+        Selected plot end date, formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+
+    Returns
+    -------
+    retention_matrix : pd.DataFrame
+        Retention matrix dataframe, as returned by `calculate_retention`,
+        or None if the store cannot serve the selection.
+    """
+
+    if not RETENTION_STORE \
+            or not set(EVENT_TYPES).issubset(user_activity) \
+            or not is_period_aligned(start_date, end_date, metric_freq):
+        return None
+
+    with get_engine().connect() as conn:
+
+        if retention_type == 'new_activity':
+            min_date = conn.execute(text('SELECT MIN(activity_date) FROM agg_daily_user_activity')).scalar()
+            if min_date is None or pd.Timestamp(start_date) > pd.Timestamp(min_date):
+                return None
+
+        counts = query_retention_counts(
+            conn = conn,
+            freq = metric_freq,
+            retention_type = retention_type,
+            start_date = start_date,
+            end_date = end_date,
+            user_countries = user_countries,
+            user_sources = user_sources
+        )
+
+    if counts.empty:
+        return None
+
+    retention_matrix = calculate_retention_from_counts(
+        counts = counts,
+        freq = metric_freq,
+        retention_type = retention_type
+    )
+
+    return retention_matrix
+
+def get_stored_user_lifecycle_metrics(
+    metric_freq,
+    start_date,
+    end_date,
+    user_countries,
+    user_sources,
+    user_activity
+):
+    """Calculates user lifecycle metrics from the lifecycle store, which
+    holds per-period user counts by user segment maintained by the
+    ingestion pipeline, so that earlier periods are never recomputed.
+
+    Stored counts cover whole periods of all event types, so the store is
+    only used if all event types are selected, the selected dates are
+    aligned to period boundaries and every period in the range has
+    activity (metrics compare each period with the previous active one).
+
+    Parameters
+    ----------
+    metric_freq : str
+        String specifying desired metric frequency.
+        Valid options include 'D', 'W', 'M'.
+    start_date : str
+        Selected plot start date, formatted as YYYY-MM-DD.
+    end_date : str
+        Selected plot end date, formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+
+    Returns
+    -------
+    user_lifecycle_metrics : pd.DataFrame
+        Time period indexed DataFrame, as returned by
+        `calculate_user_lifecycle_metrics`, or None if the store cannot
+        serve the selection.
+    """
+
+    if not LIFECYCLE_STORE \
+            or not set(EVENT_TYPES).issubset(user_activity) \
+            or not is_period_aligned(start_date, end_date, metric_freq):
+        return None
+
+    with get_engine().connect() as conn:
+        counts = query_lifecycle_counts(
+            conn = conn,
+            freq = metric_freq,
+            start_date = start_date,
+            end_date = end_date,
+            user_countries = user_countries,
+            user_sources = user_sources
         )
 
-    return df
\ No newline at end of file
+    if counts.empty:
+        return None
+
+    # gaps in activity change which period is the previous active one
+    n_periods = pd.period_range(
+        start = counts['period'].iloc[0],
+        end = counts['period'].iloc[-1],
+        freq = metric_freq
+    ).shape[0]
+    if n_periods != counts.shape[0]:
+        return None
+
+    user_lifecycle_metrics = calculate_user_lifecycle_metrics_from_counts(counts = counts)
+
+    return user_lifecycle_metrics
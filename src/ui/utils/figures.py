@@ -0,0 +1,237 @@
+"""Functions for rendering dashboard figures, shared by page callbacks
+and the figure cache warm-up."""
+
+from src.metrics.engagement import calculate_quick_ratio, calculate_user_lifecycle_metrics
+from src.metrics.retention import calculate_retention
+from src.plot.engagement import plot_user_engagement
+from src.plot.retention import plot_user_retention
+from src.ui.utils.data import FIGURE_CACHE, METRICS_ENGINE, get_figure_cache_key, \
+    get_plotting_data, get_retention_matrix, get_stored_retention_matrix, \
+    get_stored_user_lifecycle_metrics, get_user_lifecycle_metrics
+from src.ui.utils.instrumentation import timed_stage
+from src.ui.utils.jobs import report_progress
+
+# stages reported by plot renders
+RENDER_STAGES = ['Querying data', 'Calculating metrics', 'Plotting']
+
+def render_engagement_figure(
+    metric_freq,
+    start_date,
+    end_date,
+    user_countries,
+    user_sources,
+    user_activity,
+    set_progress = None
+):
+    """Renders the user engagement figure, serving it from the figure
+    cache if it has already been rendered for the current data version.
+
+    Parameters
+    ----------
+    metric_freq : str
+        String specifying desired metric frequency.
+        Valid options include 'D', 'W', 'M'.
+    start_date : str
+        Selected plot start date, formatted as YYYY-MM-DD.
+    end_date : str
+        Selected plot end date, formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+    set_progress : callable
+        Progress setter of a background callback, if any. Default is None.
+
+    Returns
+    -------
+    fig : plotly.graph_objects.Figure or dict
+        User engagement figure, or its dict if served from cache.
+    """
+
+    # serve previously rendered figures without querying or plotting
+    with timed_stage('engagement', 'cache'):
+        cache_key = get_figure_cache_key(
+            page = 'engagement',
+            metric_freq = metric_freq,
+            start_date = start_date,
+            end_date = end_date,
+            user_countries = user_countries,
+            user_sources = user_sources,
+            user_activity = user_activity
+        )
+        fig_dict = FIGURE_CACHE.get(cache_key)
+    if fig_dict is not None:
+        return fig_dict
+
+    # CALCULATE METRICS
+    report_progress(set_progress, 'Querying data', RENDER_STAGES)
+    with timed_stage('engagement', 'query'):
+
+        # read maintained lifecycle counts if they cover the selection
+        user_lifecycle_metrics = get_stored_user_lifecycle_metrics(
+            metric_freq = metric_freq,
+            start_date = start_date,
+            end_date = end_date,
+            user_countries = user_countries,
+            user_sources = user_sources,
+            user_activity = user_activity
+        )
+
+        if user_lifecycle_metrics is None and METRICS_ENGINE == 'database':
+            user_lifecycle_metrics = get_user_lifecycle_metrics(
+                metric_freq = metric_freq,
+                start_date = start_date,
+                end_date = end_date,
+                user_countries = user_countries,
+                user_sources = user_sources,
+                user_activity = user_activity
+            )
+        elif user_lifecycle_metrics is None:
+            df = get_plotting_data(
+                metric_freq = metric_freq,
+                start_date = start_date,
+                end_date = end_date,
+                user_countries = user_countries,
+                user_sources = user_sources,
+                user_activity = user_activity
+            )
+
+    report_progress(set_progress, 'Calculating metrics', RENDER_STAGES)
+    with timed_stage('engagement', 'metrics'):
+        if user_lifecycle_metrics is None:
+            user_lifecycle_metrics = calculate_user_lifecycle_metrics(
+                df = df,
+                freq = metric_freq
+            )
+        quick_ratio = calculate_quick_ratio(df = user_lifecycle_metrics.copy())
+
+    report_progress(set_progress, 'Plotting', RENDER_STAGES)
+    with timed_stage('engagement', 'plot'):
+        fig = plot_user_engagement(
+            user_lifecycle_metrics_df=user_lifecycle_metrics,
+            quick_ratio_series=quick_ratio,
+            freq = metric_freq)
+
+    with timed_stage('engagement', 'serialize'):
+        FIGURE_CACHE.put(
+            key = cache_key,
+            fig = fig
+        )
+
+    return fig
+
+def render_retention_figure(
+    metric_freq,
+    retention_type,
+    start_date,
+    end_date,
+    user_countries,
+    user_sources,
+    user_activity,
+    set_progress = None
+):
+    """Renders the user retention figure, serving it from the figure
+    cache if it has already been rendered for the current data version.
+
+    Parameters
+    ----------
+    metric_freq : str
+        String specifying desired metric frequency.
+        Valid options include 'D', 'W', 'M'.
+    retention_type : str
+        Type of retention to compute.
+        Valid options are 'all_activity', 'new_activity', 'signup'.
+    start_date : str
+        Selected plot start date, formatted as YYYY-MM-DD.
+    end_date : str
+        Selected plot end date, formatted as YYYY-MM-DD.
+    user_countries : list
+        List of user countries to include.
+    user_sources : list
+        List of user sources to include.
+    user_activity : list
+        List of event types to include.
+    set_progress : callable
+        Progress setter of a background callback, if any. Default is None.
+
+    Returns
+    -------
+    fig : plotly.graph_objects.Figure or dict
+        User retention figure, or its dict if served from cache.
+    """
+
+    # serve previously rendered figures without querying or plotting
+    with timed_stage('retention', 'cache'):
+        cache_key = get_figure_cache_key(
+            page = 'retention',
+            metric_freq = metric_freq,
+            start_date = start_date,
+            end_date = end_date,
+            user_countries = user_countries,
+            user_sources = user_sources,
+            user_activity = user_activity,
+            retention_type = retention_type
+        )
+        fig_dict = FIGURE_CACHE.get(cache_key)
+    if fig_dict is not None:
+        return fig_dict
+
+    report_progress(set_progress, 'Querying data', RENDER_STAGES)
+    with timed_stage('retention', 'query'):
+
+        # read maintained retention counts if they cover the selection
+        retention_matrix = get_stored_retention_matrix(
+            metric_freq = metric_freq,
+            retention_type = retention_type,
+            start_date = start_date,
+            end_date = end_date,
+            user_countries = user_countries,
+            user_sources = user_sources,
+            user_activity = user_activity
+        )
+
+        if retention_matrix is None and METRICS_ENGINE == 'database':
+            retention_matrix = get_retention_matrix(
+                metric_freq = metric_freq,
+                retention_type = retention_type,
+                start_date = start_date,
+                end_date = end_date,
+                user_countries = user_countries,
+                user_sources = user_sources,
+                user_activity = user_activity
+            )
+        elif retention_matrix is None:
+            df = get_plotting_data(
+                metric_freq = metric_freq,
+                start_date = start_date,
+                end_date = end_date,
+                user_countries = user_countries,
+                user_sources = user_sources,
+                user_activity = user_activity
+            )
+
+    report_progress(set_progress, 'Calculating metrics', RENDER_STAGES)
+    with timed_stage('retention', 'metrics'):
+        if retention_matrix is None:
+            retention_matrix = calculate_retention(
+                df = df,
+                freq = metric_freq,
+                retention_type = retention_type
+            )
+
+    report_progress(set_progress, 'Plotting', RENDER_STAGES)
+    with timed_stage('retention', 'plot'):
+        fig = plot_user_retention(
+            retention_matrix = retention_matrix,
+            freq = metric_freq
+        )
+
+    with timed_stage('retention', 'serialize'):
+        FIGURE_CACHE.put(
+            key = cache_key,
+            fig = fig
+        )
+
+    return fig
@@ -0,0 +1,267 @@
+"""Prometheus instrumentation of dashboard callbacks, plot render stages
+and plotting data queries, published on the Flask server's `/metrics`
+route."""
+
+import functools
+import glob
+import os
+import psutil
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, \
+    generate_latest, multiprocess
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+
+# directory through which the metrics of gunicorn workers and their background
+# jobs are aggregated, exported by `src.serve` before prometheus_client is
+# imported. other processes (e.g. the development server and the warm-up)
+# only publish their own metrics
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# metric files of exited processes are merged into one file per metric type
+ARCHIVE_PID = 'archive'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ROWS_BUCKETS = (1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+CALLBACK_DURATION = Histogram(
+    'dashboard_callback_duration_seconds',
+    'Wall time of Dash callbacks.',
+    ['callback'],
+    buckets = DURATION_BUCKETS
+)
+
+STAGE_DURATION = Histogram(
+    'dashboard_render_stage_duration_seconds',
+    'Wall time of plot render stages.',
+    ['page', 'stage'],
+    buckets = DURATION_BUCKETS
+)
+
+PLOTTING_DATA_DURATION = Histogram(
+    'dashboard_plotting_data_duration_seconds',
+    'Wall time of plotting data reads, by data backend, data source and cache result.',
+    ['backend', 'source', 'cache'],
+    buckets = DURATION_BUCKETS
+)
+
+PLOTTING_DATA_ROWS = Histogram(
+    'dashboard_plotting_data_rows',
+    'Rows of plotting data read from the data backend.',
+    ['backend', 'source'],
+    buckets = ROWS_BUCKETS
+)
+
+@contextmanager
+def timed_stage(
+        page,
+        stage
+):
+    """Context manager recording the wall time of a plot render stage.
+
+    Parameters
+    ----------
+    page : str
+        Dashboard page, e.g. 'engagement'.
+    stage : str
+        Render stage, e.g. 'query', 'metrics', 'plot', 'serialize'.
+    """
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(page = page, stage = stage).observe(time.perf_counter() - start_time)
+
+def timed_callback(
+        name
+):
+    """Decorator recording the wall time of a Dash callback, including
+    callbacks which end with `PreventUpdate` or another exception.
+
+    Must be applied below the `dash.callback` decorator.
+
+    Parameters
+    ----------
+    name : str
+        Callback name used as the metric label, e.g. 'engagement.render_graph'.
+
+    Returns
+    -------
+    decorator : callable
+        Callback decorator.
+    """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                CALLBACK_DURATION.labels(callback = name).observe(time.perf_counter() - start_time)
+
+        return wrapper
+
+    return decorator
+
+@contextmanager
+def lock_multiprocess_dir():
+    """Context manager holding an exclusive lock on the metric files, so
+    that archiving does not race with other archiving or collection."""
+
+    # gunicorn, and so multiprocess mode, is only supported on unix
+    import fcntl
+
+    with open(os.path.join(PROMETHEUS_MULTIPROC_DIR, 'metrics.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def clear_multiprocess_dir():
+    """Removes metric files left in `PROMETHEUS_MULTIPROC_DIR` by previous
+    runs. Must be called once before app processes start, e.g. in the
+    gunicorn master process."""
+
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return
+
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok = True)
+    for filepath in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, '*.db')):
+        os.remove(filepath)
+
+def write_metrics(
+        filepath,
+        metrics
+):
+    """Writes merged metrics with raw histogram bucket counts to a metric
+    file, replacing it atomically.
+
+    Parameters
+    ----------
+    filepath : str
+        Metric filepath.
+    metrics : list
+        Metrics as returned by `MultiProcessCollector.merge` with
+        `accumulate = False`.
+
+    Returns
+    -------
+    None
+    """
+
+    # written under a name which collection ignores until it is complete
+    tmp_filepath = f'{filepath}.tmp'
+    if os.path.exists(tmp_filepath):
+        os.remove(tmp_filepath)
+
+    mmaped_dict = MmapedDict(tmp_filepath)
+    try:
+        for metric in metrics:
+            for sample in metric.samples:
+                key = mmap_key(
+                    metric.name,
+                    sample.name,
+                    list(sample.labels),
+                    list(sample.labels.values()),
+                    metric.documentation
+                )
+                mmaped_dict.write_value(key, sample.value, 0)
+    finally:
+        mmaped_dict.close()
+
+    os.replace(tmp_filepath, filepath)
+
+def archive_process_metrics(
+        pid
+):
+    """Merges the metric files of a finished app process, and of any other
+    exited processes (e.g. cancelled background jobs), into one archive
+    file per metric type and removes them. Otherwise, every background job
+    would leave its own metric files, all of which are read on collection.
+
+    Called when a gunicorn worker exits and when a background job completes.
+
+    Parameters
+    ----------
+    pid : int
+        Process ID of the finished process.
+
+    Returns
+    -------
+    None
+    """
+
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return
+
+    with lock_multiprocess_dir():
+
+        # metric files are named `{type}_{pid}.db`
+        filepaths = defaultdict(list)
+        for filepath in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, '*.db')):
+            metric_type, file_pid = os.path.basename(filepath)[:-3].split('_', 1)
+            # gauges are not archived, as the app defines none
+            if file_pid == ARCHIVE_PID or metric_type == 'gauge':
+                continue
+            if int(file_pid) == pid or not psutil.pid_exists(int(file_pid)):
+                filepaths[metric_type].append(filepath)
+
+        for metric_type, process_filepaths in filepaths.items():
+            archive_filepath = os.path.join(PROMETHEUS_MULTIPROC_DIR, f'{metric_type}_{ARCHIVE_PID}.db')
+            archived_filepaths = [archive_filepath] if os.path.exists(archive_filepath) else []
+
+            # histogram buckets are merged as raw counts, as in process files
+            metrics = multiprocess.MultiProcessCollector.merge(
+                archived_filepaths + process_filepaths,
+                accumulate = False
+            )
+            write_metrics(
+                filepath = archive_filepath,
+                metrics = metrics
+            )
+            for filepath in process_filepaths:
+                os.remove(filepath)
+
+def collect_metrics():
+    """Collects metrics in the Prometheus text format, of all app processes
+    in multiprocess mode and of this process otherwise."""
+
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(REGISTRY)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+
+    # process files are not archived while being read
+    with lock_multiprocess_dir():
+        return generate_latest(registry)
+
+def register_metrics_route(
+        server
+):
+    """Adds a `/metrics` route publishing metrics in the Prometheus text
+    format to a Flask server.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        Flask server.
+
+    Returns
+    -------
+    None
+    """
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(
+            collect_metrics(),
+            mimetype = CONTENT_TYPE_LATEST
+        )
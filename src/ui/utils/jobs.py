@@ -0,0 +1,91 @@
+"""Background job management for long-running dashboard callbacks."""
+
+import diskcache
+import os
+
+from dash import DiskcacheManager, Output
+from dotenv import load_dotenv
+
+from src.config.filepaths import JOBS_CACHE_DIR
+from src.config.logging_config import stop_log_listeners
+from src.ui.utils.instrumentation import archive_process_metrics
+
+load_dotenv()
+
+class JobManager(DiskcacheManager):
+    """Background callback manager which runs each job in a new process,
+    archiving the process's metrics and writing out its queued log records
+    when the job completes, as job processes exit without running exit
+    handlers."""
+
+    def make_job_fn(self, fn, progress, key = None):
+        job_fn = super().make_job_fn(fn, progress, key)
+
+        def run_job(*args):
+            try:
+                job_fn(*args)
+            finally:
+                archive_process_metrics(os.getpid())
+                stop_log_listeners()
+
+        return run_job
+
+# jobs run in separate processes, with their state and results held in a
+# disk cache shared by all app processes
+BACKGROUND_CALLBACK_MANAGER = JobManager(
+    diskcache.Cache(JOBS_CACHE_DIR),
+    expire = int(os.getenv('BACKGROUND_JOB_EXPIRE', 600))
+)
+
+def progress_running_style(
+        id
+):
+    """Gets the `running` argument of a background callback, which shows
+    a progress bar (see `progress_bar`) while the callback is running.
+
+    Parameters
+    ----------
+    id : str
+        Progress bar id.
+
+    Returns
+    -------
+    running : list
+        List of (Output, value while running, value when done) tuples.
+    """
+
+    return [
+        (
+            Output(component_id = id, component_property = 'style'),
+            {'display': 'flex'},
+            {'display': 'none'}
+        )
+    ]
+
+def report_progress(
+        set_progress,
+        stage,
+        stages
+):
+    """Reports the current stage of a background callback to its
+    progress bar.
+
+    Parameters
+    ----------
+    set_progress : callable
+        Progress setter passed to the background callback. Progress is
+        not reported if None.
+    stage : str
+        Name of the stage being started.
+    stages : list
+        Names of all stages, in order.
+
+    Returns
+    -------
+    None
+    """
+
+    if set_progress is None:
+        return
+
+    set_progress((int(100 * stages.index(stage) / len(stages)), stage))
@@ -0,0 +1,132 @@
+"""Precomputes commonly viewed dashboard figures into the figure cache, so
+that the first dashboard loads after ingestion are served from cache."""
+
+import argparse
+import logging
+import time
+
+from src.config.filters import COUNTRIES, EVENT_TYPES, UTM_SOURCES
+from src.config.logging_config import setup_logging
+from src.ui.utils.data import get_date_selector_init_dates
+from src.ui.utils.figures import render_engagement_figure, render_retention_figure
+
+logger = logging.getLogger('ingestion_ppl_logger')
+
+WARMUP_FREQS = ('D', 'W', 'M')
+WARMUP_RETENTION_TYPES = ('all_activity', 'new_activity', 'signup')
+
+# date ranges to warm up, as number of days before the latest event, where
+# 30 days is the dashboard's default view and None is the full date range
+WARMUP_RANGE_DAYS = (30, 90, None)
+
+def get_warmup_date_ranges(
+        range_days = WARMUP_RANGE_DAYS
+):
+    """Gets the date ranges to warm up, as selected in the dashboard's date
+    selectors (ending on the latest event date).
+
+    Parameters
+    ----------
+    range_days : tuple
+        Number of days before the latest event date that each range
+        starts, or None for the full date range. Default is
+        `WARMUP_RANGE_DAYS`.
+
+    Returns
+    -------
+    date_ranges : list
+        Unique (start_date, end_date) tuples formatted as YYYY-MM-DD.
+    """
+
+    date_dict = get_date_selector_init_dates()
+
+    date_ranges = []
+    for num_days in range_days:
+        if num_days is None:
+            start_date = date_dict['min_date']
+        else:
+            start_date = max(
+                get_date_selector_init_dates(num_days_data = num_days)['start_date'],
+                date_dict['min_date']
+            )
+
+        if (start_date, date_dict['max_date']) not in date_ranges:
+            date_ranges.append((start_date, date_dict['max_date']))
+
+    return date_ranges
+
+def warm_up(
+        range_days = WARMUP_RANGE_DAYS
+):
+    """Renders engagement figures and all retention type figures at each
+    metric frequency with all filters selected, for each warm-up date
+    range. Figures are stored in the figure cache under the current data
+    version.
+
+    Parameters
+    ----------
+    range_days : tuple
+        Date ranges to warm up, see `get_warmup_date_ranges`. Default
+        is `WARMUP_RANGE_DAYS`.
+
+    Returns
+    -------
+    num_figures : int
+        Number of figures rendered or already cached.
+    """
+
+    start_time = time.time()
+    num_figures = 0
+
+    for start_date, end_date in get_warmup_date_ranges(range_days):
+        for metric_freq in WARMUP_FREQS:
+
+            render_engagement_figure(
+                metric_freq = metric_freq,
+                start_date = start_date,
+                end_date = end_date,
+                user_countries = COUNTRIES,
+                user_sources = UTM_SOURCES,
+                user_activity = EVENT_TYPES
+            )
+            num_figures += 1
+
+            for retention_type in WARMUP_RETENTION_TYPES:
+                render_retention_figure(
+                    metric_freq = metric_freq,
+                    retention_type = retention_type,
+                    start_date = start_date,
+                    end_date = end_date,
+                    user_countries = COUNTRIES,
+                    user_sources = UTM_SOURCES,
+                    user_activity = EVENT_TYPES
+                )
+                num_figures += 1
+
+    logger.info(f'Warmed up {num_figures} figures in {time.time() - start_time:.2f}s.')
+
+    return num_figures
+
+def parse_args():
+
+    """Parses warm-up command line arguments."""
+
+    parser = argparse.ArgumentParser(description = 'Warm up the dashboard figure cache.')
+    parser.add_argument(
+        '--range-days',
+        type = int,
+        nargs = '+',
+        default = None,
+        help = 'Warm up date ranges starting this many days before the latest event, in addition to the full date range.'
+    )
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+
+    setup_logging()
+    args = parse_args()
+
+    warm_up(
+        range_days = WARMUP_RANGE_DAYS if args.range_days is None else (*args.range_days, None)
+    )